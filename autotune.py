@@ -0,0 +1,174 @@
+''' @file                       autotune.py
+    @brief                      PID gains from a relay-feedback experiment or a plant model, kept in flash.
+    @details                    A RelayTuner runs the Astrom-Hagglund experiment on the position loop: the
+                                duty is switched between +relay and -relay whenever the position error
+                                changes sign, with a little hysteresis, and the loop settles into a limit
+                                cycle. Its amplitude a and period Tu give the ultimate gain
+                                Ku = 4 relay / (pi sqrt(a^2 - hysteresis^2)), from which relay_gains()
+                                computes PID gains with a Ziegler-Nichols style rule. model_gains()
+                                instead places the closed-loop poles of an identified plant,
+                                gain / (s (tau s + 1)), for a target bandwidth and phase margin.
+                                Gains are in the units Task_Controller reads from its gains share:
+                                %duty/count, %duty/(count*s) and %duty*s/count. save_gains() keeps them in
+                                a JSON file on the flash drive, so the next boot starts from them.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import utime, math, json
+from micropython import const
+
+## The file on the flash drive the gains are kept in
+GAINS_FILE = 'gains.json'
+
+## Tuning rule: classic Ziegler-Nichols PID, quick with some overshoot
+RULE_CLASSIC = const(0)
+## Tuning rule: Ziegler-Nichols "no overshoot" PID
+RULE_NO_OVERSHOOT = const(1)
+
+# (Kp / Ku, Ti / Tu, Td / Tu) of each rule
+_RULES = ((0.6, 0.5, 0.125), (0.2, 0.5, 1 / 3))
+
+class RelayTuner:
+    '''     @brief                  The relay-feedback experiment, one position sample at a time.
+        @details                Integer-only while it runs; the limit cycle is measured from the
+                                positions and timestamps between relay switches.
+    '''
+
+    def __init__(self, relay = 30, hysteresis = 4, settle = 2, cycles = 4, timeout = 3000000):
+        '''     @brief              Sets up an experiment; start() begins it.
+            @param relay        The duty, in percent, switched either way.
+            @param hysteresis   The error, in counts, that must be crossed before switching.
+            @param settle       The number of cycles ignored while the oscillation builds.
+            @param cycles       The number of cycles averaged after that.
+            @param timeout      Microseconds without a full cycle after which the experiment fails.
+        '''
+        self.relay = relay
+        self.hysteresis = hysteresis
+        self.settle = settle
+        self.cycles = cycles
+        self.timeout = timeout
+        self.center = 0
+        ## True once the experiment has finished, successfully or not
+        self.done = True
+        ## (amplitude in counts, period in us) of the limit cycle, or None
+        self.result = None
+
+    def start(self, center, timestamp):
+        '''     @brief              Starts the experiment about a position.
+            @param center       The position, in counts, the loop oscillates about.
+            @param timestamp    The utime.ticks_us() time of the present sample.
+        '''
+        self.center = center
+        self.done = False
+        self.result = None
+        ## The duty being applied
+        self.output = self.relay
+        self._count = 0
+        self._cycleStart = timestamp
+        self._high = center
+        self._low = center
+        self._peakSum = 0
+        self._periodSum = 0
+
+    def step(self, position, timestamp):
+        '''     @brief              Takes one sample and returns the duty to apply.
+            @param position     The measured position in counts.
+            @param timestamp    The utime.ticks_us() time of the sample.
+            @return             The duty in percent; 0 once done.
+        '''
+        if (self.done):
+            return 0
+        if (position > self._high):
+            self._high = position
+        if (position < self._low):
+            self._low = position
+
+        error = self.center - position
+        elapsed = utime.ticks_diff(timestamp, self._cycleStart)
+        if (self.output < 0 and error > self.hysteresis):
+            # a cycle ends each time the relay switches back to positive
+            self.output = self.relay
+            if (self._count >= self.settle):
+                self._peakSum += self._high - self._low
+                self._periodSum += elapsed
+            self._count += 1
+            self._cycleStart = timestamp
+            self._high = position
+            self._low = position
+            if (self._count >= self.settle + self.cycles):
+                # the amplitude is half the peak to peak swing
+                self.result = (self._peakSum / (2 * self.cycles), self._periodSum / self.cycles)
+                self.done = True
+                return 0
+        elif (self.output > 0 and error < -self.hysteresis):
+            self.output = -self.relay
+        elif (elapsed > self.timeout):
+            self.done = True
+            return 0
+        return self.output
+
+def relay_gains(relay, amplitude, period, hysteresis = 0, rule = RULE_CLASSIC):
+    '''     @brief                  PID gains from a relay-feedback limit cycle.
+        @param relay            The relay duty in percent.
+        @param amplitude        The amplitude of the oscillation in counts.
+        @param period           The period of the oscillation in seconds.
+        @param hysteresis       The relay hysteresis in counts.
+        @param rule             RULE_CLASSIC or RULE_NO_OVERSHOOT.
+        @return                 A (Kp, Ki, Kd) tuple.
+    '''
+    if (amplitude <= hysteresis or period <= 0):
+        raise ValueError('No usable limit cycle')
+    ku = 4 * relay / (math.pi * math.sqrt(amplitude * amplitude - hysteresis * hysteresis))
+    kp, ti, td = _RULES[rule]
+    kp *= ku
+    return (kp, kp / (ti * period), kp * td * period)
+
+def model_gains(gain, tau, bandwidth, margin = 60):
+    '''     @brief                  PID gains placing the poles of gain / (s (tau s + 1)).
+        @details                The closed loop gets a real pole at the bandwidth and a pair at the
+                                same frequency with damping margin / 100, the usual approximation of
+                                the phase margin in degrees.
+        @param gain             The plant's speed per duty, in counts/s per percent.
+        @param tau              The plant's time constant in seconds.
+        @param bandwidth        The closed-loop bandwidth in rad/s.
+        @param margin           The phase margin in degrees.
+        @return                 A (Kp, Ki, Kd) tuple.
+    '''
+    if (gain <= 0 or tau <= 0 or bandwidth <= 0):
+        raise ValueError('Plant gain, time constant and bandwidth must be positive')
+    zeta = margin / 100
+    w = bandwidth
+    kp = tau * (1 + 2 * zeta) * w * w / gain
+    ki = tau * w * w * w / gain
+    # a slow target needs less damping than the plant has; never add negative derivative
+    kd = max(0.0, (tau * (1 + 2 * zeta) * w - 1) / gain)
+    return (kp, ki, kd)
+
+def load_gains(name, default = None, path = GAINS_FILE):
+    '''     @brief                  Reads a controller's gains from flash.
+        @param name             The name the gains were saved under, e.g. the controller task ID.
+        @param default          What to return if there are none.
+        @return                 A (Kp, Ki, Kd) tuple, or default.
+    '''
+    try:
+        with open(path) as f:
+            return tuple(json.load(f)[name])
+    except (OSError, ValueError, KeyError, TypeError):
+        return default
+
+def save_gains(name, gains, path = GAINS_FILE):
+    '''     @brief                  Writes a controller's gains to flash, keeping those of the others.
+        @param name             The name to save the gains under.
+        @param gains            A (Kp, Ki, Kd) tuple.
+    '''
+    try:
+        with open(path) as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        table = {}
+    table[name] = list(gains)
+    with open(path, 'w') as f:
+        json.dump(table, f)
@@ -0,0 +1,181 @@
+''' @file                       axis_group.py
+    @brief                      A group of motor/encoder axes that are sampled and actuated together.
+    @details                    An AxisGroup builds a motor_driver.MotorDriver, motor_driver.Motor and
+                                encoder.Encoder for every row of a declarative table of pins and timers,
+                                so adding an axis is one more row rather than a block of hand wiring.
+                                The group is registered with the scheduler as a task of its own. On each
+                                run it first writes every duty cycle staged since the previous run, back to
+                                back, and then reads every encoder counter back to back and gives all of
+                                the samples one shared timestamp. Duties set by any task during a period are
+                                therefore applied together at the start of the next one (one slew step at
+                                a time if the motors are slew limited), and every axis is sampled at the
+                                same instant, so skew between axes no longer depends on the order in which
+                                separate tasks happen to run.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import pyb, utime, micropython, motor_driver, encoder, encoder_sampler, command_bus
+from array import array
+
+class AxisGroup:
+    '''     @brief                  Owns N encoder/motor pairs described by a table.
+        @details                Each row of the table is a dict with the keys:
+                                name          a letter such as 'A', used for the IDs and axis mask
+                                enable        the cpu pin name of the L6206 enable pin, e.g. 'A10'
+                                in1, in2      the cpu pin names of the two motor inputs
+                                pwmTimer      the number of the PWM timer driving the inputs
+                                pwmChannels   the (in1, in2) channels of that timer
+                                encA, encB    the cpu pin names of the encoder channels
+                                encTimer      the number of the timer counting the encoder
+                                fault         optional; the cpu pin name of the L6206 fault line, which
+                                              may be the enable pin itself
+                                slew          optional; overrides the group's duty slew limit
+                                capPin, capTimer, capChannel
+                                              optional; a second pin wired to encoder channel A and the
+                                              timer and channel that time its edges by input capture, for
+                                              low-speed velocity (see Encoder.attach_capture())
+                                Axes that share a PWM timer share one pyb.Timer object.
+    '''
+
+    def __init__(self, table, period, pwmFreq = 20000, cpr = 4000, slew = 0):
+        '''     @brief              Builds the hardware objects of every axis in the table.
+            @param table        A sequence of dicts, one per axis, as described above.
+            @param period       The period, in microseconds, between runs of the group.
+            @param pwmFreq      The PWM frequency of the motor timers, in Hz.
+            @param cpr          Encoder counts per shaft revolution.
+            @param slew         The largest change of each motor's duty per run, in percent,
+                                or 0 for no limit.
+        '''
+        ## The period (in us) between batch updates
+        self.period = period
+        ## The name shown by the scheduler report
+        self.taskID = 'AXIS GROUP'
+        self.names = []
+        ## The command_bus axis bit of each axis, in table order
+        self.axes = []
+        self.drivers = []
+        self.motors = []
+        self.encoders = []
+
+        pwmTimers = {}
+        for index in range(len(table)):
+            row = table[index]
+            name = row['name']
+            timNum = row['pwmTimer']
+            if (timNum not in pwmTimers):
+                pwmTimers[timNum] = pyb.Timer(timNum, freq = pwmFreq)
+            timer = pwmTimers[timNum]
+
+            enable = pyb.Pin(getattr(pyb.Pin.cpu, row['enable']), pyb.Pin.OUT_PP)
+            in1 = getattr(pyb.Pin.cpu, row['in1'])
+            in2 = getattr(pyb.Pin.cpu, row['in2'])
+            channel1, channel2 = row['pwmChannels']
+            fault = row.get('fault')
+            if (fault is not None):
+                fault = getattr(pyb.Pin.cpu, fault)
+            driver = motor_driver.MotorDriver(enable, in1, in2, timer, fault)
+            motor = driver.motor(in1, in2, channel1, channel2, 'MOTOR {:}'.format(name))
+            # duty cycles are written by the group, all at once
+            motor.deferred = True
+            motor.set_slew(row.get('slew', slew))
+
+            enc = encoder.Encoder(getattr(pyb.Pin.cpu, row['encA']), getattr(pyb.Pin.cpu, row['encB']),
+                                  row['encTimer'], ID = 'ENCODER {:}'.format(name), cpr = cpr)
+            if ('capPin' in row):
+                enc.attach_capture(row['capTimer'], row['capChannel'], getattr(pyb.Pin.cpu, row['capPin']))
+
+            driver.monitor(enc)
+
+            self.names.append(name)
+            self.axes.append(command_bus.AXIS_A << index)
+            self.drivers.append(driver)
+            self.motors.append(motor)
+            self.encoders.append(enc)
+
+        # the counter of each encoder is read into here before any of them is updated
+        self._counts = array('l', [0] * len(self.encoders))
+        ## An encoder_sampler.EncoderSampler sampling the group from an interrupt, if started
+        self.sampler = None
+
+    def __len__(self):
+        return len(self.encoders)
+
+    def start_sampler(self, timNum, freq, size = 64):
+        '''     @brief              Samples every encoder of the group from a timer interrupt instead.
+            @details            After this, update() hands the interrupt's samples to the encoders
+                                rather than reading the counters itself.
+            @param timNum       The number of a free timer to drive the sampling interrupt.
+            @param freq         The sampling rate in Hz.
+            @param size         The number of samples the buffer holds.
+        '''
+        self.sampler = encoder_sampler.EncoderSampler(timNum, freq, self.encoders, size)
+        self.sampler.start()
+
+    def run(self):
+        '''     @brief              Applies the staged duty cycles, then updates every encoder.
+            @details            Drivers enabled within the last few milliseconds also check
+                                that their fault line has risen.
+        '''
+        self.apply()
+        self.update()
+        for driver in self.drivers:
+            if (driver.settling):
+                driver.check_fault()
+
+    @micropython.native
+    def update(self):
+        '''     @brief              Updates every encoder from one pass over the counters.
+            @details            The counters are read in a tight loop and stamped with a single
+                                utime.ticks_us() value, then each encoder unwraps its count and
+                                estimates its velocity.
+        '''
+        if (self.sampler is not None):
+            self.sampler.drain()
+            return
+        counts = self._counts
+        encoders = self.encoders
+        n = len(encoders)
+        for i in range(n):
+            counts[i] = encoders[i].encoderTimer.counter()
+        now = utime.ticks_us()
+        for i in range(n):
+            encoders[i].update_count(counts[i], now)
+
+    @micropython.native
+    def apply(self):
+        '''     @brief              Writes every staged duty cycle to the timers, back to back.
+            @details            Each motor first takes one slew step toward its commanded duty;
+                                only then are the compare registers written, skipping those
+                                that already hold their value.
+        '''
+        motors = self.motors
+        for motor in motors:
+            motor.tick()
+        for motor in motors:
+            motor.write()
+
+    def zero(self):
+        '''     @brief              Zeroes the position of every encoder.
+        '''
+        for enc in self.encoders:
+            enc.zero()
+
+    def enable(self):
+        '''     @brief              Enables every motor driver.
+        '''
+        for driver in self.drivers:
+            driver.enable()
+
+    def stop(self):
+        '''     @brief              Brakes every motor immediately, without waiting for the next run.
+        '''
+        for motor in self.motors:
+            motor.set_duty(0)
+            # braking is not slew limited
+            motor.stage(0)
+            motor.pending = False
+        for motor in self.motors:
+            motor.write()
@@ -0,0 +1,172 @@
+''' @file                       bench_hotpaths.py
+    @brief                      Times the native and viper hot paths against plain bytecode.
+    @details                    Run it on the board with "import bench_hotpaths; bench_hotpaths.run()". It
+                                also runs on the host with the sim installed, but there the emitter
+                                decorators do nothing and time is virtual, so only the board's numbers
+                                mean anything. Each hot path is timed against a bytecode copy of the same
+                                logic kept in this file, on the same objects and inputs, and the loop
+                                overhead is measured once and subtracted. Results are in microseconds
+                                per call.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import pyb, utime, shares, encoder, encoder_sampler, task_controller
+from array import array
+
+## Calls per timing run
+CALLS = 2000
+
+class _NullMotor:
+    # the controller only calls set_duty() when the duty changes
+    def set_duty(self, duty):
+        pass
+
+def _update_count(enc, current_count, timestamp):
+    # Encoder.update_count() and the EST_DIFF path of Encoder._advance() in bytecode
+    delta = current_count - enc.prev_count
+    if (delta >= enc.halfPeriod):
+        delta -= enc.period
+    elif (delta <= -enc.halfPeriod):
+        delta += enc.period
+    enc.delta = delta
+    enc.prev_count = current_count
+    enc.position += delta
+    enc.dt = utime.ticks_diff(timestamp, enc.timestamp)
+    enc.timestamp = timestamp
+    if (enc.dt <= 0):
+        enc.velocity = 0
+    elif (delta < 0):
+        enc.velocity = -((-delta * 1000000) // enc.dt)
+    else:
+        enc.velocity = (delta * 1000000) // enc.dt
+
+def _unwrap(counts, prev, accum, raw, base, n, store):
+    # encoder_sampler._unwrap() in bytecode
+    for i in range(n):
+        delta = counts[i] - prev[i]
+        if (delta >= 32768):
+            delta -= 65536
+        elif (delta < -32768):
+            delta += 65536
+        prev[i] = counts[i]
+        accum[i] = accum[i] + delta
+        if (store):
+            raw[base + i] = accum[i]
+
+def _step(ctl, setpoint, position):
+    # Task_Controller.step() in bytecode
+    L = task_controller.ERROR_LIMIT
+    T = task_controller.TERM_LIMIT
+    error = setpoint - position
+    if (error > L):
+        error = L
+    elif (error < -L):
+        error = -L
+    motion = position - ctl.prevPosition
+    ctl.prevPosition = position
+    if (motion > L):
+        motion = L
+    elif (motion < -L):
+        motion = -L
+    p = ctl.kp * error
+    if (p > T):
+        p = T
+    elif (p < -T):
+        p = -T
+    d = -ctl.kd * motion
+    if (d > T):
+        d = T
+    elif (d < -T):
+        d = -T
+    E = task_controller.INT_ERROR_LIMIT
+    if (error > E):
+        integral = ctl.integral + ctl.ki * E
+    elif (error < -E):
+        integral = ctl.integral - ctl.ki * E
+    else:
+        integral = ctl.integral + ctl.ki * error
+    I = task_controller.INT_LIMIT
+    if (integral > I):
+        integral = I
+    elif (integral < -I):
+        integral = -I
+    D = task_controller.DUTY_LIMIT
+    duty = (p + d + (integral >> task_controller.INT_SHIFT)) >> task_controller.GAIN_SHIFT
+    if (duty > D):
+        duty = D
+    elif (duty < -D):
+        duty = -D
+    if (not ((duty == D and error > 0) or (duty == -D and error < 0))):
+        ctl.integral = integral
+    if (duty != ctl.effort):
+        ctl.motor.set_duty(duty)
+    return duty
+
+def _put(queue, item):
+    # shares.Queue.put() with OVF_DROP_OLDEST in bytecode
+    if (queue._count >= queue._size):
+        queue._head += 1
+        if (queue._head >= queue._size):
+            queue._head = 0
+        queue._count -= 1
+        queue._dropped += 1
+    queue._buffer[queue._tail] = item
+    queue._tail += 1
+    if (queue._tail >= queue._size):
+        queue._tail = 0
+    queue._count += 1
+    if (queue._count > queue._max_count):
+        queue._max_count = queue._count
+    return True
+
+def _time(call, calls):
+    # microseconds for calls calls of call(k), where k counts up from 0
+    start = utime.ticks_us()
+    for k in range(calls):
+        call(k)
+    return utime.ticks_diff(utime.ticks_us(), start)
+
+def _report(name, fast, slow, calls, overhead):
+    fast = max(fast - overhead, 1)
+    slow = max(slow - overhead, 1)
+    print('{:<22} {:>8.2f} {:>8.2f} {:>7.2f}x'.format(name, slow / calls, fast / calls, slow / fast))
+
+def run(calls = CALLS):
+    '''     @brief                  Times every hot path and prints a table of the results.
+        @param calls            The number of calls timed for each path.
+    '''
+    enc = encoder.Encoder(pyb.Pin.cpu.B6, pyb.Pin.cpu.B7, 4, ID = 'BENCH')
+    ctl = task_controller.Task_Controller('BENCH', 1000, enc, _NullMotor(), shares.Share(), shares.Share())
+    ctl.set_gains((0.05, 0.2, 0.0005))
+    queue = shares.Queue(64, 'l')
+
+    n = 4
+    counts = array('l', [0] * n)
+    prev = array('l', [0] * n)
+    accum = array('l', [0] * n)
+    raw = array('l', [0] * (64 * n))
+
+    overhead = _time(lambda k: None, calls)
+
+    print('{:<22} {:>8} {:>8} {:>8}'.format('us per call', 'bytecode', 'compiled', 'speedup'))
+    slow = _time(lambda k: _update_count(enc, (k * 37) & 0xFFFF, k * 1000), calls)
+    fast = _time(lambda k: enc.update_count((k * 37) & 0xFFFF, k * 1000), calls)
+    _report('Encoder.update_count', fast, slow, calls, overhead)
+
+    slow = _time(lambda k: _unwrap(counts, prev, accum, raw, (k & 63) * n, n, 1), calls)
+    fast = _time(lambda k: encoder_sampler._unwrap(counts, prev, accum, raw, (k & 63) * n, n, 1), calls)
+    _report('unwrap, {:} encoders'.format(n), fast, slow, calls, overhead)
+
+    slow = _time(lambda k: _step(ctl, 1000, k & 1023), calls)
+    fast = _time(lambda k: ctl.step(1000, k & 1023), calls)
+    _report('Task_Controller.step', fast, slow, calls, overhead)
+
+    slow = _time(lambda k: _put(queue, k), calls)
+    fast = _time(lambda k: queue.put(k), calls)
+    _report('Queue.put', fast, slow, calls, overhead)
+
+if __name__ == '__main__':
+    run()
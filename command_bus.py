@@ -0,0 +1,169 @@
+''' @file                       command_bus.py
+    @brief                      Publish/subscribe command bus with per-task inboxes.
+    @details                    Commands are small typed messages: a command code from the list below and
+                                an optional integer value. Each command is published on a topic and
+                                addressed to a mask of axes, so one publish can reach a single axis, several
+                                or all of them without a separate action code per axis. Every subscribing
+                                task owns a preallocated Inbox; publish() copies the command into the inbox
+                                of each subscriber whose axis is in the mask, so adding axes never changes
+                                the cost of receiving a command. An Inbox flags its waiters on every put,
+                                exactly like shares.Share, so event-driven tasks can be woken by the
+                                scheduler when a command arrives.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+from array import array
+from micropython import const
+
+## Axis masks; a command is delivered to every subscriber whose axis bit is set
+AXIS_A = const(0x01)
+AXIS_B = const(0x02)
+AXIS_ALL = const(0xFF)
+
+## Topics
+TOPIC_ENCODER = const(0)
+TOPIC_MOTOR = const(1)
+TOPIC_DRIVER = const(2)
+TOPIC_CONTROLLER = const(3)
+TOPIC_SYSID = const(4)
+NUM_TOPICS = const(5)
+
+## Encoder commands
+ENC_ZERO = const(1)
+ENC_SHOW_POSITION = const(2)
+ENC_SHOW_VELOCITY = const(3)
+ENC_CAPTURE_START = const(4)
+ENC_CAPTURE_STOP = const(5)
+
+## Motor commands; MOT_SET_DUTY carries the duty in percent as its value
+MOT_DUTY_ENTRY = const(10)
+MOT_SET_DUTY = const(11)
+
+## Motor driver commands
+DRV_TOGGLE_ENABLE = const(20)
+DRV_CLEAR_FAULT = const(21)
+
+## Controller commands; CTL_MOVE carries the signed move length in degrees as its value
+CTL_MOVE = const(30)
+CTL_RELEASE = const(31)
+## CTL_AUTOTUNE carries the relay duty in percent, or 0 for the controller's last one
+CTL_AUTOTUNE = const(32)
+
+## System identification commands
+SID_START = const(40)
+SID_STOP = const(41)
+
+## One more than the largest command code, for tables indexed by command
+NUM_COMMANDS = const(42)
+
+class Inbox:
+    '''     @brief                  A fixed-capacity FIFO of commands for one subscriber.
+        @details                Commands and values are kept in preallocated arrays. get() returns
+                                the command code and leaves its value in the value attribute, so
+                                receiving a command allocates nothing.
+    '''
+
+    def __init__(self, size = 8):
+        '''     @brief              Constructs an empty inbox.
+            @param size         The most commands the inbox holds; further commands are dropped.
+        '''
+        self._cmds = array('B', [0] * size)
+        self._values = array('l', [0] * size)
+        self._size = size
+        self._head = 0
+        self._tail = 0
+        self._count = 0
+        self._waiters = []
+        ## The value of the command most recently returned by get()
+        self.value = 0
+        ## The number of commands dropped because the inbox was full
+        self.dropped = 0
+
+    def put(self, cmd, value = 0):
+        '''     @brief              Appends a command and wakes any waiters.
+            @param cmd          The command code.
+            @param value        The integer value carried by the command.
+            @return             True if the command was stored, False if the inbox was full.
+        '''
+        if (self._count >= self._size):
+            self.dropped += 1
+            return False
+        self._cmds[self._tail] = cmd
+        self._values[self._tail] = value
+        self._tail += 1
+        if (self._tail >= self._size):
+            self._tail = 0
+        self._count += 1
+        for waiter in self._waiters:
+            waiter.ready = True
+        return True
+
+    def get(self):
+        '''     @brief              Removes the oldest command.
+            @return             The command code; its value is left in the value attribute.
+        '''
+        if (self._count == 0):
+            raise IndexError('Inbox empty')
+        cmd = self._cmds[self._head]
+        self.value = self._values[self._head]
+        self._head += 1
+        if (self._head >= self._size):
+            self._head = 0
+        self._count -= 1
+        return cmd
+
+    def any(self):
+        '''     @brief              Checks for waiting commands.
+            @return             True if get() has a command to return.
+        '''
+        return self._count > 0
+
+    def num_in(self):
+        '''     @brief              Returns the number of waiting commands.
+        '''
+        return self._count
+
+    def add_waiter(self, waiter):
+        '''     @brief              Registers an object whose ready attribute is set on every put().
+            @param waiter       Normally a scheduler.ScheduledTask.
+        '''
+        if (waiter not in self._waiters):
+            self._waiters.append(waiter)
+
+class CommandBus:
+    '''     @brief                  Routes published commands to subscriber inboxes.
+    '''
+
+    def __init__(self):
+        '''     @brief              Constructs a bus with no subscribers.
+        '''
+        ## For each topic, a list of (axis mask, inbox) pairs
+        self._subscribers = [[] for topic in range(NUM_TOPICS)]
+
+    def subscribe(self, topic, axis, inbox):
+        '''     @brief              Delivers commands on a topic for an axis to an inbox.
+            @param topic        One of the TOPIC_ constants.
+            @param axis         The axis bit (or bits) the subscriber serves, e.g. AXIS_A.
+            @param inbox        The subscriber's Inbox.
+        '''
+        if (topic < 0 or topic >= NUM_TOPICS):
+            raise ValueError('Invalid topic {:}'.format(topic))
+        self._subscribers[topic].append((axis, inbox))
+
+    def publish(self, topic, cmd, axes = AXIS_ALL, value = 0):
+        '''     @brief              Sends a command to every subscriber of a topic on the given axes.
+            @param topic        One of the TOPIC_ constants.
+            @param cmd          The command code.
+            @param axes         A mask of the axes the command is for.
+            @param value        The integer value carried by the command.
+            @return             The number of inboxes the command was delivered to.
+        '''
+        delivered = 0
+        for axis, inbox in self._subscribers[topic]:
+            if (axis & axes):
+                if (inbox.put(cmd, value)):
+                    delivered += 1
+        return delivered
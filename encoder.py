@@ -2,27 +2,61 @@
     @brief                      A hardware driver for reading from quadrature encoders
     @details                    Includes an Encoder class that contains an init, update, zero, read, set_position, get_delta, and get_encoder_ID.
                                 The init function instantiates the necessary pins, timers, and useful encoder values for the quadrature encoders.
+                                Every update() is timestamped with utime.ticks_us() and the shaft velocity is estimated
+                                once per update with one of four selectable estimators, so consumers can read it with
+                                get_velocity() or get_rad_per_s() without redoing the math. Updates run on
+                                small ints only, and radians are returned in fixed.FRAC_BITS fixed point, so
+                                nothing here allocates. The per-sample methods are compiled to machine code
+                                with @micropython.native. With attach_capture(), a second timer channel in
+                                input-capture mode latches the time of every rising edge of channel A, and
+                                EST_CAPTURE computes the velocity from the edge period at low speed, where a
+                                sample holds at most a count or two.
     @author                     Jason Davis
     @author                     Conor Fraser
     @author                     Adam Westfall
 
     @date                       January 24, 2023
 '''
-import pyb
+import pyb, utime, fixed, micropython
 import time
+from array import array
+from micropython import const
+
+## Velocity estimator: counts over the measured time between the last two updates
+EST_DIFF = const(0)
+## Velocity estimator: counts over time summed across the last few updates
+EST_WINDOW = const(1)
+## Velocity estimator: time between count changes, for low speeds
+EST_PERIOD = const(2)
+## Velocity estimator: edge period from an input-capture timer, blended into count differencing at speed
+EST_CAPTURE = const(3)
+## The age, in microseconds, beyond which EST_PERIOD stops aging its last count change
+EDGE_AGE_LIMIT = const(1 << 28)
+
+## The rate, in Hz, of the input-capture timer; each capture tick is a microsecond
+CAPTURE_FREQ = const(1000000)
+## The input-capture timer counts from 0 to this; a 32-bit timer kept to the small-int range
+CAPTURE_MASK = const(0x3FFFFFFF)
+## Encoder counts between two rising edges of channel A
+COUNTS_PER_EDGE = const(4)
 
 class Encoder():
     '''     @brief                  Interface with quadrature encoders.
         @details                Includes the init, update, zero, read, set_position, get_delta, and get_encoder_ID functions.
     '''
     
-    def __init__(self, pinA, pinB, timNum, ID = None):
+    def __init__(self, pinA, pinB, timNum, ID = None, cpr = 4000, estimator = EST_DIFF, window = 8, timeout = 100000):
         '''     @brief              Interface with quadrature encoders.
             @details            Initialize the encoder hardware with two GPIO pins, a timer, and an optional ID.
             @param pinA         Initialize pinA for the encoder.
             @param pinB         Initialize pinB for the encoder.  
             @param timNum       Initalize a timer for use by the encoder.
             @param ID           Used to set an ID to the encoder.
+            @param cpr          Encoder counts per shaft revolution, used for radians.
+            @param estimator    The velocity estimator: EST_DIFF, EST_WINDOW or EST_PERIOD;
+                                EST_CAPTURE is selected by attach_capture().
+            @param window       The number of updates averaged by EST_WINDOW.
+            @param timeout      Microseconds without a count change after which EST_PERIOD reports zero.
         '''
         self.pinA = pinA
         self.pinB = pinB
@@ -30,6 +64,7 @@ class Encoder():
         self.position = 0     
         self.delta = 0
         self.period = 65535 + 1
+        self.halfPeriod = self.period >> 1
         
         # Optional parameter to assign an ID to the hardware
         # Useful for debugging 
@@ -44,23 +79,267 @@ class Encoder():
         
         self.prev_count = self.encoderTimer.counter()
         
+        # velocity estimation
+        self.cpr = cpr
+        ## Converts counts, or counts/s, to Q16.16 radians, or radians/s
+        self.toRadians = fixed.radians(cpr)
+        ## The input-capture channel timing the edges of channel A, or None
+        self.captureChannel = None
+        self.set_estimator(estimator, window, timeout)
+        
+        ## The utime.ticks_us() value of the most recent update
+        self.timestamp = utime.ticks_us()
+        ## Microseconds between the two most recent updates
+        self.dt = 0
+        ## The estimated velocity in counts per second
+        self.velocity = 0
+        ## The last unwrapped count passed to update_sample()
+        self.sampledRaw = 0
+        
+    def attach_capture(self, timNum, channel, pin, low = 1000, high = 4000, timeout = 100000):
+        '''     @brief              Times the edges of channel A with a second timer and selects EST_CAPTURE.
+            @details            Channel A must also be wired to pin, which must be a channel of timer
+                                timNum; a 32-bit timer such as 2 or 5 is expected. The timer is set to
+                                count microseconds and latches its count on every rising edge of A. The
+                                interrupt that follows stores the latched time and the encoder count and
+                                allocates nothing. Below low counts/s the velocity is the count change
+                                between the last two edges over their latched times; above high it is
+                                the count difference of the update, and in between the two are blended
+                                linearly. Above high the edge interrupt is switched off, so fast motion
+                                costs no interrupt load.
+            @param timNum       The number of the timer doing the input capture.
+            @param channel      The channel of that timer on pin.
+            @param pin          A pyb.Pin carrying channel A.
+            @param low          The speed, in counts/s, below which the edge period is used alone.
+            @param high         The speed, in counts/s, above which count differencing is used alone.
+            @param timeout      Microseconds without an edge after which the velocity is zero.
+        '''
+        if (low < 0 or high <= low):
+            raise ValueError('Capture blend speeds must satisfy 0 <= low < high')
+        self.captureTimer = pyb.Timer(timNum, prescaler = 0, period = CAPTURE_MASK)
+        self.captureTimer.prescaler(self.captureTimer.source_freq() // CAPTURE_FREQ - 1)
+        self.captureChannel = self.captureTimer.channel(channel, pyb.Timer.IC, pin = pin,
+                                                        polarity = pyb.Timer.RISING)
+        self.blendLow = low
+        self.blendHigh = high
+        # bound once, so switching the interrupt on and off does not allocate
+        self._edgeCallback = self._edge
+        self.set_estimator(EST_CAPTURE, timeout = timeout)
+        
+    def set_estimator(self, estimator, window = 8, timeout = 100000):
+        '''     @brief              Selects the velocity estimator.
+            @details            EST_DIFF divides the latest delta by the measured time since the previous
+                                update. EST_WINDOW divides the counts seen over the last window updates by
+                                the time they spanned, which smooths quantization at moderate speed.
+                                EST_PERIOD measures the time between updates in which the count changed,
+                                which resolves speeds well below one count per update. EST_CAPTURE times
+                                the edges in hardware instead; see attach_capture().
+            @param estimator    EST_DIFF, EST_WINDOW, EST_PERIOD or EST_CAPTURE.
+            @param window       The number of updates averaged by EST_WINDOW.
+            @param timeout      Microseconds without a count change after which EST_PERIOD and
+                                EST_CAPTURE report zero.
+        '''
+        if (estimator not in (EST_DIFF, EST_WINDOW, EST_PERIOD, EST_CAPTURE)):
+            raise ValueError('Invalid velocity estimator {:}'.format(estimator))
+        if (estimator == EST_CAPTURE and self.captureChannel is None):
+            raise ValueError('EST_CAPTURE needs attach_capture() first')
+        if (window < 1):
+            raise ValueError('Velocity window must be at least 1')
+        self.estimator = estimator
+        self.timeout = timeout
+        
+        # moving window of (delta, dt) pairs with running sums
+        self._winDeltas = array('l', [0] * window)
+        self._winTimes = array('l', [0] * window)
+        self._winIndex = 0
+        self._winCounts = 0
+        self._winTime = 0
+        
+        # period estimator state
+        self._edgeTime = utime.ticks_us()
+        self._edgeSign = 0
+        
+        # input-capture state; the interrupt writes the _cap fields and counts edges,
+        # the update reads them and remembers how many edges it has seen
+        self._capEdges = 0
+        self._capSeen = 0
+        self._capStamp = 0
+        self._capCount = 0
+        self._capPeriod = 0
+        self._capCounts = 0
+        self._capVelocity = 0
+        self._captureOn = False
+        if (self.captureChannel is not None):
+            self._capture_irq(estimator == EST_CAPTURE)
+        
+    def _capture_irq(self, on):
+        # the edge count restarts so the first edge after switching on, whose period
+        # spans the time the interrupt was off, is not used
+        self.captureChannel.callback(None)
+        self._captureOn = on
+        if (on):
+            self._capEdges = 0
+            self._capSeen = 0
+            self.captureChannel.callback(self._edgeCallback)
+        
+    @micropython.native
+    def _edge(self, timer):
+        '''     @brief              The input-capture interrupt: records one rising edge of channel A.
+        '''
+        stamp = self.captureChannel.capture()
+        count = self.encoderTimer.counter()
+        counts = count - self._capCount
+        if (counts >= self.halfPeriod):
+            counts -= self.period
+        elif (counts <= -self.halfPeriod):
+            counts += self.period
+        self._capPeriod = (stamp - self._capStamp) & CAPTURE_MASK
+        self._capCounts = counts
+        self._capStamp = stamp
+        self._capCount = count
+        self._capEdges += 1
+        
     def update(self):
         '''     @brief              Updates encoder position and angular velocity.
             @details            Utilizes the period of the encoder, the delta between the last read value 
                                 and count of the encoder to handle overflow and underflow errors.
         '''
-        current_count = self.encoderTimer.counter()
+        self.update_count(self.encoderTimer.counter(), utime.ticks_us())
+        
+    @micropython.native
+    def update_count(self, current_count, timestamp):
+        '''     @brief              Updates encoder position and angular velocity from a counter value read elsewhere.
+            @details            Used by axis_group.AxisGroup, which reads the counters of all its encoders back
+                                to back and timestamps them together. Handles overflow like update().
+            @param current_count The value of the encoder timer's counter.
+            @param timestamp    The utime.ticks_us() value at which it was read.
+        '''
         self.delta = current_count - self.prev_count
         
         # This logic handles counter overflow
-        if (self.delta >= self.period/2):
+        if (self.delta >= self.halfPeriod):
             self.delta -= self.period
-        if self.delta <= (-1 * self.period/2):
+        elif (self.delta <= -self.halfPeriod):
             self.delta += self.period
             
         self.prev_count = current_count
-        self.position += self.delta
+        self._advance(self.delta, timestamp)
+        
+    @micropython.native
+    def update_sample(self, raw, timestamp):
+        '''     @brief              Updates encoder position and angular velocity from a sample taken elsewhere.
+            @details            Used with encoder_sampler.EncoderSampler, whose timer interrupt reads the
+                                counter, unwraps it and timestamps it. raw is that unwrapped count, so a
+                                delayed call cannot alias a counter overflow. Do not mix update() and
+                                update_sample() on the same encoder.
+            @param raw          The unwrapped counter value, starting from zero when sampling began.
+            @param timestamp    The utime.ticks_us() value at which raw was read.
+        '''
+        self.delta = raw - self.sampledRaw
+        self.sampledRaw = raw
+        self._advance(self.delta, timestamp)
+        
+    @micropython.native
+    def _advance(self, delta, now):
+        '''     @brief              Applies a new delta and updates the velocity estimate.
+            @param delta        Counts moved since the previous sample.
+            @param now          The utime.ticks_us() time of the new sample.
+        '''
+        self.position += delta
+        self.dt = utime.ticks_diff(now, self.timestamp)
+        self.timestamp = now
         
+        if (self.estimator == EST_DIFF):
+            self.velocity = self._rate(delta, self.dt)
+            
+        elif (self.estimator == EST_WINDOW):
+            i = self._winIndex
+            self._winCounts += delta - self._winDeltas[i]
+            self._winTime += self.dt - self._winTimes[i]
+            self._winDeltas[i] = delta
+            self._winTimes[i] = self.dt
+            i += 1
+            self._winIndex = 0 if i >= len(self._winDeltas) else i
+            self.velocity = self._rate(self._winCounts, self._winTime)
+            
+        elif (self.estimator == EST_CAPTURE):
+            self.velocity = self._blend(self._rate(delta, self.dt))
+            
+        else:
+            elapsed = utime.ticks_diff(now, self._edgeTime)
+            if (delta != 0):
+                self.velocity = self._rate(delta, elapsed)
+                self._edgeTime = now
+                self._edgeSign = 1 if delta > 0 else -1
+            elif (elapsed >= self.timeout):
+                self.velocity = 0
+                if (elapsed >= EDGE_AGE_LIMIT):
+                    # a stop longer than ticks_diff() can measure would wrap into a false speed
+                    self._edgeTime = utime.ticks_add(now, -EDGE_AGE_LIMIT)
+            else:
+                # no new count yet: the speed can be at most one count over the time waited so far
+                bound = self._rate(1, elapsed)
+                if (abs(self.velocity) > bound):
+                    self.velocity = bound * self._edgeSign
+        
+    @micropython.native
+    def _blend(self, diff):
+        '''     @brief              The EST_CAPTURE velocity from the edges seen so far and a count difference.
+            @param diff         The velocity, in counts/s, from count differencing.
+            @return             The blended velocity in counts/s.
+        '''
+        speed = diff if diff >= 0 else -diff
+        if (self._captureOn):
+            if (speed > 2 * self.blendHigh):
+                # fast enough that the edges are not needed; stop interrupting on them
+                self._capture_irq(False)
+        elif (speed < self.blendHigh):
+            self._capture_irq(True)
+        if (speed >= self.blendHigh or not self._captureOn):
+            return diff
+        
+        edges = self._capEdges
+        if (edges < 2):
+            # no edge period measured since the interrupt was switched on
+            return diff
+        if (edges != self._capSeen):
+            # read the pair the interrupt wrote for this edge together
+            period = self._capPeriod
+            counts = self._capCounts
+            if (edges == self._capEdges):
+                self._capSeen = edges
+                self._capVelocity = self._rate(counts, period)
+        else:
+            age = (self.captureTimer.counter() - self._capStamp) & CAPTURE_MASK
+            if (age >= self.timeout):
+                self._capVelocity = 0
+            else:
+                # no new edge yet: the speed is at most one edge period over the time waited
+                bound = self._rate(COUNTS_PER_EDGE, age)
+                if (self._capVelocity > bound):
+                    self._capVelocity = bound
+                elif (self._capVelocity < -bound):
+                    self._capVelocity = -bound
+        
+        capture = self._capVelocity
+        if (speed <= self.blendLow):
+            return capture
+        return capture + (diff - capture) * (speed - self.blendLow) // (self.blendHigh - self.blendLow)
+        
+    @micropython.native
+    def _rate(self, counts, dt):
+        '''     @brief              Integer counts per second, rounded toward zero.
+            @param counts       Signed number of counts.
+            @param dt           Time in microseconds over which they were counted.
+            @return             counts / dt in counts per second, or 0 if dt is not positive.
+        '''
+        if (dt <= 0):
+            return 0
+        if (counts < 0):
+            return -((-counts * 1000000) // dt)
+        return (counts * 1000000) // dt
+        
+
     def zero(self):
         '''     @brief              Resets encoder position to zero.
             @details                Resets encoder position to zero.
@@ -74,6 +353,12 @@ class Encoder():
         '''
         return self.position
     
+    def get_radians(self):
+        '''     @brief              Returns encoder position in radians.
+            @return                 The position of the encoder shaft in Q16.16 fixed point.
+        '''
+        return self.toRadians.apply(self.position)
+    
     
     def set_position(self, position):
         '''     @brief              Updates encoder position.
@@ -89,6 +374,27 @@ class Encoder():
         '''
         return self.delta
         
+    def get_velocity(self):
+        '''     @brief              Returns encoder shaft velocity in counts per second.
+            @details                Estimated in update() with the selected estimator.
+            @return                 The shaft velocity in counts per second.
+        '''
+        return self.velocity
+        
+    def get_rad_per_s(self):
+        '''     @brief              Returns encoder shaft velocity in radians per second.
+            @details                Converts get_velocity() with the counts per revolution of the encoder.
+            @return                 The shaft velocity in radians per second, in Q16.16 fixed point.
+        '''
+        return self.toRadians.apply(self.velocity)
+        
+    def get_timestamp(self):
+        '''     @brief              Returns the time of the most recent update.
+            @details                Returns the time of the most recent update.
+            @return                 The utime.ticks_us() value captured in update().
+        '''
+        return self.timestamp
+        
     def get_encoder_ID(self):
         '''     @brief              Returns encoder ID.
             @details                Returns encoder ID.
@@ -0,0 +1,156 @@
+''' @file                       encoder_sampler.py
+    @brief                      Timer-interrupt sampling of one or more encoders at a fixed rate.
+    @details                    An EncoderSampler owns a pyb.Timer whose callback reads the counter of every
+                                attached Encoder, unwraps it and stores it with a utime.ticks_us() timestamp
+                                in a preallocated single-producer/single-consumer ring buffer. The callback
+                                allocates nothing, so it is safe as a hard IRQ. Tasks call drain() to hand
+                                the samples to Encoder.update_sample(), which estimates velocity from the
+                                interrupt's timestamps rather than from when the task happened to run.
+                                Because the interrupt unwraps the counter itself, a late drain() never
+                                aliases an overflow; if the buffer fills, new samples are dropped and
+                                counted by overruns() but the unwrapped count stays correct. The
+                                callback is native code, and its unwrapping loop is a viper function
+                                working on machine ints straight out of the arrays.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import pyb, utime, micropython
+from array import array
+
+# room for a traceback if the callback ever raises
+micropython.alloc_emergency_exception_buf(100)
+
+@micropython.viper
+def _unwrap(counts, prev, accum, raw, base: int, n: int, store: int):
+    '''     @brief                  Unwraps n 16 bit counter values into running counts.
+        @param counts           An array('l') of the counter values just read.
+        @param prev             An array('l') of the previous counter values, updated here.
+        @param accum            An array('l') of the running counts, updated here.
+        @param raw              The sample buffer; the running counts go to raw[base:base + n].
+        @param store            0 to update the running counts without storing them.
+    '''
+    c = ptr32(counts)
+    p = ptr32(prev)
+    a = ptr32(accum)
+    r = ptr32(raw)
+    for i in range(n):
+        delta = c[i] - p[i]
+        if (delta >= 32768):
+            delta -= 65536
+        elif (delta < -32768):
+            delta += 65536
+        p[i] = c[i]
+        a[i] = a[i] + delta
+        if (store):
+            r[base + i] = a[i]
+
+class EncoderSampler:
+    '''     @brief                  Samples encoders from a timer interrupt into a lock-free ring buffer.
+        @details                The interrupt is the only writer of _tail and the task is the only writer
+                                of _head, so neither side needs to disable interrupts.
+    '''
+
+    def __init__(self, timNum, freq, encoders, size = 64):
+        '''     @brief              Prepares the buffers; call start() to begin sampling.
+            @param timNum       The number of a free timer to drive the sampling interrupt.
+            @param freq         The sampling rate in Hz.
+            @param encoders     A list of encoder.Encoder objects to sample together.
+            @param size         The number of samples the buffer holds.
+        '''
+        self.timNum = timNum
+        self.freq = freq
+        self.encoders = list(encoders)
+        self.size = size
+        self.timer = None
+
+        n = len(self.encoders)
+        ## Timestamps of the buffered samples
+        self._times = array('l', [0] * size)
+        ## Unwrapped counts, n consecutive entries per sample
+        self._raw = array('l', [0] * (size * n))
+        ## Running unwrapped count of each encoder
+        self._accum = array('l', [0] * n)
+        ## Last hardware counter value of each encoder
+        self._prev = array('l', [0] * n)
+        # the counter values read by one interrupt
+        self._counts = array('l', [0] * n)
+        self._head = 0
+        self._tail = 0
+        self._overruns = 0
+
+        # binding the method allocates, so do it once here rather than in the interrupt
+        self._isr_ref = self._isr
+
+    def start(self):
+        '''     @brief              Starts sampling, continuing the unwrapped counts from the present counters.
+        '''
+        for i in range(len(self.encoders)):
+            self._prev[i] = self.encoders[i].encoderTimer.counter()
+        self.timer = pyb.Timer(self.timNum, freq = self.freq)
+        self.timer.callback(self._isr_ref)
+
+    def stop(self):
+        '''     @brief              Stops the sampling interrupt. Buffered samples can still be drained.
+        '''
+        if (self.timer is not None):
+            self.timer.callback(None)
+
+    @micropython.native
+    def _isr(self, timer):
+        '''     @brief              Timer callback: samples every encoder. Integer-only and allocation-free.
+        '''
+        tail = self._tail
+        nxt = tail + 1
+        if (nxt >= self.size):
+            nxt = 0
+        if (nxt == self._head):
+            self._overruns += 1
+            full = True
+        else:
+            full = False
+            self._times[tail] = utime.ticks_us()
+
+        counts = self._counts
+        encoders = self.encoders
+        n = len(counts)
+        for i in range(n):
+            counts[i] = encoders[i].encoderTimer.counter()
+        _unwrap(counts, self._prev, self._accum, self._raw, tail * n, n, 0 if full else 1)
+
+        if (not full):
+            self._tail = nxt
+
+    def available(self):
+        '''     @brief              Returns the number of samples waiting to be drained.
+        '''
+        n = self._tail - self._head
+        if (n < 0):
+            n += self.size
+        return n
+
+    def drain(self):
+        '''     @brief              Feeds every buffered sample to its encoder's update_sample().
+            @return             The number of samples drained.
+        '''
+        n = len(self.encoders)
+        drained = 0
+        head = self._head
+        while (head != self._tail):
+            timestamp = self._times[head]
+            base = head * n
+            for i in range(n):
+                self.encoders[i].update_sample(self._raw[base + i], timestamp)
+            head += 1
+            if (head >= self.size):
+                head = 0
+            self._head = head
+            drained += 1
+        return drained
+
+    def overruns(self):
+        '''     @brief              Returns the number of samples dropped because the buffer was full.
+        '''
+        return self._overruns
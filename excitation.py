@@ -0,0 +1,130 @@
+''' @file                       excitation.py
+    @brief                      Duty-cycle excitation signals precomputed into tables.
+    @details                    Each function plans a test signal once, with floats, and samples it at
+                                the task period into an array of signed duty cycles in percent, so the
+                                system identification task only indexes the table on every run. Signals
+                                can be joined with concat() to identify a motor from one run:
+                                step_train()  holds a list of duties in turn, for gain and time constant
+                                chirp()       sweeps a sine from one frequency to another, for bandwidth
+                                prbs()        switches between two levels in a pseudo-random bit sequence,
+                                              which excites every frequency up to the bit rate at once
+                                Durations are in seconds and periods in microseconds, as in trajectory.py.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import math
+from array import array
+from micropython import const
+
+## The most samples a table may hold; at 1 byte each this bounds its RAM use
+MAX_SAMPLES = const(8192)
+## The largest duty a table may command, in percent
+DUTY_LIMIT = const(100)
+
+# the feedback taps, counted from 1, of a maximal-length LFSR of each order
+_PRBS_TAPS = {5: (5, 3), 6: (6, 5), 7: (7, 6), 8: (8, 6, 5, 4), 9: (9, 5), 10: (10, 7)}
+
+def _table(n):
+    if (n < 1 or n > MAX_SAMPLES):
+        raise ValueError('An excitation of {:} samples is outside 1..{:}'.format(n, MAX_SAMPLES))
+    return array('b', [0] * n)
+
+def _duty(value):
+    value = int(round(value))
+    if (value > DUTY_LIMIT):
+        return DUTY_LIMIT
+    if (value < -DUTY_LIMIT):
+        return -DUTY_LIMIT
+    return value
+
+def _samples(duration, period):
+    if (period <= 0):
+        raise ValueError('Excitation period must be positive')
+    return int(round(duration * 1000000 / period))
+
+def step_train(levels, hold, period):
+    '''     @brief                  Holds each duty in turn.
+        @param levels           A sequence of duties in percent.
+        @param hold             The time each duty is held, in seconds.
+        @param period           The time between samples in microseconds.
+        @return                 An array('b') of duties.
+    '''
+    each = _samples(hold, period)
+    table = _table(each * len(levels))
+    for i in range(len(levels)):
+        duty = _duty(levels[i])
+        for k in range(i * each, (i + 1) * each):
+            table[k] = duty
+    return table
+
+def chirp(amplitude, f0, f1, duration, period, offset = 0):
+    '''     @brief                  A sine sweeping linearly in frequency.
+        @param amplitude        The peak duty about the offset, in percent.
+        @param f0               The starting frequency in Hz.
+        @param f1               The final frequency in Hz; keep it well below half the sample rate.
+        @param duration         The length of the sweep in seconds.
+        @param period           The time between samples in microseconds.
+        @param offset           The duty the sine is centred on, in percent.
+        @return                 An array('b') of duties.
+    '''
+    n = _samples(duration, period)
+    table = _table(n)
+    dt = period / 1000000
+    rate = (f1 - f0) / duration
+    for k in range(n):
+        t = k * dt
+        table[k] = _duty(offset + amplitude * math.sin(2 * math.pi * (f0 * t + rate * t * t / 2)))
+    return table
+
+def prbs(amplitude, duration, period, hold = 1, order = 7, offset = 0, seed = 1):
+    '''     @brief                  A maximal-length pseudo-random binary sequence.
+        @details                The sequence repeats every 2**order - 1 bits.
+        @param amplitude        The duty above and below the offset, in percent.
+        @param duration         The length of the signal in seconds.
+        @param period           The time between samples in microseconds.
+        @param hold             The number of samples each bit is held.
+        @param order            The length of the shift register, from 5 to 10.
+        @param offset           The duty the levels are centred on, in percent.
+        @param seed             The nonzero starting state of the shift register.
+        @return                 An array('b') of duties.
+    '''
+    if (order not in _PRBS_TAPS):
+        raise ValueError('PRBS order must be from 5 to 10')
+    if (hold < 1):
+        raise ValueError('PRBS bits must be held for at least one sample')
+    mask = (1 << order) - 1
+    state = seed & mask
+    if (state == 0):
+        raise ValueError('PRBS seed must be nonzero')
+    taps = _PRBS_TAPS[order]
+    high = _duty(offset + amplitude)
+    low = _duty(offset - amplitude)
+
+    n = _samples(duration, period)
+    table = _table(n)
+    for k in range(n):
+        if (k % hold == 0):
+            bit = 0
+            for tap in taps:
+                bit ^= state >> (tap - 1)
+            state = ((state << 1) | (bit & 1)) & mask
+        table[k] = high if state & 1 else low
+    return table
+
+def concat(*tables):
+    '''     @brief                  Joins tables into one, in order.
+        @return                 An array('b') of duties.
+    '''
+    n = 0
+    for t in tables:
+        n += len(t)
+    table = _table(n)
+    k = 0
+    for t in tables:
+        for duty in t:
+            table[k] = duty
+            k += 1
+    return table
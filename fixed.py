@@ -0,0 +1,103 @@
+''' @file                       fixed.py
+    @brief                      Fixed-point helpers for the encoder and control math.
+    @details                    Floats are boxed heap objects on the Pyboard, so every float result
+                                allocates, and allocating is not allowed in a hard interrupt. Values here
+                                are plain ints holding a real number scaled by 2**shift; the default,
+                                FRAC_BITS, makes them Q16.16. Small ints on the Pyboard are 31 bits
+                                wide, so any product larger than that silently becomes a heap-allocated
+                                long int: constants are built once with floats, outside the hot path,
+                                and a Scale splits its input so the products it forms stay small.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+from micropython import const
+
+## Fractional bits of the default Q16.16 format
+FRAC_BITS = const(16)
+## 1.0 in Q16.16
+ONE = const(1 << 16)
+## 2*pi in Q16.16
+TWO_PI = const(411775)
+## The largest magnitude a product may have and still be a small int
+SMALL_LIMIT = const((1 << 30) - 1)
+
+def from_float(value, shift = FRAC_BITS):
+    '''     @brief                  Converts a number to fixed point, rounding to nearest.
+        @param value            The number to convert.
+        @param shift            The number of fractional bits.
+        @return                 round(value * 2**shift) as an int.
+    '''
+    return int(round(value * (1 << shift)))
+
+def to_float(fixed, shift = FRAC_BITS):
+    '''     @brief                  Converts a fixed-point number back to a float, for display.
+    '''
+    return fixed / (1 << shift)
+
+def mul(a, b, shift = FRAC_BITS):
+    '''     @brief                  Multiplies two fixed-point numbers, rounding to nearest.
+        @details                The product a * b must fit in a small int for this not to allocate.
+        @return                 a * b in the same format.
+    '''
+    p = a * b
+    if (p < 0):
+        return -((-p + (1 << (shift - 1))) >> shift)
+    return (p + (1 << (shift - 1))) >> shift
+
+def div(a, b, shift = FRAC_BITS):
+    '''     @brief                  Divides two fixed-point numbers, rounding toward zero.
+        @details                a << shift must fit in a small int for this not to allocate.
+        @return                 a / b in the same format.
+    '''
+    if ((a < 0) != (b < 0)):
+        return -((abs(a) << shift) // abs(b))
+    return (abs(a) << shift) // abs(b)
+
+class Scale:
+    '''     @brief                  Multiplies integers by a constant ratio without large products.
+        @details                Built for a ratio of num (a fixed-point number) per den units, e.g.
+                                TWO_PI radians per cpr counts. apply() splits its input into whole
+                                multiples of den, which are scaled exactly by num, and a remainder
+                                below den, which is scaled by a multiplier with as many fractional
+                                bits as keep the product a small int. For radians from a few thousand
+                                counts per revolution the result is within a unit or two of the
+                                output format, and nothing allocates as long as the whole part, times
+                                num, is itself a small int: about 2600 revolutions.
+    '''
+
+    def __init__(self, num, den):
+        '''     @brief              Precomputes the multiplier for a ratio.
+            @param num          The fixed-point output for den units of input.
+            @param den          A positive int, e.g. the encoder's counts per revolution.
+        '''
+        if (den <= 0):
+            raise ValueError('Scale denominator must be positive')
+        self.num = num
+        self.den = den
+        # the largest shift for which (den - 1) * multiplier stays a small int
+        shift = 0
+        while (shift < 30 and den * ((abs(num) << (shift + 1)) // den + 1) <= SMALL_LIMIT):
+            shift += 1
+        self._shift = shift
+        self._mul = ((num << shift) + (den >> 1)) // den
+        self._half = (1 << shift) >> 1
+
+    def apply(self, value):
+        '''     @brief              Scales an integer by num/den.
+            @param value        An int, e.g. a position in counts or a velocity in counts/s.
+            @return             value * num / den, rounded to nearest, in num's format.
+        '''
+        whole = value // self.den
+        rest = value - whole * self.den
+        return whole * self.num + ((rest * self._mul + self._half) >> self._shift)
+
+def radians(cpr):
+    '''     @brief                  Builds the counts to Q16.16 radians Scale of an encoder.
+        @param cpr              Encoder counts per shaft revolution.
+        @return                 A Scale whose apply() turns counts, or counts/s, into Q16.16
+                                radians, or radians/s.
+    '''
+    return Scale(TWO_PI, cpr)
@@ -0,0 +1,152 @@
+''' @file                       fsm.py
+    @brief                      Table-driven finite state machine shared by the Task_* classes.
+    @details                    A StateMachine holds the current state and a dispatch table with one slot
+                                per (state, event) pair, filled in once when the task is constructed. An
+                                event is dispatched by indexing the table, so the cost of handling a
+                                keystroke or command does not grow with the number of commands a task
+                                understands. Each state may have an entry and an exit hook that
+                                transition_to() calls, so setup and cleanup live with the state instead of
+                                at every place the state is entered or left. Transitions can be traced
+                                into a fixed-size ring buffer of timestamps and state numbers, which costs
+                                a few array stores rather than a print to the console.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import utime
+from array import array
+from micropython import const
+
+## Event number recorded in the trace for transitions not caused by a dispatched event
+NO_EVENT = const(0xFF)
+## Number of transitions a debugging task keeps in its trace
+TRACE_SIZE = const(32)
+
+class StateMachine:
+    '''     @brief                  The state and dispatch table of one task.
+        @details                Handlers are called with the event's integer value and return the
+                                state to move to, or None to stay in the current state.
+    '''
+
+    def __init__(self, name, numStates, numEvents, initial = 0, traceSize = 0):
+        '''     @brief              Constructs a state machine with an empty dispatch table.
+            @param name         The name printed with the trace, normally the task ID.
+            @param numStates    The number of states; states are numbered from 0.
+            @param numEvents    The number of events; events are numbered from 0 and
+                                events outside the range are ignored.
+            @param initial      The starting state. Its entry hook is not called.
+            @param traceSize    The number of transitions kept for print_trace(), or 0
+                                to turn tracing off.
+        '''
+        self.name = name
+        self.numStates = numStates
+        self.numEvents = numEvents
+        ## The current state
+        self.state = initial
+        ## The event being dispatched, or NO_EVENT outside of dispatch()
+        self.event = NO_EVENT
+
+        self._table = [None] * (numStates * numEvents)
+        self._entry = [None] * numStates
+        self._exit = [None] * numStates
+
+        ## The number of transitions kept in the trace, 0 when tracing is off
+        self.traceSize = traceSize
+        self._traceIndex = 0
+        self._traceFull = False
+        if (traceSize > 0):
+            self._traceTime = array('L', [0] * traceSize)
+            self._traceFrom = array('B', [0] * traceSize)
+            self._traceTo = array('B', [0] * traceSize)
+            self._traceEvent = array('B', [0] * traceSize)
+
+    def on(self, states, event, handler):
+        '''     @brief              Sets the handler of an event in one or more states.
+            @param states       A state number, or a tuple of state numbers.
+            @param event        The event number.
+            @param handler      A callable taking the event value and returning the next
+                                state or None.
+        '''
+        if (event < 0 or event >= self.numEvents):
+            raise ValueError('Invalid event {:}'.format(event))
+        if (not isinstance(states, tuple)):
+            states = (states,)
+        for state in states:
+            self._check_state(state)
+            self._table[state * self.numEvents + event] = handler
+
+    def on_entry(self, state, hook):
+        '''     @brief              Sets a callable, taking no arguments, run on entering a state.
+        '''
+        self._check_state(state)
+        self._entry[state] = hook
+
+    def on_exit(self, state, hook):
+        '''     @brief              Sets a callable, taking no arguments, run on leaving a state.
+        '''
+        self._check_state(state)
+        self._exit[state] = hook
+
+    def dispatch(self, event, value = 0):
+        '''     @brief              Runs the handler of an event in the current state.
+            @param event        The event number.
+            @param value        The integer value passed to the handler.
+            @return             True if the current state handles the event.
+        '''
+        if (event < 0 or event >= self.numEvents):
+            return False
+        handler = self._table[self.state * self.numEvents + event]
+        if (handler is None):
+            return False
+        self.event = event
+        next_state = handler(value)
+        if (next_state is not None and next_state != self.state):
+            self.transition_to(next_state)
+        self.event = NO_EVENT
+        return True
+
+    def transition_to(self, new_state):
+        '''     @brief              Leaves the current state and enters another.
+            @details            Runs the exit hook of the current state, records the transition
+                                if tracing is on, then runs the entry hook of the new state.
+            @param new_state    The state to transition to.
+        '''
+        hook = self._exit[self.state]
+        if (hook is not None):
+            hook()
+        if (self.traceSize > 0):
+            i = self._traceIndex
+            self._traceTime[i] = utime.ticks_us()
+            self._traceFrom[i] = self.state
+            self._traceTo[i] = new_state
+            self._traceEvent[i] = self.event
+            i += 1
+            if (i >= self.traceSize):
+                i = 0
+                self._traceFull = True
+            self._traceIndex = i
+        self.state = new_state
+        hook = self._entry[new_state]
+        if (hook is not None):
+            hook()
+
+    def print_trace(self):
+        '''     @brief              Prints the recorded transitions, oldest first.
+        '''
+        if (self.traceSize == 0):
+            print('{:}: tracing is off'.format(self.name))
+            return
+        count = self.traceSize if self._traceFull else self._traceIndex
+        first = self._traceIndex if self._traceFull else 0
+        for n in range(count):
+            i = (first + n) % self.traceSize
+            event = self._traceEvent[i]
+            print('{:}: {:>10} us  S{:}->S{:}{:}'.format(self.name, self._traceTime[i],
+                  self._traceFrom[i], self._traceTo[i],
+                  '' if event == NO_EVENT else '  on event {:}'.format(event)))
+
+    def _check_state(self, state):
+        if (state < 0 or state >= self.numStates):
+            raise ValueError('Invalid state {:}'.format(state))
@@ -0,0 +1,187 @@
+''' @file                       gc_manager.py
+    @brief                      Runs garbage collection in scheduler slack instead of mid-schedule.
+    @details                    A GCManager collects early, in idle time, so the automatic collector
+                                rarely has to. It is handed every idle pass by the Scheduler together with the slack, the
+                                microseconds until the next task release. A collection is made due once
+                                threshold bytes have been allocated since the last one, or when a task
+                                asks for one, and is only run when the slack exceeds the measured length
+                                of recent collections plus a margin, so it never delays a release. If
+                                free memory falls below the reserve, a collection runs at the next idle
+                                pass regardless, since running out of heap would collect at a worse time.
+                                Automatic collection stays on, with a higher gc.threshold(), as a safety
+                                net: a task that allocates a lot within one run, such as one printing a
+                                long table, gets collected mid-run rather than running out of heap, and
+                                a failed allocation still collects before raising MemoryError.
+                                MicroPython's collector is not incremental, so keeping the heap small
+                                between collections is what keeps each one short. Heap usage is sampled
+                                at a fixed interval into a ring buffer for report().
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import gc, utime
+from array import array
+from micropython import const
+
+## Assumed length of a collection, in microseconds, until one has been measured
+INITIAL_ESTIMATE = const(2000)
+
+class GCManager:
+    '''     @brief                  Schedules garbage collections into idle time.
+        @details                Pass it to scheduler.Scheduler as idle, and call start() just before
+                                the scheduler starts running.
+    '''
+
+    def __init__(self, threshold = 4096, reserve = 8192, margin = 200, samplePeriod = 100000, historySize = 32,
+                 autoThreshold = 16384):
+        '''     @brief              Constructs a manager; nothing changes until start().
+            @param threshold    Bytes allocated since the last collection that make one due in idle time.
+            @param reserve      Free bytes below which a collection runs without waiting for slack.
+            @param margin       Microseconds of slack required beyond the collection estimate.
+            @param samplePeriod Microseconds between heap samples.
+            @param historySize  The number of heap samples kept for report().
+            @param autoThreshold Bytes allocated after which the automatic collector runs, given
+                                to gc.threshold(); larger than threshold, so it only runs when
+                                idle time did not come soon enough.
+        '''
+        self.threshold = threshold
+        self.autoThreshold = autoThreshold
+        self.reserve = reserve
+        self.margin = margin
+        self.samplePeriod = samplePeriod
+
+        ## Expected length of a collection, in microseconds; a decaying maximum of measurements
+        self.estimate = INITIAL_ESTIMATE
+        self._measured = False
+        ## True once a collection is due
+        self.due = False
+        self._nextSample = utime.ticks_us()
+        self._allocAfter = 0
+
+        self.reset_stats()
+
+        self._historySize = historySize
+        self._histTime = array('L', [0] * historySize)
+        self._histFree = array('L', [0] * historySize)
+        self._histAlloc = array('L', [0] * historySize)
+        self._histIndex = 0
+        self._histFull = False
+
+    def reset_stats(self):
+        '''     @brief              Clears the collection counters.
+        '''
+        ## Collections run in slack
+        self.collections = 0
+        ## Collections run below the reserve without enough slack
+        self.forced = 0
+        ## Idle passes where a collection was due but the slack was too short
+        self.deferred = 0
+        ## Total and longest collection time, in microseconds
+        self.collectTotal = 0
+        self.collectMax = 0
+
+    def start(self):
+        '''     @brief              Collects once and raises the automatic collection threshold.
+        '''
+        gc.enable()
+        gc.threshold(self.autoThreshold)
+        self.collect()
+
+    def stop(self):
+        '''     @brief              Restores the default automatic collection threshold.
+        '''
+        gc.threshold(-1)
+
+    def request(self):
+        '''     @brief              Asks for a collection at the next idle pass with enough slack.
+            @details            For a task that has just released a lot of memory, e.g. after
+                                printing a long report.
+        '''
+        self.due = True
+
+    def idle(self, slack):
+        '''     @brief              Called by the scheduler when no task is due.
+            @param slack        Microseconds until the next task release.
+        '''
+        now = utime.ticks_us()
+        if (utime.ticks_diff(now, self._nextSample) >= 0):
+            self._nextSample = utime.ticks_add(now, self.samplePeriod)
+            free = self._sample(now)
+            if (free < self.reserve):
+                self.forced += 1
+                self.collect()
+                return
+            if (gc.mem_alloc() - self._allocAfter >= self.threshold):
+                self.due = True
+
+        if (self.due):
+            if (slack >= self.estimate + self.margin):
+                self.collect()
+            else:
+                self.deferred += 1
+
+    def collect(self):
+        '''     @brief              Runs a full collection now and updates the estimate.
+        '''
+        start = utime.ticks_us()
+        gc.collect()
+        length = utime.ticks_diff(utime.ticks_us(), start)
+
+        self.due = False
+        self._allocAfter = gc.mem_alloc()
+        self.collections += 1
+        self.collectTotal += length
+        if (length > self.collectMax):
+            self.collectMax = length
+        if (length > self.estimate or not self._measured):
+            self.estimate = length
+            self._measured = True
+        else:
+            self.estimate -= (self.estimate - length) >> 3
+
+    def _sample(self, now):
+        free = gc.mem_free()
+        i = self._histIndex
+        self._histTime[i] = now
+        self._histFree[i] = free
+        self._histAlloc[i] = gc.mem_alloc()
+        i += 1
+        if (i >= self._historySize):
+            i = 0
+            self._histFull = True
+        self._histIndex = i
+        return free
+
+    def report(self):
+        '''     @brief              Prints collection statistics and the heap trend.
+            @details            The allocation rate counts only growth between samples, so
+                                collections do not hide it.
+        '''
+        count = self._historySize if self._histFull else self._histIndex
+        first = self._histIndex if self._histFull else 0
+        print('+-------------------------------------------------------------------------------+')
+        print('| Heap: {:} bytes free, {:} bytes used'.format(gc.mem_free(), gc.mem_alloc()))
+        average = self.collectTotal // (self.collections + self.forced) if (self.collections + self.forced) else 0
+        print('| GC: {:} in slack, {:} forced, {:} deferred; {:}/{:} us avg/max, estimate {:} us'.format(
+              self.collections, self.forced, self.deferred, average, self.collectMax, self.estimate))
+        if (count >= 2):
+            lowest = highest = self._histFree[first]
+            growth = 0
+            for n in range(1, count):
+                i = (first + n) % self._historySize
+                j = (first + n - 1) % self._historySize
+                free = self._histFree[i]
+                if (free < lowest):
+                    lowest = free
+                if (free > highest):
+                    highest = free
+                if (self._histAlloc[i] > self._histAlloc[j]):
+                    growth += self._histAlloc[i] - self._histAlloc[j]
+            last = (first + count - 1) % self._historySize
+            span = utime.ticks_diff(self._histTime[last], self._histTime[first])
+            rate = growth * 1000000 // span if span > 0 else 0
+            print('| Trend over {:.1f} s: free {:}..{:} bytes, allocating {:} bytes/s'.format(
+                  span / 1000000, lowest, highest, rate))
+        print('+-------------------------------------------------------------------------------+\n')
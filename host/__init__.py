@@ -0,0 +1,16 @@
+''' @file                       host/__init__.py
+    @brief                      Host-side tools for captures taken on the board.
+    @details                    These modules run on a PC with NumPy, not on the Pyboard:
+                                telemetry_decode  decodes the binary telemetry stream
+                                capture           loads captures from text or binary into NumPy arrays,
+                                                  converts units and saves runs as .npz
+                                metrics           step-response metrics
+                                sysid             fits a motor model to a task_sysid.py run
+                                analyze           the command line front end, run as
+                                                  python -m host.analyze capture.txt
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
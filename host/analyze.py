@@ -0,0 +1,71 @@
+''' @file                       host/analyze.py
+    @brief                      Command line summary of captured runs.
+    @details                    Loads one or more capture files, converts them to radians with the
+                                encoder's counts per revolution, and prints each run's length, sample
+                                rate, peak velocity and acceleration and step-response metrics. The runs
+                                can be saved to one compressed .npz file for later comparison.
+
+                                Usage:
+                                    python -m host.analyze log.txt [capture.bin ...] [--cpr 4000]
+                                                           [--window 5] [--target RAD] [-o runs.npz]
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import argparse
+import numpy as np
+from . import capture, metrics
+
+def summarize(run, window = 1, target = None):
+    '''   @brief                  Prints the summary of one run.
+       @param run                 A capture.Capture.
+       @param window              The moving average length for velocity and acceleration.
+       @param target              The commanded final angle in radians, or None.
+       @return                    The step metrics, or None if the run did not move.
+    '''
+    if (len(run) < 2):
+        print('  {:} samples, too short to analyze'.format(len(run)))
+        return None
+    dt = np.diff(run.time)
+    velocity = run.velocity(window)
+    acceleration = run.acceleration(window)
+    print('  {:} samples over {:.3f} s, dt {:.0f} us mean, {:.0f} us max'.format(
+          len(run), run.time[-1] - run.time[0], dt.mean() * 1e6, dt.max() * 1e6))
+    print('  peak velocity {:.2f} rad/s, peak acceleration {:.1f} rad/s^2'.format(
+          np.abs(velocity).max(), np.abs(acceleration).max()))
+    try:
+        result = metrics.step_metrics(run.time, run.radians, target = target)
+    except ValueError as e:
+        print('  no step response: {:}'.format(e))
+        return None
+    print('  rise {:.4f} s, overshoot {:.1f}%, settling {:.4f} s, steady-state error {:.4f} rad'.format(
+          result['rise_time'], result['overshoot'], result['settling_time'], result['steady_state_error']))
+    return result
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Summarize captured runs.')
+    parser.add_argument('files', nargs = '+', help = 'text logs, binary streams or .npz files')
+    parser.add_argument('--cpr', type = int, default = capture.DEFAULT_CPR,
+                        help = 'encoder counts per revolution')
+    parser.add_argument('--window', type = int, default = 1,
+                        help = 'moving average length for velocity and acceleration')
+    parser.add_argument('--target', type = float, help = 'the commanded final angle in radians')
+    parser.add_argument('-o', '--output', help = 'save every run to this .npz file')
+    args = parser.parse_args(argv)
+
+    runs = []
+    for path in args.files:
+        for run in capture.load(path, args.cpr):
+            print('run {:} ({:}):'.format(len(runs), path))
+            summarize(run, args.window, args.target)
+            runs.append(run)
+
+    if (args.output):
+        capture.save_all(runs, args.output)
+        print('{:} runs saved to {:}'.format(len(runs), args.output))
+    return runs
+
+if __name__ == '__main__':
+    main()
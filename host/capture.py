@@ -0,0 +1,198 @@
+''' @file                       host/capture.py
+    @brief                      Loads encoder captures into NumPy arrays and saves them as .npz.
+    @details                    A Capture holds one data collection run: sample times in seconds and
+                                positions and deltas in encoder counts, together with the counts per
+                                revolution needed to convert them to radians. Captures are read from the
+                                text table Task_User prints at the end of a run, from a binary telemetry
+                                stream (see telemetry_decode.py), or from an .npz file written by save()
+                                or save_all().
+                                Older text dumps labelled their columns in radians and printed the time
+                                rounded to 10 ms; the columns were counts all along, and repeated times
+                                are replaced by evenly spaced ones over the same span.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import re
+import numpy as np
+from . import telemetry_decode
+
+## The encoder counts per revolution assumed when none is given
+DEFAULT_CPR = 4000
+
+# a data row of the text table: time, position, delta separated by commas
+_ROW = re.compile(r'^\s*(-?[\d.]+)\s*,\s*(-?\d+)\s*,\s*(-?\d+)\s*$')
+
+class Capture:
+    '''     @brief                  One data collection run.
+    '''
+
+    def __init__(self, time, position, delta, cpr = DEFAULT_CPR):
+        '''     @brief              Wraps the arrays of a run.
+            @param time         Sample times in seconds from the start of the run.
+            @param position     Encoder positions in counts.
+            @param delta        Counts moved since the previous sample.
+            @param cpr          Encoder counts per shaft revolution.
+        '''
+        self.time = np.asarray(time, dtype = np.float64)
+        self.position = np.asarray(position, dtype = np.int64)
+        self.delta = np.asarray(delta, dtype = np.int64)
+        if (not (len(self.time) == len(self.position) == len(self.delta))):
+            raise ValueError('time, position and delta must have the same length')
+        self.cpr = int(cpr)
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def radians(self):
+        '''     @brief              The shaft angle in radians.
+        '''
+        return self.position * (2 * np.pi / self.cpr)
+
+    def velocity(self, window = 1):
+        '''     @brief              The shaft velocity in rad/s.
+            @details            Differentiates the position against the measured sample times,
+                                so uneven sampling does not bias the result.
+            @param window       The length of the centred moving average applied afterwards;
+                                1 for none.
+        '''
+        return smooth(derivative(self.time, self.radians), window)
+
+    def acceleration(self, window = 1):
+        '''     @brief              The shaft acceleration in rad/s^2.
+            @param window       The moving average length, applied to the velocity and again
+                                to the acceleration.
+        '''
+        return smooth(derivative(self.time, self.velocity(window)), window)
+
+    def save(self, path):
+        '''     @brief              Writes the run to a compressed .npz file.
+        '''
+        np.savez_compressed(path, time = self.time, position = self.position, delta = self.delta,
+                            cpr = np.int64(self.cpr))
+
+def derivative(time, values):
+    '''   @brief                  Differentiates samples taken at arbitrary times.
+       @details                   Second-order central differences inside, one-sided at the ends.
+       @param time                Sample times in seconds; must be strictly increasing.
+       @param values              The sampled values.
+       @return                    d(values)/d(time), the same length as values.
+    '''
+    if (len(time) < 2):
+        return np.zeros(len(values))
+    return np.gradient(np.asarray(values, dtype = np.float64), time)
+
+def smooth(values, window):
+    '''   @brief                  Centred moving average that keeps the length and end values.
+       @details                   Near the ends the average is taken over the samples available,
+                                  so the result is not pulled toward zero.
+       @param window              The averaging length; even lengths are rounded up to odd.
+    '''
+    values = np.asarray(values, dtype = np.float64)
+    if (window <= 1 or len(values) == 0):
+        return values
+    window = int(window) | 1
+    kernel = np.ones(window)
+    sums = np.convolve(values, kernel, mode = 'same')
+    counts = np.convolve(np.ones(len(values)), kernel, mode = 'same')
+    return sums / counts
+
+def _even_times(time):
+    # replaces rounded, repeating times with evenly spaced ones over the same span
+    if (len(time) > 1 and np.any(np.diff(time) <= 0)):
+        return np.linspace(time[0], time[-1], len(time))
+    return time
+
+def parse_text(text, cpr = DEFAULT_CPR):
+    '''   @brief                  Reads every data table in a console log.
+       @param text                The text printed by Task_User, possibly with other output mixed in.
+       @param cpr                 Encoder counts per shaft revolution.
+       @return                    A list of Captures, one per table.
+    '''
+    captures = []
+    rows = None
+    scale = 1e-6
+    for line in text.splitlines():
+        if (line.startswith('Time [') and 'Delta' in line):
+            # the header gives the unit of the time column
+            scale = 1e-6 if line.startswith('Time [us]') else 1.0
+            rows = []
+        elif (rows is None):
+            # outside a capture table, e.g. in a system identification table
+            continue
+        elif (line.startswith('***')):
+            if (rows):
+                captures.append(_from_rows(rows, scale, cpr))
+            rows = None
+        else:
+            match = _ROW.match(line)
+            if (match):
+                rows.append(match.groups())
+    if (rows):
+        captures.append(_from_rows(rows, scale, cpr))
+    return captures
+
+def _from_rows(rows, scale, cpr):
+    table = np.array(rows, dtype = np.float64)
+    time = _even_times(table[:, 0] * scale)
+    return Capture(time, table[:, 1], table[:, 2], cpr)
+
+def parse_binary(data, cpr = DEFAULT_CPR):
+    '''   @brief                  Decodes every capture in a recorded telemetry stream.
+       @param data                The raw bytes read from the USB_VCP.
+       @param cpr                 Encoder counts per shaft revolution.
+       @return                    A list of Captures.
+    '''
+    return [Capture(c['time'], c['position'], c['delta'], cpr) for c in telemetry_decode.decode(data)]
+
+def load(path, cpr = DEFAULT_CPR):
+    '''   @brief                  Reads the captures in a file of any supported kind.
+       @details                   .npz files are read as written by save() or by
+                                  telemetry_decode.py; other files are decoded as a binary stream
+                                  if they hold any telemetry frame, and as text otherwise.
+       @param path                The file to read.
+       @param cpr                 Counts per revolution, for files that do not record it.
+       @return                    A list of Captures.
+    '''
+    if (str(path).endswith('.npz')):
+        with np.load(path) as arrays:
+            return _from_npz(arrays, cpr)
+    with open(path, 'rb') as f:
+        data = f.read()
+    captures = parse_binary(data, cpr) if telemetry_decode.SYNC in data else []
+    if (not captures):
+        captures = parse_text(data.decode('utf-8', 'replace'), cpr)
+    return captures
+
+def save_all(captures, path):
+    '''   @brief                  Writes several runs to one compressed .npz file.
+       @details                   The arrays are numbered as telemetry_decode.py numbers them,
+                                  time_0, position_0, delta_0 and so on, with one cpr for the file.
+       @param captures            A list of Captures sharing a cpr.
+       @param path                The file to write.
+    '''
+    arrays = {}
+    for index, capture in enumerate(captures):
+        arrays['time_{:}'.format(index)] = capture.time
+        arrays['position_{:}'.format(index)] = capture.position
+        arrays['delta_{:}'.format(index)] = capture.delta
+    if (captures):
+        arrays['cpr'] = np.int64(captures[0].cpr)
+    np.savez_compressed(path, **arrays)
+
+def _from_npz(arrays, cpr):
+    if ('cpr' in arrays):
+        cpr = int(arrays['cpr'])
+    if ('time' in arrays):
+        return [Capture(arrays['time'], arrays['position'], arrays['delta'], cpr)]
+    # telemetry_decode.py numbers its captures time_0, time_1, ...
+    captures = []
+    index = 0
+    while ('time_{:}'.format(index) in arrays):
+        captures.append(Capture(arrays['time_{:}'.format(index)], arrays['position_{:}'.format(index)],
+                                arrays['delta_{:}'.format(index)], cpr))
+        index += 1
+    return captures
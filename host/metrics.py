@@ -0,0 +1,83 @@
+''' @file                       host/metrics.py
+    @brief                      Step-response metrics of a captured run.
+    @details                    Measures rise time, overshoot, settling time and steady-state error of a
+                                response to a step in the setpoint, with NumPy operations over the whole
+                                run rather than a loop over samples. The response may step up or down;
+                                every measure is taken relative to the size of the step.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import numpy as np
+
+def _crossing(time, progress, level):
+    # the interpolated time at which progress first reaches level, or nan
+    above = np.nonzero(progress >= level)[0]
+    if (len(above) == 0):
+        return np.nan
+    i = above[0]
+    if (i == 0):
+        return time[0]
+    p0, p1 = progress[i - 1], progress[i]
+    return time[i - 1] + (level - p0) / (p1 - p0) * (time[i] - time[i - 1])
+
+def step_metrics(time, response, target = None, initial = None, band = 0.02, rise = (0.1, 0.9),
+                 tail = 0.1):
+    '''   @brief                  Measures a step response.
+       @param time                Sample times in seconds, increasing.
+       @param response            The measured output, e.g. Capture.radians or counts.
+       @param target              The setpoint after the step. Defaults to the final value, in
+                                  which case the steady-state error is zero by definition.
+       @param initial             The output before the step. Defaults to the first sample.
+       @param band                The settling band as a fraction of the step size.
+       @param rise                The (low, high) fractions of the step between which the rise
+                                  time is measured.
+       @param tail                The fraction of the run, at its end, averaged for the final value.
+       @return                    A dict with rise_time, peak, peak_time, overshoot (percent of the
+                                  step), settling_time, final and steady_state_error. Times are
+                                  in seconds from the first sample; nan where a measure is not
+                                  reached.
+    '''
+    time = np.asarray(time, dtype = np.float64)
+    y = np.asarray(response, dtype = np.float64)
+    if (len(y) < 2):
+        raise ValueError('A step response needs at least two samples')
+    t = time - time[0]
+
+    n = max(1, int(round(len(y) * tail)))
+    final = y[-n:].mean()
+    if (initial is None):
+        initial = y[0]
+    if (target is None):
+        target = final
+    step = target - initial
+    if (step == 0):
+        raise ValueError('The step has no size')
+
+    # 0 at the initial value and 1 at the target, whichever way the step goes
+    progress = (y - initial) / step
+
+    low, high = rise
+    riseTime = _crossing(t, progress, high) - _crossing(t, progress, low)
+
+    peakIndex = int(np.argmax(progress))
+    overshoot = max(0.0, progress[peakIndex] - 1.0) * 100
+
+    # settled from just after the last sample outside the band
+    outside = np.nonzero(np.abs(progress - 1.0) > band)[0]
+    if (len(outside) == 0):
+        settlingTime = 0.0
+    elif (outside[-1] == len(y) - 1):
+        settlingTime = np.nan
+    else:
+        settlingTime = t[outside[-1] + 1]
+
+    return {'rise_time': riseTime,
+            'peak': y[peakIndex],
+            'peak_time': t[peakIndex],
+            'overshoot': overshoot,
+            'settling_time': settlingTime,
+            'final': final,
+            'steady_state_error': target - final}
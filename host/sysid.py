@@ -0,0 +1,253 @@
+''' @file                       host/sysid.py
+    @brief                      Fits a motor model to a system identification run by least squares.
+    @details                    Reads the table printed by task_sysid.py: sample times, the duty applied
+                                after each sample and the encoder position. The mean shaft velocity over
+                                each sample interval is modelled as
+
+                                    w[k] = a1 w[k-1] + ... + an w[k-n] + b0 u[k] + ... + bn u[k-n] + c sgn(w[k-1])
+
+                                for a first (n = 1) or second (n = 2) order model, where u is the duty in
+                                percent and the last term is Coulomb friction. The coefficients are found
+                                with one linear least-squares solve. From them come the static gain in
+                                rad/s per percent duty, the time constants of the poles and the friction
+                                expressed as the duty needed to overcome it. The deadband is measured
+                                directly: the largest duty that was held without the shaft moving.
+                                Intervals whose length differs from the nominal period by more than 20%
+                                are left out of the fit. Given a target bandwidth, PID gains for the
+                                position loop are computed from the fitted gain and slowest time constant
+                                the way autotune.model_gains() does on the board, and can be written to
+                                the gains file the board loads at boot.
+
+                                Usage:
+                                    python -m host.sysid console.log [--cpr 4000] [--order 2]
+                                                         [--bandwidth RAD/S] [--margin 60]
+                                                         [--save gains.json --name "TASK CONTROLLER A"]
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import argparse, json, re
+import numpy as np
+from . import capture
+
+# a data row of the identification table: time, duty, position
+_ROW = re.compile(r'^\s*(-?\d+)\s*,\s*(-?\d+)\s*,\s*(-?\d+)\s*$')
+
+class Run:
+    '''     @brief                  One identification run.
+    '''
+
+    def __init__(self, name, time, duty, position, cpr = capture.DEFAULT_CPR):
+        '''     @brief              Wraps the arrays of a run.
+            @param name         The motor the run was taken on.
+            @param time         Sample times in seconds.
+            @param duty         The duty, in percent, applied after each sample.
+            @param position     Encoder positions in counts.
+            @param cpr          Encoder counts per shaft revolution.
+        '''
+        self.name = name
+        self.time = np.asarray(time, dtype = np.float64)
+        self.duty = np.asarray(duty, dtype = np.float64)
+        self.position = np.asarray(position, dtype = np.int64)
+        self.cpr = int(cpr)
+
+    def __len__(self):
+        return len(self.time)
+
+    def interval_velocity(self):
+        '''     @brief              The mean velocity, in rad/s, over each interval between samples.
+            @return             An array one shorter than the run.
+        '''
+        return np.diff(self.position) * (2 * np.pi / self.cpr) / np.diff(self.time)
+
+def parse_text(text, cpr = capture.DEFAULT_CPR):
+    '''   @brief                  Reads every identification table in a console log.
+       @return                    A list of Runs.
+    '''
+    runs = []
+    rows = None
+    name = ''
+    for line in text.splitlines():
+        if (line.startswith('***System identification of ')):
+            name = line[len('***System identification of '):].split(':')[0]
+            rows = []
+        elif (rows is None):
+            continue
+        elif (line.startswith('***')):
+            if (rows):
+                runs.append(_from_rows(name, rows, cpr))
+            rows = None
+        else:
+            match = _ROW.match(line)
+            if (match):
+                rows.append(match.groups())
+    if (rows):
+        runs.append(_from_rows(name, rows, cpr))
+    return runs
+
+def _from_rows(name, rows, cpr):
+    table = np.array(rows, dtype = np.int64)
+    return Run(name, table[:, 0] / 1e6, table[:, 1], table[:, 2], cpr)
+
+def _lagged(values, lag, n, start):
+    # values[k - lag] for k = start .. start + n - 1
+    return values[start - lag:start - lag + n]
+
+def fit(run, order = 1):
+    '''   @brief                  Fits a first or second order model to a run.
+       @param run                 A Run.
+       @param order               1 or 2.
+       @return                    A dict with the coefficients a and b, the friction coefficient c,
+                                  gain [rad/s per %], time_constants [s], friction [% duty],
+                                  deadband [% duty], the nominal period [s], rms [rad/s] and r2
+                                  of the one-step prediction, and the number of samples used.
+    '''
+    if (order not in (1, 2)):
+        raise ValueError('The model order must be 1 or 2')
+    w = run.interval_velocity()
+    u = run.duty[:-1]
+    dt = np.diff(run.time)
+    period = np.median(dt)
+
+    # one equation for each interval with order earlier intervals before it
+    start = order
+    n = len(w) - start
+    if (n < 4 * order + 2):
+        raise ValueError('The run is too short for a model of order {:}'.format(order))
+    regular = np.abs(dt / period - 1) <= 0.2
+    keep = np.ones(n, dtype = bool)
+    for lag in range(order + 1):
+        keep &= _lagged(regular, lag, n, start)
+
+    columns = [_lagged(w, lag, n, start) for lag in range(1, order + 1)]
+    columns += [_lagged(u, lag, n, start) for lag in range(order + 1)]
+    columns.append(np.sign(_lagged(w, 1, n, start)))
+    X = np.column_stack(columns)[keep]
+    y = _lagged(w, 0, n, start)[keep]
+
+    theta, _, _, _ = np.linalg.lstsq(X, y, rcond = None)
+    a = theta[:order]
+    b = theta[order:2 * order + 1]
+    c = theta[-1]
+
+    residual = y - X @ theta
+    spread = np.sum((y - y.mean()) ** 2)
+    r2 = 1 - np.sum(residual ** 2) / spread if spread > 0 else np.nan
+
+    bsum = b.sum()
+    gain = bsum / (1 - a.sum())
+    # the poles are the roots of z^n - a1 z^(n-1) - ... - an
+    poles = np.roots(np.concatenate(([1.0], -a)))
+    constants = [-period / np.log(p.real) for p in poles
+                 if abs(p.imag) < 1e-9 and 0 < p.real < 1]
+
+    return {'a': a, 'b': b, 'c': c,
+            'gain': gain,
+            'time_constants': sorted(constants, reverse = True),
+            'poles': poles,
+            'friction': -c / bsum if bsum != 0 else np.nan,
+            'deadband': deadband(run),
+            'period': period,
+            'rms': np.sqrt(np.mean(residual ** 2)),
+            'r2': r2,
+            'samples': len(y)}
+
+def deadband(run, hold = 5, rest = 0.5):
+    '''   @brief                  The largest duty held without the shaft moving.
+       @param run                 A Run.
+       @param hold                The number of intervals the duty and rest must last.
+       @param rest                The speed, in rad/s, below which the shaft counts as at rest.
+       @return                    The deadband in percent duty, 0 if the shaft always moved.
+    '''
+    w = run.interval_velocity()
+    u = run.duty[:-1]
+    if (len(w) < hold):
+        return 0.0
+    # intervals at rest under the same duty as the interval before
+    quiet = (np.abs(w) < rest) & np.concatenate(([False], u[1:] == u[:-1]))
+    # window j covers intervals j .. j + hold - 1, all quiet, under duty u[j]
+    ok = np.convolve(quiet.astype(int), np.ones(hold, dtype = int), mode = 'valid') == hold
+    if (not np.any(ok)):
+        return 0.0
+    return float(np.max(np.abs(u[:len(ok)][ok])))
+
+def model_gains(gain, tau, bandwidth, margin = 60):
+    '''   @brief                  PID gains placing the poles of gain / (s (tau s + 1)).
+       @details                   Must match autotune.model_gains(), which cannot be imported here.
+       @param gain                The plant's speed per duty, in counts/s per percent.
+       @param tau                 The plant's time constant in seconds.
+       @param bandwidth           The closed-loop bandwidth in rad/s.
+       @param margin              The phase margin in degrees.
+       @return                    A (Kp, Ki, Kd) tuple in %duty/count, %duty/(count*s), %duty*s/count.
+    '''
+    if (gain <= 0 or tau <= 0 or bandwidth <= 0):
+        raise ValueError('Plant gain, time constant and bandwidth must be positive')
+    zeta = margin / 100
+    w = bandwidth
+    kp = tau * (1 + 2 * zeta) * w * w / gain
+    ki = tau * w * w * w / gain
+    kd = max(0.0, (tau * (1 + 2 * zeta) * w - 1) / gain)
+    return (kp, ki, kd)
+
+def save_gains(path, name, gains):
+    '''   @brief                  Writes gains under a name in the board's gains file, keeping the others.
+    '''
+    try:
+        with open(path) as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        table = {}
+    table[name] = [float(g) for g in gains]
+    with open(path, 'w') as f:
+        json.dump(table, f)
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Fit a motor model to identification runs.')
+    parser.add_argument('file', help = 'a console log holding task_sysid.py tables')
+    parser.add_argument('--cpr', type = int, default = capture.DEFAULT_CPR,
+                        help = 'encoder counts per revolution')
+    parser.add_argument('--order', type = int, default = 1, choices = (1, 2), help = 'model order')
+    parser.add_argument('--bandwidth', type = float,
+                        help = 'compute position loop gains for this closed-loop bandwidth in rad/s')
+    parser.add_argument('--margin', type = float, default = 60, help = 'phase margin in degrees')
+    parser.add_argument('--save', help = 'write the gains of the first run to this gains file')
+    parser.add_argument('--name', default = 'TASK CONTROLLER A', help = 'the controller to save them for')
+    args = parser.parse_args(argv)
+
+    with open(args.file, 'r', errors = 'replace') as f:
+        runs = parse_text(f.read(), args.cpr)
+    if (not runs):
+        parser.error('no identification table in {:}'.format(args.file))
+
+    results = []
+    for run in runs:
+        result = fit(run, args.order)
+        print('{:}: {:} samples, order {:} model (r2 {:.4f}, rms {:.3f} rad/s)'.format(
+              run.name, result['samples'], args.order, result['r2'], result['rms']))
+        print('  gain           {:.4f} rad/s per % duty'.format(result['gain']))
+        print('  time constants {:}'.format(', '.join('{:.4f} s'.format(t) for t in result['time_constants'])
+                                          or 'none real'))
+        print('  friction       {:.2f} % duty'.format(result['friction']))
+        print('  deadband       {:.0f} % duty'.format(result['deadband']))
+        if (args.bandwidth):
+            try:
+                result['gains'] = model_gains(result['gain'] * args.cpr / (2 * np.pi),
+                                              result['time_constants'][0] if result['time_constants'] else 0,
+                                              args.bandwidth, args.margin)
+            except ValueError as e:
+                print('  no gains: {:}'.format(e))
+            else:
+                print('  PID gains      Kp {:.5f} Ki {:.5f} Kd {:.6f}'.format(*result['gains']))
+        results.append(result)
+
+    if (args.save):
+        if ('gains' not in results[0]):
+            parser.error('--save needs --bandwidth and a model with a real time constant')
+        save_gains(args.save, args.name, results[0]['gains'])
+        print('gains for {:} saved to {:}'.format(args.name, args.save))
+    return results
+
+if __name__ == '__main__':
+    main()
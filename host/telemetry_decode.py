@@ -0,0 +1,184 @@
+''' @file                       host/telemetry_decode.py
+    @brief                      Host-side decoder for the binary telemetry frames written by telemetry.py.
+    @details                    Scans a byte stream for frames, checks their CRC, and collects the samples
+                                into NumPy arrays. Console text interleaved with the frames is skipped.
+                                Sequence numbers are used to count frames lost on the link.
+
+                                Usage:
+                                    python host/telemetry_decode.py capture.bin [-o capture.npz]
+                                    python host/telemetry_decode.py --port /dev/ttyACM0 [-o capture.npz]
+
+                                Reading from a serial port requires pyserial.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import argparse, struct
+import numpy as np
+
+# The frame layout must match telemetry.py on the board
+FRAME_DATA = 1
+FRAME_END = 2
+SYNC = b'\xa5\x5a'
+HEADER_SIZE = 6
+SAMPLE_SIZE = 16
+CRC_SIZE = 2
+SAMPLE_DTYPE = np.dtype([('time', '<u8'), ('position', '<i4'), ('delta', '<i4')])
+
+def crc16(data):
+    '''   @brief                  CRC-16/CCITT-FALSE, as computed on the board.
+       @param data                A bytes-like object.
+       @return                    The 16-bit CRC.
+    '''
+    crc = 0xFFFF
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            if (crc & 0x8000):
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+    return crc
+
+class Decoder:
+    '''     @brief                  Incremental frame decoder; feed() it bytes as they arrive.
+    '''
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._chunks = []
+        self._lastSeq = None
+        ## Frames accepted
+        self.frames = 0
+        ## Frames whose CRC did not match
+        self.crcErrors = 0
+        ## Frames missing according to the sequence numbers
+        self.lostFrames = 0
+        ## Completed captures, each a structured array of samples
+        self.captures = []
+
+    def feed(self, data):
+        '''     @brief              Adds bytes to the decoder and parses every complete frame.
+            @param data         The newly received bytes.
+        '''
+        self._buffer.extend(data)
+        buf = self._buffer
+        pos = 0
+        while (True):
+            start = buf.find(SYNC, pos)
+            if (start < 0):
+                # keep a trailing first sync byte in case the second is on its way
+                pos = len(buf) - 1 if buf.endswith(SYNC[:1]) else len(buf)
+                break
+            if (start + HEADER_SIZE > len(buf)):
+                pos = start
+                break
+            frameType, seq, n = struct.unpack_from('<BHB', buf, start + 2)
+            end = start + HEADER_SIZE + n * SAMPLE_SIZE
+            if (frameType not in (FRAME_DATA, FRAME_END)):
+                pos = start + 1
+                continue
+            if (end + CRC_SIZE > len(buf)):
+                pos = start
+                break
+            (crc,) = struct.unpack_from('<H', buf, end)
+            if (crc != crc16(buf[start + 2:end])):
+                self.crcErrors += 1
+                pos = start + 1
+                continue
+
+            self._accept(frameType, seq, bytes(buf[start + HEADER_SIZE:end]))
+            pos = end + CRC_SIZE
+        del buf[:pos]
+
+    def _accept(self, frameType, seq, payload):
+        if (self._lastSeq is not None):
+            self.lostFrames += (seq - self._lastSeq - 1) & 0xFFFF
+        self._lastSeq = seq
+        self.frames += 1
+        if (payload):
+            self._chunks.append(np.frombuffer(payload, dtype = SAMPLE_DTYPE))
+        if (frameType == FRAME_END):
+            self.captures.append(self._collect())
+
+    def _collect(self):
+        if (self._chunks):
+            samples = np.concatenate(self._chunks)
+        else:
+            samples = np.zeros(0, dtype = SAMPLE_DTYPE)
+        self._chunks = []
+        return samples
+
+    def finish(self):
+        '''     @brief              Returns every capture, including one cut off before its end frame.
+            @return             A list of dicts of NumPy arrays: time [s], position and delta [counts].
+        '''
+        if (self._chunks):
+            self.captures.append(self._collect())
+        return [to_arrays(c) for c in self.captures]
+
+def to_arrays(samples):
+    '''   @brief                  Splits a structured sample array into plain arrays.
+       @param samples             A structured array with SAMPLE_DTYPE.
+       @return                    A dict with time in seconds and position and delta in counts.
+    '''
+    return {'time': samples['time'] / 1e6,
+            'position': samples['position'].astype(np.int64),
+            'delta': samples['delta'].astype(np.int64)}
+
+def decode(data):
+    '''   @brief                  Decodes a complete recorded stream.
+       @param data                The raw bytes read from the USB_VCP.
+       @return                    A list of captures, each a dict of NumPy arrays.
+    '''
+    decoder = Decoder()
+    decoder.feed(data)
+    return decoder.finish()
+
+def read_port(port, baudrate = 115200):
+    '''   @brief                  Reads frames from a serial port until an end frame arrives.
+       @param port                The serial device, e.g. /dev/ttyACM0.
+       @return                    The Decoder holding the captures.
+    '''
+    import serial
+    decoder = Decoder()
+    with serial.Serial(port, baudrate, timeout = 1) as link:
+        while (not decoder.captures):
+            decoder.feed(link.read(4096))
+    return decoder
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = 'Decode binary telemetry captures.')
+    parser.add_argument('file', nargs = '?', help = 'a file holding the recorded stream')
+    parser.add_argument('--port', help = 'read live from this serial port instead')
+    parser.add_argument('-o', '--output', help = 'save the captures to this .npz file')
+    args = parser.parse_args(argv)
+
+    if (args.port):
+        decoder = read_port(args.port)
+    elif (args.file):
+        decoder = Decoder()
+        with open(args.file, 'rb') as f:
+            decoder.feed(f.read())
+    else:
+        parser.error('give a file or --port')
+
+    captures = decoder.finish()
+    print('{:} frames, {:} CRC errors, {:} frames lost'.format(decoder.frames, decoder.crcErrors,
+                                                             decoder.lostFrames))
+    for index, capture in enumerate(captures):
+        print('capture {:}: {:} samples over {:.3f} s'.format(
+            index, len(capture['time']), capture['time'][-1] if len(capture['time']) else 0.0))
+
+    if (args.output):
+        arrays = {}
+        for index, capture in enumerate(captures):
+            for key, value in capture.items():
+                arrays['{:}_{:}'.format(key, index)] = value
+        np.savez_compressed(args.output, **arrays)
+    return captures
+
+if __name__ == '__main__':
+    main()
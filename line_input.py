@@ -0,0 +1,111 @@
+''' @file                       line_input.py
+    @brief                      Non-blocking numeric line editor for the USB_VCP console.
+    @details                    A NumericInput collects a signed integer one keystroke at a time. Each
+                                call to poll() consumes whatever bytes are waiting and returns at once,
+                                so a task can call it on every scheduled run without holding up the
+                                other tasks while someone types. Digits are echoed, backspace erases,
+                                a minus sign is only accepted first, and Enter completes the entry,
+                                which is then clamped to the allowed range.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+from micropython import const
+
+_BACKSPACE = const(0x08)
+_DELETE = const(0x7F)
+_CR = const(0x0D)
+_LF = const(0x0A)
+_MINUS = const(0x2D)
+_ZERO = const(0x30)
+_NINE = const(0x39)
+
+class NumericInput:
+    '''     @brief                  Accumulates a signed integer across scheduler passes.
+    '''
+
+    def __init__(self, ser, low, high, maxDigits = 3):
+        '''     @brief              Constructs a line editor on a serial port.
+            @param ser          A pyb.USB_VCP to read from and echo to.
+            @param low          The smallest value an entry is clamped to.
+            @param high         The largest value an entry is clamped to.
+            @param maxDigits    The most digits accepted; further digits are ignored.
+        '''
+        self.ser = ser
+        self.low = low
+        self.high = high
+        self.maxDigits = maxDigits
+        self._buffer = bytearray(maxDigits + 1)
+        self._char = bytearray(1)
+        self._length = 0
+        ## The parsed entry once poll() has returned True; None if the line was empty
+        self.value = None
+
+    def start(self, prompt = None):
+        '''     @brief              Clears the line and optionally prints a prompt.
+            @param prompt       Text printed without a newline before the entry.
+        '''
+        self._length = 0
+        self.value = None
+        if (prompt is not None):
+            print(prompt, end = '')
+
+    def poll(self):
+        '''     @brief              Consumes any waiting keystrokes without blocking.
+            @return             True once Enter has been pressed; the entry is in value.
+        '''
+        while (self.ser.any()):
+            if (not self.ser.readinto(self._char, 1)):
+                break
+            c = self._char[0]
+
+            if (c == _CR or c == _LF):
+                self.value = self._parse()
+                self._length = 0
+                print()
+                return True
+
+            elif (c == _BACKSPACE or c == _DELETE):
+                if (self._length > 0):
+                    self._length -= 1
+                    print('\b \b', end = '')
+
+            elif (c == _MINUS):
+                if (self._length == 0):
+                    self._append(c)
+
+            elif (_ZERO <= c <= _NINE):
+                digits = self._length
+                if (digits > 0 and self._buffer[0] == _MINUS):
+                    digits -= 1
+                if (digits < self.maxDigits):
+                    self._append(c)
+
+        return False
+
+    def _append(self, c):
+        self._buffer[self._length] = c
+        self._length += 1
+        print(chr(c), end = '')
+
+    def _parse(self):
+        sign = 1
+        start = 0
+        if (self._length > 0 and self._buffer[0] == _MINUS):
+            sign = -1
+            start = 1
+        if (start >= self._length):
+            return None
+
+        value = 0
+        for i in range(start, self._length):
+            value = value * 10 + self._buffer[i] - _ZERO
+        value *= sign
+
+        if (value > self.high):
+            value = self.high
+        elif (value < self.low):
+            value = self.low
+        return value
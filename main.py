@@ -7,153 +7,137 @@
 
     @date                       January 24, 2023
 '''
-import motor_driver, encoder, pyb, time
+import axis_group, shares, command_bus, scheduler, telemetry, gc_manager, excitation, autotune, pyb
+from task_user import Task_User
+from task_encoder import Task_Encoder
+from task_motor import Task_Motor
+from task_motorDriver import Task_motorDriver
+from task_controller import Task_Controller
+from task_sysid import Task_SysID
+
+## The pins and timers of each axis; add a row to add an axis. Encoder B counts on
+## timer 8 because timer 3 already drives the motor A inputs. The L6206 reports
+## faults by pulling its enable line low, so each axis uses its enable pin as the fault line.
+## For low-speed velocity, wire encoder channel A to a channel of a 32-bit timer as well and
+## add e.g. 'capPin': 'A5', 'capTimer': 2, 'capChannel': 1 to the row
+AXES = (
+    {'name': 'A', 'enable': 'A10', 'fault': 'A10', 'in1': 'B4', 'in2': 'B5', 'pwmTimer': 3, 'pwmChannels': (1, 2),
+     'encA': 'B6', 'encB': 'B7', 'encTimer': 4},
+    # {'name': 'B', 'enable': 'C1', 'fault': 'C1', 'in1': 'A0', 'in2': 'A1', 'pwmTimer': 5, 'pwmChannels': (1, 2),
+    #  'encA': 'C6', 'encB': 'C7', 'encTimer': 8},
+)
 
 def main():
     '''   @brief                  Main function to interact with Motors and Encoders.
-       @details                   Enables necessary motor and encoder pins for interaction with the hardware.
-                                  While block with an except allow for the encoder to read and the motor duty cycle to change.
+       @details                   Builds the motor and encoder hardware of every axis in AXES,
+                                  creates the command bus and shares used for inter-task communication and registers every
+                                  task with the scheduler, which then runs them at their periods until a
+                                  keyboard interrupt.
     '''
-        
-    enable1 = pyb.Pin(pyb.Pin.cpu.A10, pyb.Pin.OUT_PP)
-    enable2 = pyb.Pin(pyb.Pin.cpu.C1, pyb.Pin.OUT_PP)
-
-    #defining motor inputs
-    # refactored for ME 405 hardware
-    input1 = pyb.Pin.cpu.B4
-    input2 = pyb.Pin.cpu.B5
-    input3 = pyb.Pin.cpu.A0
-    input4 = pyb.Pin.cpu.A1
-
-    timer1 = pyb.Timer(3, freq = 20000)
-    # timer2 = pyb.Timer(5, freq = 20000)
-
-    #creating motor driver / motor objects
-    # enable pin, input1, input2, timer
-    m1_driver = motor_driver.MotorDriver(enable1, input1, input2, timer1)
-    m1 = m1_driver.motor(input1, input2, 1, 2, "MOTOR A")
-    # m2_driver = motor_driver.MotorDriver(enable2, input3, input4, timer2)
-    # m2 = m2_driver.motor(input3, input4, 1, 2, "MOTOR B")
-
-    print("Initiating encoder hardware...")
-    encoder_A = encoder.Encoder(pyb.Pin.cpu.B6, pyb.Pin.cpu.B7, 4, ID="ENCODER A")
-    # encoder_B = encoder.Encoder(pyb.Pin.cpu.C6, pyb.Pin.cpu.C7, 3, ID="ENCODER B")
+
+    # task periods, in microseconds
+    userPeriod = 10000
+    encoderPeriod = 2000
+    motorPeriod = 10000
+
+    print("Initiating motor and encoder hardware...")
+    # the duty may change by at most dutySlew percent per group run, so reversals
+    # ramp through zero instead of stepping across it
+    dutySlew = 5
+    group = axis_group.AxisGroup(AXES, encoderPeriod, slew = dutySlew)
     print("done")
 
+    # commands from the user interface are published on the bus and delivered
+    # to the inbox of each task that serves the addressed axis
+    bus = command_bus.CommandBus()
+    # captured samples travel to Task_User in these queues; they share a capacity
+    # and drop the newest sample when full, so their entries stay aligned
+    captureQueueSize = 64
+    time_queue = shares.Queue(captureQueueSize, 'l', shares.OVF_DROP_NEWEST)
+    position_queue = shares.Queue(captureQueueSize, 'l', shares.OVF_DROP_NEWEST)
+    delta_queue = shares.Queue(captureQueueSize, 'l', shares.OVF_DROP_NEWEST)
+    # names the task reading from the console, or None while Task_User has it
+    console_share = shares.Share()
+
+    # set to stream captured data as binary frames (see host/telemetry_decode.py)
+    # instead of printing a table when the capture ends
+    useTelemetry = False
+    telemetryWriter = telemetry.TelemetryWriter(pyb.USB_VCP()) if useTelemetry else None
+
+    # garbage is collected early in the scheduler's idle time, when no task is due
+    # before the collection would finish; the automatic collector is the backstop
+    gcManager = gc_manager.GCManager()
+    taskScheduler = scheduler.Scheduler(idle = gcManager)
+
+    # the group writes the duty cycles and samples every encoder first whenever it is
+    # due, so sampling keeps its rate even when the user interface is busy
+    taskScheduler.add_task(group, priority = 4, policy = scheduler.POLICY_CATCH_UP)
+
+    # the system identification signal: small duty steps for the deadband, larger ones
+    # for the gain and time constant, a chirp for the bandwidth and a PRBS for
+    # everything in between
+    sysidTable = excitation.concat(excitation.step_train((5, 10, 15, 30, 60, 0, -30, -60, 0), 0.15, encoderPeriod),
+                                   excitation.chirp(40, 0.5, 20, 1.0, encoderPeriod),
+                                   excitation.prbs(40, 1.0, encoderPeriod, hold = 5))
+
+    for index in range(len(group)):
+        name = group.names[index]
+        axis = group.axes[index]
+        enc = group.encoders[index]
+        motor = group.motors[index]
+
+        # position setpoint in encoder counts (None leaves the motor to Task_Motor)
+        # and (Kp, Ki, Kd) gains for the position controller, as last autotuned if they were
+        setpoint_share = shares.Share()
+        gains_share = shares.Share(autotune.load_gains("TASK CONTROLLER " + name, (0.05, 0.2, 0.0005)))
+
+        task_encoder = Task_Encoder("TASK ENCODER " + name, encoderPeriod, enc, bus, axis,
+                                    time_queue, position_queue, delta_queue, group = group)
+        task_motor = Task_Motor("TASK MOTOR " + name, motorPeriod, motor, bus, axis, console_share)
+        task_driver = Task_motorDriver("TASK DRIVER " + name, group.drivers[index], motor, bus, axis, motorPeriod, False)
+        task_controller = Task_Controller("TASK CONTROLLER " + name, encoderPeriod, enc, motor, setpoint_share, gains_share,
+                                          bus = bus, axis = axis)
+
+        taskScheduler.add_task(task_encoder, priority = 3, policy = scheduler.POLICY_CATCH_UP)
+        taskScheduler.add_task(task_controller, priority = 3)
+        # the motor and driver tasks only act on commands, so they are only woken
+        # when a command reaches their inbox or, for the driver, on a fault
+        taskScheduler.add_task(task_motor, priority = 2, waits_on = [task_motor.inbox])
+        taskScheduler.add_task(task_driver, priority = 2, waits_on = [task_driver.inbox, group.drivers[index]])
+
+        # [i/I] plays the identification signal into the motor and prints the
+        # response for host/sysid.py to fit a model to
+        task_sysid = Task_SysID("TASK SYSID " + name, encoderPeriod, enc, motor, bus, axis, sysidTable)
+        taskScheduler.add_task(task_sysid, priority = 3, waits_on = [task_sysid.inbox])
+
+    # the encoder tasks queue one capture sample per run, so the capture buffers
+    # are sized from their period
+    task_user = Task_User("TASK USER", userPeriod, bus, time_queue, position_queue, delta_queue, console_share,
+                          telemetry = telemetryWriter, scheduler = taskScheduler, gcManager = gcManager,
+                          samplePeriod = encoderPeriod)
+    taskScheduler.add_task(task_user, priority = 1)
+
     print("Intializing motors...")
-    # turning on the motor
-    m1_driver.enable()
+    # turning on the motors
+    group.enable()
     print("done")
 
-    print("3...")
-    time.sleep(1)
-    print("2...")
-    time.sleep(1)
-    print("1...")
-    time.sleep(1)
-    # setting motor
-    m1.set_duty(75)
+    # zero encoders
+    group.zero()
 
-    # zero encoder
-    encoder_A.zero()
+    # set to sample the encoders from a timer interrupt at a fixed rate instead of
+    # from the group's scheduled runs
+    useSamplerISR = False
+    if (useSamplerISR):
+        group.start_sampler(6, 1000)
 
-    # reading encoder
-    
+    gcManager.start()
     try:
-        while True:
-            encoder_A.update()
-            print(encoder_A.read())
-            time.sleep(.1)  # sleep for 0.1 seconds
+        taskScheduler.run_forever()
     except KeyboardInterrupt:
             print('exiting...')
-            m1.set_duty(0)
-
-    
-    '''
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    m1.set_duty(25)
-    time.sleep(1)
-
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(50)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(75)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(100)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(75)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(50)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(25)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(0)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-25)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-50)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-75)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-100)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-75)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-50)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(-25)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    m1.set_duty(0)
-    time.sleep(1)
-    encoder_A.update()
-    print("Encoder position: " + str(encoder_A.read()))
-    time.sleep(1)
-    '''
+            group.stop()
+            gcManager.stop()
 
     # print("Motors and encoders are ready for commands")
 if __name__ == '__main__':
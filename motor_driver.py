@@ -4,7 +4,9 @@
                                        provides functionality to the nSleep pin to enable/disable either
                                        1 stepper motor or 2 DC motors.  Driver provides fault reset functionality
                                        and internally creates virtual motor objects based on user implementation.  
-                                       Includes MotorDriver class and Motor class.
+                                       Includes MotorDriver class and Motor class. Given its fault line, a
+                                       MotorDriver disables the bridge from a hardware interrupt the moment the
+                                       L6206 reports a fault and records the event in a fixed-size fault log.
    @author                             Jason Davis
    @author                             Conor Fraser
    @author                             Adam Westfall
@@ -13,17 +15,33 @@
 '''
 
 
-import pyb, time
+import pyb, utime, time, micropython
+from array import array
+from micropython import const
+
+# room for a traceback if the fault callback ever raises
+micropython.alloc_emergency_exception_buf(100)
+
+## Number of faults kept in a driver's fault log
+FAULT_LOG_SIZE = const(8)
+## Time, in microseconds, a shared enable/fault line is given to rise through the chip's RC network
+ENABLE_SETTLE_US = const(5000)
 
 class MotorDriver:
     
-    def __init__(self, en_pin, in1pin, in2pin, timer): 
+    def __init__(self, en_pin, in1pin, in2pin, timer, fault_pin = None, logSize = FAULT_LOG_SIZE): 
         '''   @brief                           Constructor for L6206 motor driver hardware
-           @details                            Constructor for L6206 motor driver hardware   
-           @param en_pin                       Encoder Pin
+           @details                            Constructor for L6206 motor driver hardware. If a fault pin is given, a falling
+                                               edge on it runs fault_cb() as a hardware interrupt. On the L6206 shield the
+                                               open-drain fault output shares the enable line; pass the enable pin as the
+                                               fault pin and it is switched to open drain with a pull-up so the chip can
+                                               pull it low.
+           @param en_pin                       Enable Pin
            @param in1pin                       Motor Pin 1
            @param in2pin                       Motor Pin 2
            @param timer                        Defines the hardware timer used with the motorDriver
+           @param fault_pin                    The cpu pin of the active-low fault line, or None.
+           @param logSize                      The number of faults kept in the fault log.
         '''
         
         # enable pin
@@ -36,19 +54,101 @@ class MotorDriver:
         # initializing timer
         self.timer = timer
         
+        ## The motors created by motor(), whose applied duty is logged with each fault
+        self.motors = []
+        ## The encoder.Encoder whose state is logged with each fault, if any
+        self.encoder = None
+        
+        ## True from a fault until clearFaultCondition(); enable() refuses while set
+        self.faulted = False
+        ## The number of faults since power-up
+        self.faultCount = 0
+        ## The longest time, in microseconds, fault_cb() took to write the enable pin low; the
+        ## delay from the fault edge to the interrupt running is not included
+        self.writeTimeMax = 0
+        # True while the bridge is enabled on purpose, so that our own disable() is not a fault
+        self._armed = False
+        ## True from enable() until check_fault() has seen the shared fault line settle
+        self.settling = False
+        # the ticks_us() value of the last enable(), for check_fault()
+        self._enabledAt = 0
+        self._waiters = []
+        
+        # fault log, written only by fault_cb(); entries are reused oldest first
+        self._logSize = logSize
+        self._logIndex = 0
+        self._logTime = array('L', [0] * logSize)
+        self._logWriteTime = array('H', [0] * logSize)
+        self._logDuty = array('b', [0] * (2 * logSize))
+        self._logPosition = array('l', [0] * logSize)
+        self._logVelocity = array('l', [0] * logSize)
+        
+        self.faultInt = None
+        if (fault_pin is not None):
+            # bind the callback once so the interrupt never allocates a bound method
+            self._fault_ref = self.fault_cb
+            self.faultInt = pyb.ExtInt(fault_pin, pyb.ExtInt.IRQ_FALLING, pyb.Pin.PULL_UP, self._fault_ref)
+            if (fault_pin.name() == en_pin.name()):
+                # shared enable/fault line: drive it open drain so the chip can pull it low
+                self.en_pin.init(pyb.Pin.OUT_OD, pyb.Pin.PULL_UP, value = 0)
+        
     def enable (self):
         '''   @brief                           Enable the motors to spin
            @details                            Allows the motors to spin by writing the en_pin
-                                               to logic high
+                                               to logic high, unless a fault is latched. With a shared
+                                               fault line the line is not read back here, since it rises
+                                               through the chip's RC network; a chip that pulls it low
+                                               after release is caught by the falling-edge interrupt, and
+                                               one that never lets it rise is caught by check_fault().
+           @return                             True if the bridge was enabled.
         '''
+        if (self.faulted):
+            return False
+        self._armed = True
+        self.settling = self.faultInt is not None
+        self._enabledAt = utime.ticks_us()
         self.en_pin.high()
+        return True
+    
+    def check_fault (self):
+        '''   @brief                           Latches a fault if the chip holds the fault line low after an enable.
+           @details                            A chip that is still faulted when the bridge is enabled keeps
+                                               the line low, so there is no falling edge for the interrupt. Once
+                                               the line has had ENABLE_SETTLE_US to rise, it is read once and a
+                                               low level is treated as a fault; later faults are left to the
+                                               interrupt. Call periodically while settling is set, outside interrupts.
+           @return                             True if a fault is latched.
+        '''
+        if (not self.settling):
+            return self.faulted
+        if (not self._armed):
+            self.settling = False
+        elif (utime.ticks_diff(utime.ticks_us(), self._enabledAt) >= ENABLE_SETTLE_US):
+            self.settling = False
+            if (not self.en_pin.value()):
+                self.fault_cb(self.faultInt.line())
+        return self.faulted
     
     def disable (self):
         '''   @brief                           Disables motor function
            @details                            Keeps the motors from spinning by writing the en_pin
                                                to logic low
         '''
+        self._armed = False
         self.en_pin.low()
+    
+    def monitor(self, encoder):
+        '''   @brief                           Logs the state of an encoder with every fault.
+           @param encoder                      The encoder.Encoder on the motor this driver runs.
+        '''
+        self.encoder = encoder
+    
+    def add_waiter(self, waiter):
+        '''   @brief                           Registers an object whose ready attribute is set on every fault.
+           @param waiter                       Normally a scheduler.ScheduledTask.
+        '''
+        if (waiter not in self._waiters):
+            self._waiters.append(waiter)
 
 
         
@@ -66,12 +166,43 @@ class MotorDriver:
 
     def fault_cb (self, IRQ_src):
         '''   @brief                           Detects a hardware fault condition
-           @details                            Detects a hardware fault condition and interrupts harware function
-                                               by disabling motor function
+           @details                            Runs as a hard interrupt on a falling edge of the fault line. The bridge
+                                               is disabled first; then the fault is latched, the interrupt is disabled
+                                               until the fault is cleared, and the time the callback started, how long
+                                               the enable pin write took, the applied duties and the encoder state are
+                                               written to the fault log. The ExtInt gives no time for the edge itself, so
+                                               the interrupt entry delay is not measured. Nothing here allocates.
            @param IRQ_src                      The source of the interrupt causing a motor fault
         '''
-        print('  *** FAULT DETECTED! SUSPENDING L6206 HARDWARE OPERATION ***')
-        self.disable()
+        start = utime.ticks_us()
+        self.en_pin.low()
+        writeTime = utime.ticks_diff(utime.ticks_us(), start)
+        if (not self._armed):
+            # the line went low because the bridge was disabled on purpose
+            return
+        self._armed = False
+        self.faulted = True
+        if (self.faultInt is not None):
+            self.faultInt.disable()
+        
+        i = self._logIndex
+        self._logTime[i] = start
+        self._logWriteTime[i] = writeTime
+        for m in range(2):
+            self._logDuty[2 * i + m] = self.motors[m].applied if m < len(self.motors) else 0
+        if (self.encoder is not None):
+            self._logPosition[i] = self.encoder.position
+            self._logVelocity[i] = self.encoder.velocity
+        i += 1
+        if (i >= self._logSize):
+            i = 0
+        self._logIndex = i
+        self.faultCount += 1
+        if (writeTime > self.writeTimeMax):
+            self.writeTimeMax = writeTime
+        
+        for k in range(len(self._waiters)):
+            self._waiters[k].ready = True
         
     def getEnableState(self):
         '''   @brief                           Returns state of the motor.
@@ -80,19 +211,31 @@ class MotorDriver:
         '''
         return self.en_pin.value()
     
-    # def clearFaultCondition(self):
-    #     '''   @brief                           Tests the value of the fault pin 
-    #        @details                            
-    #        @return                             Returns a boolean based on the fault pin
-    #     '''
-        
-    #     faultCondition = self.faultCondition
-    #     print('INITIAL FAULT STATUS: {0}'.format(self.nFAULT))
-    #     if (not self.faultCondition):
-    #           faultCondition = True
-    #           print('MODIFIED FAULT STATUS: {0}'.format(self.nFAULT))
-              
-    #     return faultCondition
+    def clearFaultCondition(self):
+        '''   @brief                           Clears a latched fault and re-arms the fault interrupt.
+           @details                            The bridge stays disabled; call enable() afterwards. If the chip
+                                               still reports the fault, check_fault() latches it again.
+           @return                             True if a fault was latched.
+        '''
+        faultCondition = self.faulted
+        self.faulted = False
+        if (self.faultInt is not None):
+            self.faultInt.enable()
+        return faultCondition
+    
+    def print_faults(self, first = 0):
+        '''   @brief                           Prints the fault log.
+           @param first                        The fault number to start from; older faults that are
+                                               still in the log are skipped.
+        '''
+        oldest = self.faultCount - self._logSize if self.faultCount > self._logSize else 0
+        if (first < oldest):
+            first = oldest
+        for n in range(first, self.faultCount):
+            i = (self._logIndex - (self.faultCount - n)) % self._logSize
+            print('  fault {:}: handled at {:} us, enable pin written in {:} us, duty {:}%/{:}%, position {:}, velocity {:} counts/s'.format(
+                  n + 1, self._logTime[i], self._logWriteTime[i], self._logDuty[2 * i], self._logDuty[2 * i + 1],
+                  self._logPosition[i], self._logVelocity[i]))
     
     ##also sets the direction
     # def set_duty(self, duty):
@@ -129,7 +272,9 @@ class MotorDriver:
            @param motorID                      Identifier for the motor
            @return                             Returns motor object.
         '''
-        return Motor(inputA, inputB, self.timer, channelA, channelB, motorID)
+        motor = Motor(inputA, inputB, self.timer, channelA, channelB, motorID)
+        self.motors.append(motor)
+        return motor
     
 class Motor:
         
@@ -155,12 +300,42 @@ class Motor:
         self.channelB = channelB
         self.motorID = motorID
         
+        ## The compare value for 100% duty, read from the timer once
+        self.top = self.motorTimer.period() + 1
+        
         # initialized to zero (off)
         self.duty = 0
         
         self.isRunning = False
         self.direction = 0
         
+        ## The signed duty in the compare registers; it trails the commanded duty while slewing
+        self.applied = 0
+        ## The largest change of the applied duty per tick, in percent, or 0 for no limit
+        self.slew = 0
+        
+        ## If True, set_duty() only records the duty and an axis_group.AxisGroup
+        ## applies it together with those of the other motors
+        self.deferred = False
+        ## True while a commanded duty has not been staged yet
+        self.pending = False
+        # staged compare register values of the two channels and the values last written
+        self._compare1 = 0
+        self._compare2 = 0
+        self._written1 = -1
+        self._written2 = -1
+        
+    def set_slew(self, slew):
+        '''   @brief                           Limits how fast the applied duty cycle may change.
+           @details                            With a limit, each tick moves the applied duty at most slew percent
+                                               toward the commanded duty, so reversals ramp through zero instead
+                                               of stepping across it.
+           @param slew                         The largest change per tick in percent, or 0 for no limit.
+        '''
+        if (slew < 0):
+            raise ValueError('Slew limit must not be negative')
+        self.slew = int(slew)
+        
     def getMotorID(self):
         '''   @brief                           Returns Motor ID
            @details                            Returns Motor ID
@@ -177,31 +352,87 @@ class Motor:
     
     def set_duty(self, duty):
         '''   @brief                           Sets Motor Duty Cycle.
-           @details                            Includes a set of if and elif blocks to establish the direction of the motor 
-                                               as well as setting the duty cycle of the motor.
-           @param duty                         Duty cycle parsed in from user input.
+           @details                            Records the commanded duty and direction, converts the duty to integer
+                                               compare values and writes only the channels whose value changed, the
+                                               channel being switched off first. With a slew limit only one step is
+                                               applied here; tick() applies the rest. A deferred motor is not written
+                                               until its AxisGroup calls tick() and write().
+           @param duty                         Duty cycle in percent, from -100 to 100.
         '''
-        
+        duty = int(duty)
         if (duty > 0):
             self.duty = duty
             self.direction = 1
-            #set the "reverse" channel to zero first
-            self.channel1.pulse_width_percent(0)
-            self.channel2.pulse_width_percent(duty)
-            
         elif (duty < 0):
-            duty *= -1
-            self.duty = duty
+            self.duty = -duty
             self.direction = -1
-            #set the "forward channel to zero first
-            self.channel2.pulse_width_percent(0)
-            self.channel1.pulse_width_percent(duty)
-            
-        elif (duty == 0):
-            self.duty = duty
+        else:
+            self.duty = 0
             self.direction = 0
-            self.brake()
-            # print("{0} is stationary\n".format(self.motorID))
+        self.pending = True
+        
+        if (not self.deferred):
+            self.tick()
+            self.write()
+
+    def tick(self):
+        '''   @brief                           Moves the applied duty one step toward the commanded duty.
+           @details                            Call once per control tick while slewing; without a slew limit the
+                                               first call reaches the commanded duty.
+           @return                             True while the applied duty still trails the commanded duty.
+        '''
+        target = self.duty * self.direction
+        applied = self.applied
+        if (applied == target and not self.pending):
+            return False
+        self.pending = False
+        if (self.slew > 0):
+            if (target > applied + self.slew):
+                target = applied + self.slew
+            elif (target < applied - self.slew):
+                target = applied - self.slew
+        self.stage(target)
+        return target != self.duty * self.direction
+
+    def stage(self, duty):
+        '''   @brief                           Stages an applied duty cycle without touching the timer.
+           @details                            Converts the duty to the two integer compare register values, in the
+                                               same channel order as before: forwards drives channel 2, reverse
+                                               channel 1, and zero brakes. write() loads them into the timer.
+           @param duty                         The signed integer duty cycle to apply, in percent.
+        '''
+        top = self.top
+        self.applied = duty
+        if (duty > 0):
+            self._compare1 = 0
+            self._compare2 = duty * top // 100
+        elif (duty < 0):
+            self._compare1 = -duty * top // 100
+            self._compare2 = 0
+        else:
+            # brake
+            self._compare1 = top
+            self._compare2 = top
+    
+    def write(self):
+        '''   @brief                           Loads the staged compare values into the timer channels.
+           @details                            Channels already holding their staged value are not written.
+        '''
+        # the channel being switched off is written first
+        if (self.applied < 0):
+            if (self._compare2 != self._written2):
+                self.channel2.pulse_width(self._compare2)
+                self._written2 = self._compare2
+            if (self._compare1 != self._written1):
+                self.channel1.pulse_width(self._compare1)
+                self._written1 = self._compare1
+        else:
+            if (self._compare1 != self._written1):
+                self.channel1.pulse_width(self._compare1)
+                self._written1 = self._compare1
+            if (self._compare2 != self._written2):
+                self.channel2.pulse_width(self._compare2)
+                self._written2 = self._compare2
 
     def getDirection(self):
         '''   @brief                           Returns spinning motor direction.
@@ -227,15 +458,19 @@ class Motor:
         '''   @brief                           Sets motor duty cycle to zero.
            @details                            Both motor channels have duty cycles set to zero.
         '''
-        self.channel1.pulse_width_percent(0)
-        self.channel2.pulse_width_percent(0)
+        self.channel1.pulse_width(0)
+        self.channel2.pulse_width(0)
+        self._written1 = 0
+        self._written2 = 0
     
     def brake(self):
         '''   @brief                           Applies 100% duty cycle to the motors.
            @details                            Both motor channels have duty cycles set to 100% to brake the motors quickly.
         '''
-        self.channel1.pulse_width_percent(100)
-        self.channel2.pulse_width_percent(100)
+        self.channel1.pulse_width(self.top)
+        self.channel2.pulse_width(self.top)
+        self._written1 = self.top
+        self._written2 = self.top
         
 if __name__ == '__main__' :
     
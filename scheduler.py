@@ -0,0 +1,270 @@
+''' @file                       scheduler.py
+    @brief                      Priority-based cooperative scheduler for the Task_* classes.
+    @details                    The Scheduler owns all task timing. Tasks are registered with a
+                                period and a priority and the scheduler calls each task's run()
+                                method only when it is due, so the tasks themselves no longer read
+                                the timer or track next_time. On every pass the timer is read once
+                                and the highest priority due task is run; ties are broken by
+                                registration order. A task that falls behind either catches up by
+                                running once per missed period or skips the missed periods,
+                                depending on the policy it was registered with. Unless profiling is
+                                turned off, every run is timed: execution time, start latency, a latency
+                                histogram, overruns and deadline misses are kept per task in fixed-size
+                                counters, and report() prints them with each task's CPU utilization.
+                                A task registered with waits_on is event-driven: it is only run when one
+                                of those shares or inboxes has been written since its last run, or when its previous
+                                run() returned True to ask for another pass, and never more often than its
+                                period. An idle handler, such as a gc_manager.GCManager, can be given to
+                                the scheduler; it is called on every pass that finds nothing due, with
+                                the slack until the next release. The scheduler keeps a
+                                timebase.Timebase up to date on every pass, so its wrap-free time can be
+                                shared with the tasks.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import utime, timebase
+from array import array
+from micropython import const
+
+## Missed-period policy: run back to back until every missed period is served
+POLICY_CATCH_UP = const(0)
+## Missed-period policy: run once, then realign to the next future period
+POLICY_SKIP = const(1)
+
+## Number of bins in the start-latency histogram
+LATENCY_BINS = const(12)
+## Upper edge, in microseconds, of the first latency bin; each further bin doubles it
+LATENCY_BIN0 = const(16)
+## The slack reported when no task has a pending release
+SLACK_MAX = const(1 << 29)
+
+class ScheduledTask:
+    '''     @brief                  Bookkeeping for one task registered with the Scheduler.
+        @details                Holds the task object together with its period, priority,
+                                missed-period policy and the ticks_us() value of its next release.
+    '''
+
+    def __init__(self, task, period, priority, policy, next_time):
+        '''     @brief              Constructs the bookkeeping entry for a task.
+            @param task         Any object with a run() method.
+            @param period       The period, in microseconds, between runs of the task.
+            @param priority     Larger numbers run first when several tasks are due.
+            @param policy       POLICY_CATCH_UP or POLICY_SKIP.
+            @param next_time    The utime.ticks_us() value of the first release.
+        '''
+        self.task = task
+        self.period = period
+        self.priority = priority
+        self.policy = policy
+        self.next_time = next_time
+
+        ## False while an event-driven task has nothing to do; set by shares.Share.write()
+        self.ready = True
+        ## True if the task only runs when woken
+        self.eventDriven = False
+
+        ## Start-latency histogram; bin k counts latencies below LATENCY_BIN0 << k,
+        ## the last bin everything longer
+        self.histogram = array('L', [0] * LATENCY_BINS)
+        self.reset_stats()
+
+    def reset_stats(self):
+        '''     @brief              Clears the run counters and timing statistics.
+        '''
+        ## The number of times the task has been run
+        self.runs = 0
+        ## The number of periods dropped by POLICY_SKIP
+        self.skipped = 0
+        ## Total, shortest and longest execution time of run(), in microseconds
+        self.execTotal = 0
+        self.execMin = 0
+        self.execMax = 0
+        ## Longest delay between release and start, in microseconds
+        self.latencyMax = 0
+        ## Runs whose execution time exceeded the period
+        self.overruns = 0
+        ## Runs that started a whole period or more after their release
+        self.misses = 0
+        for i in range(LATENCY_BINS):
+            self.histogram[i] = 0
+
+    def record(self, latency, execTime):
+        '''     @brief              Adds one run to the timing statistics.
+            @param latency      Microseconds between the release and the start of the run.
+            @param execTime     Microseconds spent in run().
+        '''
+        if (self.runs == 0 or execTime < self.execMin):
+            self.execMin = execTime
+        if (execTime > self.execMax):
+            self.execMax = execTime
+        self.execTotal += execTime
+        if (latency > self.latencyMax):
+            self.latencyMax = latency
+        if (execTime > self.period):
+            self.overruns += 1
+        if (latency >= self.period):
+            self.misses += 1
+
+        k = 0
+        edge = LATENCY_BIN0
+        while (latency >= edge and k < LATENCY_BINS - 1):
+            edge <<= 1
+            k += 1
+        self.histogram[k] += 1
+
+class Scheduler:
+    '''     @brief                  Runs registered tasks at their periods in priority order.
+        @details                Call run() repeatedly from the main loop, or call run_forever().
+    '''
+
+    def __init__(self, profile = True, idle = None, clock = None):
+        '''     @brief              Constructs an empty scheduler.
+            @param profile      If True, time every run for report().
+            @param idle         An optional object whose idle(slack) method is called when
+                                no task is due, with the microseconds until the next release.
+            @param clock        The timebase.Timebase to keep updated, or None for a new one.
+        '''
+        ## The wrap-free timebase, updated on every pass
+        self.clock = clock if clock is not None else timebase.Timebase()
+        ## Registered tasks, kept sorted from highest to lowest priority
+        self.tasks = []
+        ## A flag indicating if task runs are timed
+        self.profile = profile
+        ## The timebase mark of when the statistics were last cleared
+        self.statsStart = self.clock.mark(utime.ticks_us())
+        ## The idle handler, or None
+        self.idle = idle
+
+    def add_task(self, task, period = None, priority = 0, policy = POLICY_SKIP, waits_on = None):
+        '''     @brief              Registers a task with the scheduler.
+            @details            The first run of the task is one period after registration.
+            @param task         Any object with a run() method.
+            @param period       The period, in microseconds, between runs. Defaults to
+                                task.period.
+            @param priority     Larger numbers run first when several tasks are due.
+            @param policy       POLICY_CATCH_UP or POLICY_SKIP.
+            @param waits_on     An optional list of shares.Share or command_bus.Inbox objects,
+                                or anything else with an add_waiter() method. If given, the
+                                task only runs after one of them is written, or while its
+                                run() keeps returning True.
+            @return             The ScheduledTask entry created for the task.
+        '''
+        if (period is None):
+            period = task.period
+        if (period <= 0):
+            raise ValueError('Task period must be positive')
+        if (policy not in (POLICY_CATCH_UP, POLICY_SKIP)):
+            raise ValueError('Invalid missed-period policy {:}'.format(policy))
+
+        entry = ScheduledTask(task, period, priority, policy,
+                              utime.ticks_add(utime.ticks_us(), period))
+        if (waits_on):
+            entry.eventDriven = True
+            entry.ready = False
+            for share in waits_on:
+                share.add_waiter(entry)
+
+        # insert after every task of equal or higher priority so that ties
+        # keep their registration order
+        index = 0
+        while (index < len(self.tasks) and self.tasks[index].priority >= priority):
+            index += 1
+        self.tasks.insert(index, entry)
+        return entry
+
+    def run(self):
+        '''     @brief              Runs the highest priority task that is due, if any.
+            @details            Reads the timer once and scans the tasks in priority order.
+            @return             True if a task was run, False if nothing was due, in which
+                                case the idle handler has been called.
+        '''
+        now = utime.ticks_us()
+        self.clock.update(now)
+        for entry in self.tasks:
+            if (not entry.ready):
+                continue
+            late = utime.ticks_diff(now, entry.next_time)
+            if (late >= 0):
+                if (entry.eventDriven):
+                    # a task woken after sitting idle is released now, not at its
+                    # stale next_time; clear ready first so a write made during
+                    # run() is not lost
+                    if (late >= entry.period):
+                        entry.next_time = now
+                        late = 0
+                    entry.ready = False
+                    if (entry.task.run()):
+                        entry.ready = True
+                else:
+                    entry.task.run()
+                if (self.profile):
+                    entry.record(late, utime.ticks_diff(utime.ticks_us(), now))
+                entry.runs += 1
+                entry.next_time = utime.ticks_add(entry.next_time, entry.period)
+
+                # skip any whole periods that were missed entirely
+                if (entry.policy == POLICY_SKIP and late >= entry.period):
+                    missed = late // entry.period
+                    entry.next_time = utime.ticks_add(entry.next_time, missed * entry.period)
+                    entry.skipped += missed
+                return True
+        if (self.idle is not None):
+            self.idle.idle(self.slack(now))
+        return False
+
+    def slack(self, now):
+        '''     @brief              Finds the time until the next release.
+            @details            Event-driven tasks that have not been woken are not counted,
+                                since a wake-up from an interrupt cannot be foreseen.
+            @param now          A utime.ticks_us() value.
+            @return             Microseconds from now until the earliest release, or SLACK_MAX.
+        '''
+        slack = SLACK_MAX
+        for entry in self.tasks:
+            if (entry.ready):
+                wait = utime.ticks_diff(entry.next_time, now)
+                if (wait < slack):
+                    slack = wait
+        return slack
+
+    def reset_stats(self):
+        '''     @brief              Clears the timing statistics of every task.
+        '''
+        for entry in self.tasks:
+            entry.reset_stats()
+        self.statsStart = self.clock.mark(utime.ticks_us())
+
+    def report(self):
+        '''     @brief              Prints the timing statistics of every task.
+            @details            Times are in microseconds. CPU is the share of the time since the
+                                statistics were cleared that was spent in the task's run().
+        '''
+        elapsed = self.clock.elapsed(utime.ticks_us(), self.statsStart)
+        print('+-------------------------------------------------------------------------------+')
+        print('| Task                 Period    Runs  Exec min/avg/max      Lat max  Ovr  Miss  CPU%')
+        print('+-------------------------------------------------------------------------------+')
+        total = 0
+        for entry in self.tasks:
+            name = getattr(entry.task, 'taskID', type(entry.task).__name__)
+            average = entry.execTotal // entry.runs if entry.runs else 0
+            cpu = entry.execTotal * 100 / elapsed if elapsed > 0 else 0
+            total += cpu
+            print('| {:<20} {:>6} {:>7}  {:>5}/{:>5}/{:>6}  {:>7} {:>4} {:>5} {:>5.1f}'.format(
+                  name, entry.period, entry.runs, entry.execMin, average, entry.execMax,
+                  entry.latencyMax, entry.overruns, entry.misses, cpu))
+            bins = ''
+            for count in entry.histogram:
+                bins += ' {:}'.format(count)
+            print('|     latency histogram (<{:}us, doubling):{:}'.format(LATENCY_BIN0, bins))
+        print('+-------------------------------------------------------------------------------+')
+        print('| Total CPU utilization {:.1f}% over {:.2f} s'.format(total, elapsed / 1000000))
+        print('+-------------------------------------------------------------------------------+\n')
+
+    def run_forever(self):
+        '''     @brief              Runs the scheduler until a keyboard interrupt.
+        '''
+        while (True):
+            self.run()
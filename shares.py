@@ -4,9 +4,31 @@
                 multiple tasks.
 '''
 
+import array, micropython
+from micropython import const
+
+## Default capacity of a Queue when no size is given
+DEFAULT_QUEUE_SIZE = const(32)
+
+## Overflow policy: discard the oldest item to make room for the new one
+OVF_DROP_OLDEST = const(0)
+## Overflow policy: discard the item being added
+OVF_DROP_NEWEST = const(1)
+## Overflow policy: raise OverflowError
+OVF_RAISE = const(2)
+
+## Share sequence numbers wrap at this mask so they stay small ints
+SEQ_MASK = const(0x3FFFFFFF)
+
 class Share:
     ''' @brief      A standard shared variable.
         @details    Values can be accessed with read() or changed with write()
+                    Every write() bumps a sequence number, so a reader can
+                    remember seq() and later ask changed_since() instead of
+                    having the writer or reader reset the value to None.
+                    Objects registered with add_waiter() have their ready
+                    attribute set on every write; the scheduler uses this to
+                    wake tasks that only need to run when a share changes.
     '''
     def __init__(self, initial_value=None):
         ''' @brief      Constructs a shared variable
@@ -14,44 +36,177 @@ class Share:
                                       shared variable.
         '''
         self._buffer = initial_value
+        self._seq = 0
+        self._waiters = []
     
     def write(self, item):
         ''' @brief      Updates the value of the shared variable
             @param item The new value for the shared variable
         '''
         self._buffer = item
+        self._seq = (self._seq + 1) & SEQ_MASK
+        for waiter in self._waiters:
+            waiter.ready = True
         
     def read(self):
         ''' @brief      Access the value of the shared variable
             @return    The value of the shared variable
         '''
         return self._buffer
+    
+    def seq(self):
+        ''' @brief      Access the sequence number of the shared variable
+            @details    The number increases by one on every write(), even if
+                        the same value is written again, and wraps at SEQ_MASK.
+            @return     The sequence number of the latest write
+        '''
+        return self._seq
+    
+    def changed_since(self, seq):
+        ''' @brief      Checks for writes after a remembered sequence number
+            @param seq  A value previously returned by seq()
+            @return     True if the share has been written since then
+        '''
+        return self._seq != seq
+    
+    def add_waiter(self, waiter):
+        ''' @brief      Registers an object to be flagged on every write
+            @param waiter Any object with a ready attribute, normally a
+                          scheduler.ScheduledTask
+        '''
+        if (waiter not in self._waiters):
+            self._waiters.append(waiter)
+    
+    def remove_waiter(self, waiter):
+        ''' @brief      Unregisters an object added with add_waiter()
+        '''
+        if (waiter in self._waiters):
+            self._waiters.remove(waiter)
 
 class Queue:
-    ''' @brief      A queue of shared data.
+    ''' @brief      A fixed-capacity queue of shared data.
         @details    Values can be accessed with placed into queue with put() or
                     removed from the queue with get(). Check if there are
                     items in the queue with num_in() before using get().
+                    Items are held in a ring buffer that is allocated once
+                    when the queue is constructed, so put() and get() are
+                    O(1) and never grow the heap. Passing an array typecode
+                    stores numeric items in an array.array instead of a list.
+                    When the queue is full, put() follows the overflow policy
+                    chosen at construction: OVF_DROP_OLDEST, OVF_DROP_NEWEST
+                    or OVF_RAISE.
     '''
-    def __init__(self):
+    def __init__(self, size=DEFAULT_QUEUE_SIZE, typecode=None, overflow=OVF_DROP_OLDEST):
         ''' @brief              Constructs an empty queue of shared values
+            @param size         The maximum number of items the queue can hold.
+            @param typecode     An optional array typecode (e.g. 'h', 'l', 'f').
+                                If given, items are stored in an array.array.
+            @param overflow     What put() does when the queue is full.
         '''
-        self._buffer = []
+        if (size < 1):
+            raise ValueError('Queue size must be at least 1')
+        if (overflow not in (OVF_DROP_OLDEST, OVF_DROP_NEWEST, OVF_RAISE)):
+            raise ValueError('Invalid overflow policy {:}'.format(overflow))
+        
+        if (typecode is None):
+            self._buffer = [None] * size
+        else:
+            self._buffer = array.array(typecode, [0] * size)
+        self._size = size
+        self._overflow = overflow
+        
+        ## Index of the next item to be removed
+        self._head = 0
+        ## Index of the next free slot
+        self._tail = 0
+        ## The number of items currently in the queue
+        self._count = 0
+        ## The largest number of items ever held at once
+        self._max_count = 0
+        ## The number of items discarded because the queue was full
+        self._dropped = 0
     
+    @micropython.native
     def put(self, item):
         ''' @brief      Adds an item to the end of the queue.
+            @details    If the queue is full the item is handled according
+                        to the overflow policy of the queue.
             @param item The new item to append to the queue.
+            @return     True if the item was stored, False if it was dropped.
         '''
-        self._buffer.append(item)
+        if (self._count >= self._size):
+            if (self._overflow == OVF_DROP_NEWEST):
+                self._dropped += 1
+                return False
+            elif (self._overflow == OVF_RAISE):
+                raise OverflowError('Queue full')
+            
+            # OVF_DROP_OLDEST: discard the item at the head to make room
+            self._head += 1
+            if (self._head >= self._size):
+                self._head = 0
+            self._count -= 1
+            self._dropped += 1
+        
+        self._buffer[self._tail] = item
+        self._tail += 1
+        if (self._tail >= self._size):
+            self._tail = 0
+        self._count += 1
+        if (self._count > self._max_count):
+            self._max_count = self._count
+        return True
         
     def get(self):
         ''' @brief      Remove the first item from the front of the queue
             @return     The value of the item removed
         '''
-        return self._buffer.pop(0)
+        if (self._count == 0):
+            raise IndexError('Queue empty')
+        item = self._buffer[self._head]
+        self._head += 1
+        if (self._head >= self._size):
+            self._head = 0
+        self._count -= 1
+        return item
     
     def num_in(self):
         ''' @brief      Find the number of items in the queue. Call before get().
             @return     The number of items in the queue
         '''
-        return len(self._buffer)
\ No newline at end of file
+        return self._count
+    
+    def full(self):
+        ''' @brief      Checks whether the queue has reached its capacity.
+            @return     True if no more items fit without overflowing.
+        '''
+        return self._count >= self._size
+    
+    def capacity(self):
+        ''' @brief      Returns the maximum number of items the queue can hold.
+            @return     The capacity chosen when the queue was constructed.
+        '''
+        return self._size
+    
+    def high_water(self):
+        ''' @brief      Returns the largest number of items held at once.
+            @details    Useful for sizing queues: a high-water mark equal to
+                        capacity() means the queue was full at least once;
+                        items lost to overflow are counted by dropped().
+            @return     The high-water mark of the queue.
+        '''
+        return self._max_count
+    
+    def dropped(self):
+        ''' @brief      Returns the number of items lost to overflow.
+            @return     The count of items discarded by either drop policy.
+        '''
+        return self._dropped
+    
+    def clear(self):
+        ''' @brief      Empties the queue without releasing its storage.
+            @details    The high-water mark and drop count are preserved.
+        '''
+        self._head = 0
+        self._tail = 0
+        self._count = 0
@@ -0,0 +1,77 @@
+''' @file                       sim/__init__.py
+    @brief                      Host-side stand-ins for the MicroPython pyb, utime and micropython modules.
+    @details                    The sim directory holds drop-in replacements for the board-only modules
+                                so that the drivers, tasks and main.py run unmodified on a Linux host.
+                                Call install() before importing any project module; it puts the sim
+                                directory at the front of sys.path so that "import pyb" and friends
+                                resolve to the simulated versions. Time is virtual: see utime.py.
+                                CPython's gc module has no mem_free(), mem_alloc() or threshold(), so
+                                install() adds stand-ins that model a Pyboard-sized heap. The viper
+                                pointer casts ptr8, ptr16 and ptr32 are builtins inside viper functions
+                                on the board; install() makes them builtins that return their argument,
+                                since indexing the array itself gives the same values.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import os, sys
+
+## The directory holding the simulated modules
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+## The project root holding the real drivers and tasks
+ROOT_DIR = os.path.dirname(SIM_DIR)
+## The size, in bytes, of the simulated MicroPython heap
+HEAP_SIZE = 100 * 1024
+## The simulated heap in use when gc.mem_alloc() is first called
+HEAP_BASE = 20 * 1024
+## Bytes charged per host memory block allocated since install()
+BLOCK_SIZE = 16
+
+def install():
+    '''   @brief                  Makes the simulated modules importable as pyb, utime and micropython.
+       @details                   Also adds the project root so that the drivers and tasks can be imported.
+                                  Calling install() more than once has no further effect.
+    '''
+    for path in (ROOT_DIR, SIM_DIR):
+        if (path in sys.path):
+            sys.path.remove(path)
+        sys.path.insert(0, path)
+    _install_gc()
+    _install_viper()
+
+def _install_viper():
+    import builtins
+    if (hasattr(builtins, 'ptr32')):
+        return
+    def cast(buffer):
+        return buffer
+    builtins.ptr8 = builtins.ptr16 = builtins.ptr32 = cast
+
+def _install_gc():
+    # heap use follows the host's count of allocated blocks, clamped to HEAP_SIZE
+    import gc
+    if (hasattr(gc, 'mem_alloc')):
+        return
+    # counted from the first call, once the project modules have been imported
+    blocks0 = []
+    threshold = [-1]
+
+    def mem_alloc():
+        if (not blocks0):
+            blocks0.append(sys.getallocatedblocks())
+        used = HEAP_BASE + (sys.getallocatedblocks() - blocks0[0]) * BLOCK_SIZE
+        return max(0, min(HEAP_SIZE, used))
+
+    def mem_free():
+        return HEAP_SIZE - mem_alloc()
+
+    def gc_threshold(amount = None):
+        if (amount is None):
+            return threshold[0]
+        threshold[0] = amount
+
+    gc.mem_alloc = mem_alloc
+    gc.mem_free = mem_free
+    gc.threshold = gc_threshold
@@ -0,0 +1,32 @@
+''' @file                       sim/micropython.py
+    @brief                      Host stand-in for the MicroPython micropython module.
+    @details                    Provides const() and no-op versions of the code emitter decorators so
+                                that modules written for the board import unchanged under CPython.
+'''
+
+def const(value):
+    '''   @brief                  Returns its argument; on the board this marks a compile-time constant.
+       @param value               The constant value.
+       @return                    The same value.
+    '''
+    return value
+
+def native(function):
+    '''   @brief                  The native code emitter is not available on the host; returns function.
+    '''
+    return function
+
+def viper(function):
+    '''   @brief                  The viper code emitter is not available on the host; returns function.
+    '''
+    return function
+
+def alloc_emergency_exception_buf(size):
+    '''   @brief                  Nothing to allocate on the host.
+    '''
+    pass
+
+def schedule(function, arg):
+    '''   @brief                  Runs a soft callback immediately, since host IRQs are already soft.
+    '''
+    function(arg)
@@ -0,0 +1,123 @@
+''' @file                       sim/plant.py
+    @brief                      First-order DC motor model that closes the loop between PWM and encoder.
+    @details                    The motor reads the compare registers of its two PWM channels from the
+                                simulated timers in pyb.py, integrates its speed on the virtual clock and
+                                adds the resulting counts to its encoder timer, so the 16-bit counter wraps
+                                exactly as the hardware does. Timers and pins are looked up by number and
+                                name on every step, so the plant can be created before main.py builds the
+                                driver objects. Given an input-capture timer channel, the plant also
+                                latches that timer at the interpolated time of every rising edge of
+                                encoder channel A.
+'''
+import math
+import pyb, utime
+
+class DCMotor:
+    '''     @brief                  A DC motor with first-order speed dynamics, deadband and Coulomb friction.
+    '''
+
+    def __init__(self, pwm_timer, fwd_channel, rev_channel, enc_timer, enable_pin = None,
+                 gain = 2.0, tau = 0.05, deadband = 0.0, friction = 0.0, cpr = 4000, step_us = 100,
+                 capture = None):
+        '''     @brief              Constructs a motor model and attaches it to the virtual clock.
+            @param pwm_timer    Number of the timer driving the H-bridge inputs.
+            @param fwd_channel  Channel whose duty drives the motor forwards.
+            @param rev_channel  Channel whose duty drives the motor in reverse.
+            @param enc_timer    Number of the timer counting the motor's encoder.
+            @param enable_pin   Name of the bridge enable pin; None if always enabled.
+            @param gain         Steady-state speed per percent duty, in rad/s.
+            @param tau          Mechanical time constant in seconds.
+            @param deadband     Percent duty below which the motor does not move.
+            @param friction     Speed-independent deceleration, in rad/s^2.
+            @param cpr          Encoder counts per output shaft revolution.
+            @param step_us      Integration step in microseconds.
+            @param capture      (timer, channel) numbers of an input capture wired to channel A,
+                                or None.
+        '''
+        self.pwm_timer = pwm_timer
+        self.fwd_channel = fwd_channel
+        self.rev_channel = rev_channel
+        self.enc_timer = enc_timer
+        self.enable_pin = enable_pin
+        self.gain = gain
+        self.tau = tau
+        self.deadband = deadband
+        self.friction = friction
+        self.cpr = cpr
+        self.step_us = step_us
+        self.capture = capture
+
+        ## Shaft speed in rad/s
+        self.speed = 0.0
+        ## Shaft position in encoder counts, unbounded and fractional
+        self.position = 0.0
+        self._counted = 0
+
+        self._event = utime.add_periodic(step_us, self._step)
+
+    def duty(self):
+        '''     @brief              Returns the signed effective duty applied to the motor, in percent.
+        '''
+        if (self.enable_pin is not None and not pyb.pin_values.get(self.enable_pin, 0)):
+            return 0.0
+        timer = pyb.timers.get(self.pwm_timer)
+        if (timer is None):
+            return 0.0
+        fwd = timer.channel(self.fwd_channel)
+        rev = timer.channel(self.rev_channel)
+        fwd = fwd.pulse_width_percent() if fwd is not None else 0.0
+        rev = rev.pulse_width_percent() if rev is not None else 0.0
+        return fwd - rev
+
+    def _step(self, now):
+        dt = self.step_us / 1000000
+        duty = self.duty()
+        if (abs(duty) <= self.deadband):
+            duty = 0.0
+        target = self.gain * duty
+        self.speed += (target - self.speed) * dt / self.tau
+
+        # Coulomb friction never reverses the direction of motion
+        if (self.friction):
+            drop = self.friction * dt
+            if (abs(self.speed) <= drop):
+                self.speed = 0.0
+            else:
+                self.speed -= math.copysign(drop, self.speed)
+
+        start = self.position
+        self.position += self.speed * dt * self.cpr / (2 * math.pi)
+        whole = int(math.floor(self.position))
+        timer = pyb.timers.get(self.enc_timer)
+        channel = self._capture_channel()
+        if (timer is not None and whole != self._counted):
+            if (channel is None):
+                timer.count(whole - self._counted)
+            else:
+                self._count_edges(timer, channel, start, whole, now)
+        self._counted = whole
+
+    def _capture_channel(self):
+        if (self.capture is None):
+            return None
+        timer = pyb.timers.get(self.capture[0])
+        return timer.channel(self.capture[1]) if timer is not None else None
+
+    def _count_edges(self, timer, channel, start, whole, now):
+        # one count at a time, latching the capture timer on each rising edge of A; in
+        # x4 quadrature A rises going forward from a multiple of 4, and going back into 2
+        step = 1 if whole > self._counted else -1
+        span = self.position - start
+        count = self._counted
+        while (count != whole):
+            boundary = count + 1 if step > 0 else count
+            timer.count(step)
+            count += step
+            if ((step > 0 and count % 4 == 1) or (step < 0 and count % 4 == 2)):
+                at = now - self.step_us * (self.position - boundary) / span
+                channel._fire_capture(channel._timer.ticks_at(at))
+
+    def detach(self):
+        '''     @brief              Stops the model from being stepped by the virtual clock.
+        '''
+        utime.remove_periodic(self._event)
@@ -0,0 +1,407 @@
+''' @file                       sim/pyb.py
+    @brief                      Host stand-in for the subset of the MicroPython pyb module used by the project.
+    @details                    Simulates Pin, Timer (encoder and PWM channels), ExtInt and USB_VCP.
+                                Timers keep the 16-bit counter and compare registers of the STM32 timers,
+                                so encoder counts wrap exactly as on the board and PWM duty can be read
+                                back by the motor plant in plant.py. Timer callbacks are fired from the
+                                virtual clock in utime.py at the timer's update frequency. A timer with
+                                an input-capture channel runs freely on the virtual clock, and the plant
+                                latches it into the channel when an encoder edge arrives.
+'''
+import os
+import utime
+
+## Timer clock frequency used to derive prescaler/period from freq=
+TIMER_SOURCE_FREQ = 84000000
+
+## Timer objects by timer number, most recently constructed last
+timers = {}
+## Logic level of every pin, by pin name
+pin_values = {}
+## External interrupts by pin name
+ext_ints = {}
+
+class _CpuPins:
+    '''     @brief                  Resolves pyb.Pin.cpu.A10 style names to Pin objects.
+    '''
+    def __getattr__(self, name):
+        return Pin(name)
+
+class Pin:
+    '''     @brief                  A simulated GPIO pin whose level is kept in pin_values.
+    '''
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 0x11
+    AF_PP = 2
+    AF_OD = 0x12
+    ANALOG = 3
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    cpu = _CpuPins()
+    board = _CpuPins()
+
+    def __init__(self, pin, mode = IN, pull = PULL_NONE, value = None):
+        '''     @brief              Constructs a pin from a name or another Pin.
+        '''
+        self._name = pin._name if isinstance(pin, Pin) else str(pin)
+        self._mode = mode
+        if (value is not None):
+            pin_values[self._name] = 1 if value else 0
+        elif (self._name not in pin_values):
+            pin_values[self._name] = 1 if pull == Pin.PULL_UP else 0
+
+    def init(self, mode = IN, pull = PULL_NONE, value = None):
+        self._mode = mode
+        if (value is not None):
+            set_pin(self._name, value)
+
+    def name(self):
+        return self._name
+
+    def value(self, level = None):
+        if (level is None):
+            return pin_values.get(self._name, 0)
+        set_pin(self._name, level)
+
+    def high(self):
+        set_pin(self._name, 1)
+
+    def low(self):
+        set_pin(self._name, 0)
+
+    on = high
+    off = low
+
+    def __repr__(self):
+        return 'Pin({:})'.format(self._name)
+
+def set_pin(name, level):
+    '''   @brief                  Drives a pin from the host side, firing any ExtInt attached to it.
+       @param name                The pin name, e.g. 'B2'.
+       @param level               The new logic level.
+    '''
+    level = 1 if level else 0
+    old = pin_values.get(name, 0)
+    pin_values[name] = level
+    extint = ext_ints.get(name)
+    if (extint is not None and old != level):
+        extint._edge(old, level)
+
+class ExtInt:
+    '''     @brief                  A simulated external interrupt on a pin.
+    '''
+    IRQ_RISING = 0x10110000
+    IRQ_FALLING = 0x10210000
+    IRQ_RISING_FALLING = 0x10310000
+
+    def __init__(self, pin, mode, pull, callback):
+        self._pin = Pin(pin, Pin.IN, pull)
+        self._mode = mode
+        self._callback = callback
+        self._enabled = True
+        ext_ints[self._pin._name] = self
+
+    def line(self):
+        return 0
+
+    def enable(self):
+        self._enabled = True
+
+    def disable(self):
+        self._enabled = False
+
+    def swint(self):
+        if (self._callback is not None):
+            self._callback(self.line())
+
+    def _edge(self, old, new):
+        if (not self._enabled or self._callback is None):
+            return
+        rising = new > old
+        if ((rising and self._mode != ExtInt.IRQ_FALLING) or
+            (not rising and self._mode != ExtInt.IRQ_RISING)):
+            self._callback(self.line())
+
+class TimerChannel:
+    '''     @brief                  A simulated timer channel holding a compare/capture register.
+    '''
+    def __init__(self, timer, channel, mode, pin, polarity):
+        self._timer = timer
+        self._channel = channel
+        self._mode = mode
+        self._pin = pin
+        self._polarity = polarity
+        self._compare = 0
+        self._capture = 0
+        self._callback = None
+
+    def pulse_width(self, value = None):
+        if (value is None):
+            return self._compare
+        self._compare = int(value)
+
+    def pulse_width_percent(self, value = None):
+        period = self._timer._period + 1
+        if (value is None):
+            return self._compare * 100 / period
+        self._compare = int(value * period / 100)
+
+    def capture(self, value = None):
+        if (value is None):
+            return self._capture
+        self._capture = int(value)
+
+    compare = capture
+
+    def callback(self, fun):
+        self._callback = fun
+
+    def _fire_capture(self, count):
+        self._capture = count & self._timer._period
+        if (self._callback is not None):
+            self._callback(self._timer)
+
+class Timer:
+    '''     @brief                  A simulated STM32 timer with a 16-bit counter.
+    '''
+    UP = 0
+    DOWN = 0x10
+    CENTER = 0x20
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    OC_ACTIVE = 3
+    OC_INACTIVE = 4
+    OC_TOGGLE = 5
+    OC_FORCED_ACTIVE = 6
+    OC_FORCED_INACTIVE = 7
+    IC = 8
+    ENC_A = 9
+    ENC_B = 10
+    ENC_AB = 11
+    HIGH = 0
+    LOW = 2
+    RISING = 0
+    FALLING = 2
+    BOTH = 10
+
+    def __init__(self, id, freq = None, prescaler = 0, period = 0xffff, callback = None, **kwargs):
+        self._id = id
+        self._count = 0
+        self._origin = None
+        self._channels = {}
+        self._callback = None
+        self._event = None
+        self.init(freq = freq, prescaler = prescaler, period = period)
+        timers[id] = self
+        if (callback is not None):
+            self.callback(callback)
+
+    def init(self, freq = None, prescaler = 0, period = 0xffff, **kwargs):
+        if (freq is not None):
+            ticks = int(TIMER_SOURCE_FREQ / freq)
+            prescaler = 0
+            while (ticks > 0x10000):
+                prescaler += 1
+                ticks = int(TIMER_SOURCE_FREQ / freq / (prescaler + 1))
+            period = ticks - 1
+        self._prescaler = prescaler
+        self._period = period
+        if (self._callback is not None):
+            self.callback(self._callback)
+
+    def deinit(self):
+        self.callback(None)
+        self._channels = {}
+
+    def channel(self, channel, mode = None, pin = None, polarity = None, **kwargs):
+        if (mode is None):
+            return self._channels.get(channel)
+        ch = TimerChannel(self, channel, mode, pin, polarity)
+        if (mode == Timer.IC and self._origin is None):
+            # an input-capture timer is free running: it counts virtual time
+            self._origin = utime.now_us()
+        for key in ('pulse_width', 'pulse_width_percent', 'compare'):
+            if (key in kwargs):
+                getattr(ch, key)(kwargs[key])
+        self._channels[channel] = ch
+        return ch
+
+    def counter(self, value = None):
+        if (value is None):
+            if (self._origin is not None):
+                return self.ticks_at(utime.now_us())
+            return self._count
+        self._count = int(value) & self._period
+
+    def count(self, delta):
+        '''     @brief              Host-side hook: moves the counter, wrapping like the hardware.
+            @param delta        Signed number of counts to add.
+        '''
+        self._count = (self._count + delta) % (self._period + 1)
+
+    def ticks_at(self, us):
+        '''     @brief              Host-side hook: the counter of a free-running timer at a virtual time.
+            @param us           The virtual time in microseconds, which may be fractional.
+        '''
+        return int((us - self._origin) * TIMER_SOURCE_FREQ / (self._prescaler + 1) / 1000000) & self._period
+
+    def freq(self, value = None):
+        if (value is None):
+            return TIMER_SOURCE_FREQ / (self._prescaler + 1) / (self._period + 1)
+        self.init(freq = value)
+
+    def period(self, value = None):
+        if (value is None):
+            return self._period
+        self._period = value
+
+    def prescaler(self, value = None):
+        if (value is None):
+            return self._prescaler
+        self._prescaler = value
+
+    def source_freq(self):
+        return TIMER_SOURCE_FREQ
+
+    def callback(self, fun):
+        if (self._event is not None):
+            utime.remove_periodic(self._event)
+            self._event = None
+        self._callback = fun
+        if (fun is not None):
+            period_us = max(1, int(round(1000000 / self.freq())))
+            self._event = utime.add_periodic(period_us, self._update_irq)
+
+    def _update_irq(self, now):
+        if (self._callback is not None):
+            self._callback(self)
+
+class VirtualStream:
+    '''     @brief                  An in-memory byte stream standing in for the USB serial link.
+        @details                Bytes fed with feed() are returned by read(); bytes written by the
+                                program collect in output.
+    '''
+    def __init__(self):
+        self.input = bytearray()
+        self.output = bytearray()
+
+    def feed(self, data):
+        if (isinstance(data, str)):
+            data = data.encode()
+        self.input.extend(data)
+
+    def available(self):
+        return len(self.input)
+
+    def take(self, n):
+        data = bytes(self.input[:n])
+        del self.input[:n]
+        return data
+
+    def emit(self, data):
+        self.output.extend(data)
+
+class PtyStream(VirtualStream):
+    '''     @brief                  A stream backed by a pseudo-terminal so a real terminal can attach.
+        @details                Connect with e.g. "screen <slave_name>". Output is mirrored to the pty.
+    '''
+    def __init__(self):
+        VirtualStream.__init__(self)
+        self._master, slave = os.openpty()
+        self.slave_name = os.ttyname(slave)
+        os.set_blocking(self._master, False)
+
+    def _poll(self):
+        try:
+            data = os.read(self._master, 256)
+        except (BlockingIOError, OSError):
+            data = b''
+        self.input.extend(data)
+
+    def available(self):
+        self._poll()
+        return len(self.input)
+
+    def emit(self, data):
+        VirtualStream.emit(self, data)
+        os.write(self._master, bytes(data))
+
+## The single USB link shared by every USB_VCP object
+vcp_stream = VirtualStream()
+
+def use_pty():
+    '''   @brief                  Replaces the in-memory USB link with a pseudo-terminal.
+       @return                    The pty device name to attach a terminal to.
+    '''
+    global vcp_stream
+    vcp_stream = PtyStream()
+    return vcp_stream.slave_name
+
+class USB_VCP:
+    '''     @brief                  The USB virtual COM port, backed by vcp_stream.
+    '''
+    def __init__(self, id = 0):
+        pass
+
+    def isconnected(self):
+        return True
+
+    def any(self):
+        return vcp_stream.available() > 0
+
+    def read(self, nbytes = None):
+        n = vcp_stream.available()
+        if (n == 0):
+            return None
+        return vcp_stream.take(n if nbytes is None else nbytes)
+
+    def readinto(self, buf, maxlen = None):
+        data = self.read(len(buf) if maxlen is None else maxlen)
+        if (data is None):
+            return None
+        buf[:len(data)] = data
+        return len(data)
+
+    def readline(self):
+        data = bytes(vcp_stream.input)
+        index = data.find(b'\n')
+        if (index < 0):
+            return None
+        return vcp_stream.take(index + 1)
+
+    def write(self, buf):
+        if (isinstance(buf, str)):
+            buf = buf.encode()
+        vcp_stream.emit(buf)
+        return len(buf)
+
+    def send(self, data, timeout = 5000):
+        return self.write(data)
+
+def millis():
+    return utime.ticks_ms()
+
+def micros():
+    return utime.ticks_us()
+
+def elapsed_millis(start):
+    return utime.ticks_diff(utime.ticks_ms(), start)
+
+def elapsed_micros(start):
+    return utime.ticks_diff(utime.ticks_us(), start)
+
+def delay(ms):
+    utime.sleep_ms(ms)
+
+def udelay(us):
+    utime.sleep_us(us)
+
+def disable_irq():
+    return True
+
+def enable_irq(state = True):
+    pass
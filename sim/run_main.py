@@ -0,0 +1,83 @@
+''' @file                       sim/run_main.py
+    @brief                      Runs main.py on the host against the simulated Pyboard and motor.
+    @details                    Example: python sim/run_main.py --seconds 5 --at 0.1:e --at 0.5:m50\\r
+                                Keystrokes are delivered to the USB_VCP at the given virtual times, and
+                                --fault T makes the L6206 pull its enable/fault line low at time T.
+                                --start S starts the virtual clock S seconds in, so that, e.g.,
+                                --start 1070 runs through the wrap of ticks_us() at 1073.7 s; the
+                                times of --at, --fault and --seconds count from the start.
+                                When the run ends, the virtual and wall-clock durations, the scheduler
+                                throughput and the final motor state are reported.
+'''
+import argparse, os, sys, time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import sim
+sim.install()
+
+import pyb, utime, plant
+import scheduler
+
+def parse_keys(text):
+    '''   @brief                  Expands \\r and \\n escapes typed on the command line.
+    '''
+    return text.replace('\\r', '\r').replace('\\n', '\n')
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--seconds', type = float, default = 5.0, help = 'virtual run time')
+    parser.add_argument('--at', action = 'append', default = [], metavar = 'T:KEYS',
+                        help = 'send KEYS to the USB_VCP at virtual time T seconds')
+    parser.add_argument('--read-cost', type = int, default = 10,
+                        help = 'virtual microseconds consumed by each clock read')
+    parser.add_argument('--fault', type = float, action = 'append', default = [], metavar = 'T',
+                        help = 'pull the motor A fault line low at virtual time T seconds')
+    parser.add_argument('--start', type = float, default = 0.0,
+                        help = 'virtual time, in seconds, at which the clock starts')
+    parser.add_argument('--pty', action = 'store_true', help = 'attach the USB_VCP to a pty')
+    args = parser.parse_args(argv)
+
+    origin = int(args.start * 1000000)
+    utime.reset(origin, read_cost = args.read_cost)
+    if (args.pty):
+        print('USB_VCP attached to {:}'.format(pyb.use_pty()))
+
+    for entry in args.at:
+        when, keys = entry.split(':', 1)
+        def deliver(now, keys = parse_keys(keys)):
+            pyb.vcp_stream.feed(keys)
+        event = utime.add_periodic(1 << 62, deliver, origin + int(float(when) * 1000000))
+
+    for when in args.fault:
+        def fault(now):
+            pyb.set_pin('A10', 0)
+        utime.add_periodic(1 << 62, fault, origin + int(when * 1000000))
+
+    # channel A is also wired to timer 2 channel 1, for an axis row with capPin 'A5'
+    motor = plant.DCMotor(pwm_timer = 3, fwd_channel = 2, rev_channel = 1, enc_timer = 4,
+                          enable_pin = 'A10', capture = (2, 1))
+
+    # count scheduler passes without touching scheduler.py
+    passes = [0]
+    run = scheduler.Scheduler.run
+    def counting_run(self):
+        passes[0] += 1
+        return run(self)
+    scheduler.Scheduler.run = counting_run
+
+    import main as board_main
+    utime.stop_at(origin + int(args.seconds * 1000000))
+    start = time.perf_counter()
+    board_main.main()
+    wall = time.perf_counter() - start
+
+    virtual = (utime.now_us() - origin) / 1000000
+    print()
+    print('virtual time     {:.3f} s'.format(virtual))
+    print('wall time        {:.3f} s ({:.1f}x real time)'.format(wall, virtual / wall if wall else 0))
+    print('scheduler passes {:} ({:.0f} per virtual second)'.format(passes[0], passes[0] / virtual))
+    print('motor speed      {:.2f} rad/s'.format(motor.speed))
+    print('motor position   {:.0f} counts'.format(motor.position))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+''' @file                       sim/utime.py
+    @brief                      Host stand-in for the MicroPython utime module driven by a virtual clock.
+    @details                    Simulated time only moves forward when the program reads the clock,
+                                sleeps, or when advance() is called. Each ticks_us()/ticks_ms() call
+                                costs a configurable number of microseconds so that busy loops such as
+                                the scheduler make progress. Periodic events registered with
+                                add_periodic() (timer interrupts, the motor plant) fire at their exact
+                                virtual times as the clock passes them. The ticks counters wrap at
+                                TICKS_PERIOD just like on the Pyboard.
+'''
+
+## ticks_us() and ticks_ms() wrap at this value, as on the Pyboard
+TICKS_PERIOD = 1 << 30
+_TICKS_MAX = TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = TICKS_PERIOD // 2
+
+## The unbounded virtual time, in microseconds
+_now = 0
+## The number of microseconds consumed by every clock read
+_read_cost = 10
+## When set, reading the clock at or past this time raises KeyboardInterrupt
+_stop_time = None
+## Periodic events, each a list [next_time, period, callback]
+_events = []
+## True while an event callback runs; clock reads inside it are free
+_firing = False
+
+def reset(start_us = 0, read_cost = 10):
+    '''   @brief                  Restarts the virtual clock and removes all periodic events.
+       @param start_us            The initial virtual time, in microseconds.
+       @param read_cost           Microseconds consumed by each clock read.
+    '''
+    global _now, _read_cost, _stop_time
+    _now = start_us
+    _read_cost = read_cost
+    _stop_time = None
+    del _events[:]
+
+def set_read_cost(us):
+    '''   @brief                  Sets how many microseconds each clock read consumes.
+       @param us                  The cost, in microseconds. Zero freezes busy loops.
+    '''
+    global _read_cost
+    _read_cost = us
+
+def stop_at(us):
+    '''   @brief                  Ends the simulation at a virtual time.
+       @details                   Once the virtual time reaches us, the next clock read raises
+                                  KeyboardInterrupt, which main.py already treats as a clean exit.
+       @param us                  The virtual stop time in microseconds, or None to run forever.
+    '''
+    global _stop_time
+    _stop_time = us
+
+def now_us():
+    '''   @brief                  Returns the unbounded virtual time without advancing the clock.
+       @return                    The virtual time in microseconds.
+    '''
+    return _now
+
+def add_periodic(period_us, callback, first_us = None):
+    '''   @brief                  Registers a callback to be fired every period_us of virtual time.
+       @param period_us           The event period in microseconds.
+       @param callback            Called with the virtual time of the event.
+       @param first_us            Virtual time of the first event; defaults to one period from now.
+       @return                    A handle that can be passed to remove_periodic().
+    '''
+    event = [_now + period_us if first_us is None else first_us, period_us, callback]
+    _events.append(event)
+    return event
+
+def remove_periodic(handle):
+    '''   @brief                  Unregisters an event created by add_periodic().
+    '''
+    if (handle in _events):
+        _events.remove(handle)
+
+def advance(us):
+    '''   @brief                  Moves the virtual clock forward, firing every event that falls due.
+       @param us                  The number of microseconds to advance.
+    '''
+    global _now, _firing
+    target = _now + us
+    while (_events):
+        event = min(_events, key = lambda e: e[0])
+        if (event[0] > target):
+            break
+        _now = event[0]
+        event[0] += event[1]
+        _firing = True
+        try:
+            event[2](_now)
+        finally:
+            _firing = False
+    _now = target
+
+def _read():
+    if (_firing):
+        return _now
+    advance(_read_cost)
+    if (_stop_time is not None and _now >= _stop_time):
+        raise KeyboardInterrupt
+    return _now
+
+def ticks_us():
+    '''   @brief                  Returns the wrapping microsecond counter.
+    '''
+    return _read() & _TICKS_MAX
+
+def ticks_ms():
+    '''   @brief                  Returns the wrapping millisecond counter.
+    '''
+    return (_read() // 1000) & _TICKS_MAX
+
+def ticks_cpu():
+    '''   @brief                  Returns the highest resolution counter available, here microseconds.
+    '''
+    return ticks_us()
+
+def ticks_add(ticks, delta):
+    '''   @brief                  Offsets a ticks value, wrapping at TICKS_PERIOD.
+    '''
+    return (ticks + delta) & _TICKS_MAX
+
+def ticks_diff(ticks1, ticks2):
+    '''   @brief                  Signed difference ticks1 - ticks2 that is correct across a wrap.
+    '''
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+def sleep_us(us):
+    '''   @brief                  Advances the virtual clock by us microseconds.
+    '''
+    advance(us)
+
+def sleep_ms(ms):
+    '''   @brief                  Advances the virtual clock by ms milliseconds.
+    '''
+    advance(ms * 1000)
+
+def sleep(seconds):
+    '''   @brief                  Advances the virtual clock by a number of seconds.
+    '''
+    advance(int(seconds * 1000000))
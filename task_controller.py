@@ -0,0 +1,349 @@
+'''@file                       task_controller.py
+   @brief                      Closed-loop PID position controller task.
+   @details                    Drives a motor_driver.Motor so that an encoder.Encoder follows a position
+                               setpoint. The control law runs on integers only: gains are held in fixed
+                               point with GAIN_SHIFT fractional bits (the integral path carries INT_SHIFT
+                               more so that slow integral action still resolves), and every intermediate
+                               term is clamped so it stays a small int, so an iteration never allocates. The
+                               integrator uses conditional integration for anti-windup, the derivative
+                               acts on the measurement so setpoint steps do not kick the output, and the
+                               effort is saturated to +/-100% duty. Setpoints (in encoder counts) and
+                               gains are read from shares, so any task can retune or command the loop;
+                               writing None to the setpoint share releases the motor. Given a command
+                               bus, the controller also accepts moves, which it plans once as a
+                               trajectory.Profile and then follows one precomputed setpoint per run.
+                               CTL_AUTOTUNE runs a relay-feedback experiment (see autotune.py) about the
+                               present position instead, then takes over with the gains it found and
+                               saves them to flash for the next boot.
+'''
+
+import micropython, fsm, command_bus, trajectory, fixed, autotune
+from micropython import const
+
+## Fractional bits of the fixed-point gains
+GAIN_SHIFT = const(10)
+## Largest duty the controller will command, in percent
+DUTY_LIMIT = const(100)
+## Any single term of the control law is clamped to this, in fixed point
+TERM_LIMIT = const(100 << 10)
+## Position errors and measurement steps are clamped to this, in counts
+ERROR_LIMIT = const(1 << 17)
+## Fixed-point gains must stay below this magnitude so products stay small ints
+GAIN_LIMIT = const(1 << 12)
+## Extra fractional bits carried by the integral gain and the integrator
+INT_SHIFT = const(8)
+## Errors fed to the integrator are clamped to this, in counts
+INT_ERROR_LIMIT = const(1 << 13)
+## The fixed-point integral gain must stay below this magnitude
+INT_GAIN_LIMIT = const(1 << 16)
+## The integrator is clamped to this, in its own fixed point
+INT_LIMIT = const(100 << 18)
+
+## Default move limits: velocity in counts/s, acceleration in counts/s^2 and jerk in counts/s^3
+DEFAULT_LIMITS = (8000, 40000, 400000)
+
+## List of possible controller states
+S0_idle = const(0)
+S1_control = const(1)
+S2_autotune = const(2)
+NUM_STATES = const(3)
+
+class Task_Controller():
+    '''@brief                       PID position controller task.
+       @details                     Runs one controller iteration per scheduled run. Register it just
+                                    after the task that updates the encoder, at the same period.
+    '''
+
+    def __init__(self, taskID, period, encoder, motor, setpoint_share, gains_share, dbg=False,
+                 bus=None, axis=command_bus.AXIS_A, limits=DEFAULT_LIMITS):
+        '''@brief                   Constructs a position controller task.
+           @param taskID            The name of the task
+           @param period            The period, in microseconds, between runs of
+                                    the task. The loop rate is 1/period.
+           @param encoder           The encoder.Encoder measuring the position.
+           @param motor             The motor_driver.Motor to drive.
+           @param setpoint_share    A shares.Share holding the target position in
+                                    encoder counts, or None to leave the motor alone.
+           @param gains_share       A shares.Share holding a (Kp, Ki, Kd) tuple in
+                                    continuous-time units: %duty/count, %duty/(count*s)
+                                    and %duty*s/count.
+           @param dbg               A boolean flag used to enable or disable debug
+                                    messages printed over the VCP
+           @param bus               An optional command_bus.CommandBus to accept moves from.
+           @param axis              The axis bit this controller answers to on the bus.
+           @param limits            The (velocity, acceleration, jerk) limits of a move, in
+                                    counts/s, counts/s^2 and counts/s^3; a jerk of None
+                                    plans trapezoidal moves.
+        '''
+        ## The name of the task
+        self.taskID = taskID
+        ## The period (in us) of the task
+        self.period = period
+        self.encoder = encoder
+        self.motor = motor
+        self.setpoint_share = setpoint_share
+        self.gains_share = gains_share
+        ## A flag indicating if debugging print messages display
+        self.dbg = dbg
+
+        ## Commands for this controller, delivered by the command bus, if there is one
+        self.inbox = None
+        if (bus is not None):
+            self.inbox = command_bus.Inbox()
+            bus.subscribe(command_bus.TOPIC_CONTROLLER, axis, self.inbox)
+        self.limits = limits
+
+        ## The finite state machine; setpoints arrive through shares and moves through the bus
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, command_bus.NUM_COMMANDS, S0_idle,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        self.fsm.on((S0_idle, S1_control), command_bus.CTL_MOVE, self.startMove)
+        self.fsm.on(S1_control, command_bus.CTL_RELEASE, self.release)
+        self.fsm.on_entry(S1_control, self.startControl)
+        self.fsm.on_exit(S1_control, self.releaseMotor)
+        self.fsm.on((S0_idle, S1_control), command_bus.CTL_AUTOTUNE, self.startAutotune)
+        self.fsm.on(S2_autotune, command_bus.CTL_RELEASE, self.abortAutotune)
+        self.fsm.on_entry(S2_autotune, self.beginAutotune)
+        self.fsm.on_exit(S2_autotune, self.releaseMotor)
+
+        ## The relay-feedback experiment run on CTL_AUTOTUNE
+        self.tuner = autotune.RelayTuner()
+
+        ## The trajectory.Profile being followed, or None
+        self.profile = None
+        ## The index of the next profile setpoint
+        self.profileIndex = 0
+        ## The position the profile is measured from, in counts
+        self.profileStart = 0
+
+        # fixed-point, discrete-time gains
+        self.kp = 0
+        self.ki = 0
+        self.kd = 0
+        ## The gains tuple the fixed-point gains were computed from
+        self.gains = None
+
+        ## The integrator, in fixed point
+        self.integral = 0
+        ## The measured position on the previous iteration
+        self.prevPosition = 0
+        ## The duty commanded on the previous iteration, or None if it must be written next time
+        self.effort = 0
+
+    def run(self):
+        '''@brief                   Runs one iteration of the controller
+        '''
+        if (self.inbox is not None):
+            while (self.inbox.any()):
+                self.fsm.dispatch(self.inbox.get(), self.inbox.value)
+
+        if (self.fsm.state == S2_autotune):
+            self.autotuneStep()
+            return
+
+        setpoint = self.setpoint_share.read()
+
+        if (setpoint is None):
+            self.profile = None
+            if (self.fsm.state == S1_control):
+                self.fsm.transition_to(S0_idle)
+            return
+
+        if (self.profile is not None):
+            # one precomputed setpoint per run; the final one is left in the share
+            i = self.profileIndex
+            setpoint = self.profileStart + self.profile.positions[i]
+            i += 1
+            if (i >= len(self.profile.positions)):
+                self.setpoint_share.write(setpoint)
+                self.profile = None
+            self.profileIndex = i
+
+        gains = self.gains_share.read()
+        if (gains is not self.gains):
+            self.set_gains(gains)
+
+        if (self.fsm.state == S0_idle):
+            self.fsm.transition_to(S1_control)
+
+        self.effort = self.step(setpoint, self.encoder.read())
+
+    def startControl(self):
+        # start bumplessly from the present position with an empty integrator
+        self.prevPosition = self.encoder.read()
+        self.integral = 0
+        # the motor may still hold an open-loop duty, so the first duty is always written
+        self.effort = None
+
+    def releaseMotor(self):
+        self.motor.set_duty(0)
+        self.effort = 0
+
+    def startMove(self, degrees):
+        '''@brief                   Plans a move relative to the current setpoint and starts following it.
+           @details                 The profile is computed here, once, with floats; each run
+                                    afterwards only indexes its table.
+           @param degrees           The signed length of the move in degrees of shaft rotation.
+           @return                  S1_control, so that an idle controller takes over the motor.
+        '''
+        start = self.setpoint_share.read()
+        if (start is None):
+            start = self.encoder.read()
+        vmax, amax, jerk = self.limits
+        try:
+            profile = trajectory.Profile(degrees * self.encoder.cpr // 360, self.period, vmax, amax, jerk)
+        except ValueError as e:
+            print('{:}: {:}'.format(self.taskID, e))
+            return None
+        self.profileStart = start
+        self.profileIndex = 0
+        self.profile = profile
+        self.setpoint_share.write(start)
+        if (self.dbg):
+            print('{:}: {:} count move over {:.2f} s'.format(self.taskID, profile.distance, profile.duration))
+        return S1_control
+
+    def release(self, value):
+        # the next run sees the empty setpoint and lets go of the motor
+        self.profile = None
+        self.setpoint_share.write(None)
+
+    def startAutotune(self, relay):
+        '''@brief                   Starts a relay-feedback experiment about the present position.
+           @param relay             The relay duty in percent, or 0 to keep the last one.
+           @return                  S2_autotune.
+        '''
+        self.profile = None
+        if (relay > 0):
+            self.tuner.relay = min(relay, DUTY_LIMIT)
+        return S2_autotune
+
+    def beginAutotune(self):
+        self.tuner.start(self.encoder.read(), self.encoder.get_timestamp())
+        self.motor.set_duty(self.tuner.output)
+        self.effort = self.tuner.output
+        print('{:}: autotuning with a {:}% relay'.format(self.taskID, self.tuner.relay))
+
+    def abortAutotune(self, value):
+        self.setpoint_share.write(None)
+        print('{:}: autotune stopped'.format(self.taskID))
+        return S0_idle
+
+    def autotuneStep(self):
+        '''@brief                   Runs the relay for one sample and finishes the experiment when it is done.
+        '''
+        tuner = self.tuner
+        duty = tuner.step(self.encoder.read(), self.encoder.get_timestamp())
+        if (duty != self.effort):
+            self.motor.set_duty(duty)
+            self.effort = duty
+        if (not tuner.done):
+            return
+
+        try:
+            if (tuner.result is None):
+                raise ValueError('no limit cycle within {:} s'.format(tuner.timeout / 1000000))
+            amplitude, period = tuner.result
+            gains = autotune.relay_gains(tuner.relay, amplitude, period / 1000000, tuner.hysteresis)
+            # check the loop can hold them before handing them over
+            self._to_fixed(gains[0], GAIN_SHIFT, GAIN_LIMIT)
+            self._to_fixed(gains[1] * self.period / 1000000, GAIN_SHIFT + INT_SHIFT, INT_GAIN_LIMIT)
+            self._to_fixed(gains[2] * 1000000 / self.period, GAIN_SHIFT, GAIN_LIMIT)
+        except ValueError as e:
+            print('{:}: autotune failed: {:}'.format(self.taskID, e))
+            self.setpoint_share.write(None)
+            self.fsm.transition_to(S0_idle)
+            return
+
+        print('{:}: limit cycle of {:.1f} counts every {:.0f} us, gains Kp {:.5f} Ki {:.5f} Kd {:.6f}'.format(
+              self.taskID, amplitude, period, gains[0], gains[1], gains[2]))
+        try:
+            autotune.save_gains(self.taskID, gains)
+        except OSError as e:
+            print('{:}: gains not saved: {:}'.format(self.taskID, e))
+        self.gains_share.write(gains)
+        self.setpoint_share.write(tuner.center)
+        self.fsm.transition_to(S1_control)
+
+    @micropython.native
+    def step(self, setpoint, position):
+        '''@brief                   One iteration of the integer PID law.
+           @param setpoint          The target position in counts.
+           @param position          The measured position in counts.
+           @return                  The duty written to the motor, in percent.
+        '''
+        error = setpoint - position
+        if (error > ERROR_LIMIT):
+            error = ERROR_LIMIT
+        elif (error < -ERROR_LIMIT):
+            error = -ERROR_LIMIT
+
+        # derivative on measurement
+        motion = position - self.prevPosition
+        self.prevPosition = position
+        if (motion > ERROR_LIMIT):
+            motion = ERROR_LIMIT
+        elif (motion < -ERROR_LIMIT):
+            motion = -ERROR_LIMIT
+
+        p = self.kp * error
+        if (p > TERM_LIMIT):
+            p = TERM_LIMIT
+        elif (p < -TERM_LIMIT):
+            p = -TERM_LIMIT
+
+        d = -self.kd * motion
+        if (d > TERM_LIMIT):
+            d = TERM_LIMIT
+        elif (d < -TERM_LIMIT):
+            d = -TERM_LIMIT
+
+        # large errors are clamped before integrating, which also limits windup
+        if (error > INT_ERROR_LIMIT):
+            integral = self.integral + self.ki * INT_ERROR_LIMIT
+        elif (error < -INT_ERROR_LIMIT):
+            integral = self.integral - self.ki * INT_ERROR_LIMIT
+        else:
+            integral = self.integral + self.ki * error
+        if (integral > INT_LIMIT):
+            integral = INT_LIMIT
+        elif (integral < -INT_LIMIT):
+            integral = -INT_LIMIT
+
+        duty = (p + d + (integral >> INT_SHIFT)) >> GAIN_SHIFT
+        if (duty > DUTY_LIMIT):
+            duty = DUTY_LIMIT
+        elif (duty < -DUTY_LIMIT):
+            duty = -DUTY_LIMIT
+
+        # anti-windup: only keep the new integral if it does not push further into saturation
+        if (not ((duty == DUTY_LIMIT and error > 0) or (duty == -DUTY_LIMIT and error < 0))):
+            self.integral = integral
+
+        if (duty != self.effort):
+            self.motor.set_duty(duty)
+        return duty
+
+    def set_gains(self, gains):
+        '''@brief                   Converts continuous-time gains to fixed-point discrete gains.
+           @details                 Runs only when a new gains tuple is written, so the float
+                                    math stays out of the control iteration.
+           @param gains             A (Kp, Ki, Kd) tuple, or None for all zero.
+        '''
+        self.gains = gains
+        if (gains is None):
+            self.kp = self.ki = self.kd = 0
+            return
+        kp, ki, kd = gains
+        dt = self.period / 1000000
+        self.kp = self._to_fixed(kp, GAIN_SHIFT, GAIN_LIMIT)
+        self.ki = self._to_fixed(ki * dt, GAIN_SHIFT + INT_SHIFT, INT_GAIN_LIMIT)
+        self.kd = self._to_fixed(kd / dt, GAIN_SHIFT, GAIN_LIMIT)
+        self.integral = 0
+        if (self.dbg):
+            print('{:}: gains {:} {:} {:}'.format(self.taskID, self.kp, self.ki, self.kd))
+
+    def _to_fixed(self, value, shift, limit):
+        gain = fixed.from_float(value, shift)
+        if (abs(gain) >= limit):
+            raise ValueError('Gain {:} is out of range for the loop period'.format(value))
+        return gain
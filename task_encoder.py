@@ -5,33 +5,41 @@ Created on Thu Oct 14 13:13:05 2021
 @author: Jason Davis
 """
 
-import utime, pyb, math
+import pyb, command_bus, fsm, fixed
 from micropython import const
 
 ## List of possible encoder states
 S0_init = const(0)
-S1_zeroEncoder = const(1)
-S2_displayEncoderPosition = const(2)
-S3_displayEncoderDelta = const(3)
-S4_gatherEncoderData = const(4)
-S5_haltDataCollection = const(5)
+S1_gatherEncoderData = const(1)
+NUM_STATES = const(2)
 
 class Task_Encoder():
-    '''@brief                               Receives input from the user interface via "main" and executes the request
-       @details                             Accepts input from the user and handles the request.  Since input arrives pre-validated,
+    '''@brief                               Receives commands from the user interface over the command bus and executes them
+       @details                             Accepts commands addressed to this task's axis and handles the request.  Since input arrives pre-validated,
                                             no character/data validation is performed here
     '''
     
-    def __init__(self, taskID, period, encoder, encoder_share, output_share, delta_share, dbg = False):
+    def __init__(self, taskID, period, encoder, bus, axis, time_queue, position_queue, delta_queue, dbg = False, sampler = None, group = None):
         
         ## The name of the task
         self.taskID = taskID
         ## The period (in us) of the task
         self.period = period
         self.encoder = encoder
-        self.encoder_share = encoder_share
-        self.output_share = output_share
-        self.delta_share = delta_share
+        ## The axis bit this task answers to on the command bus
+        self.axis = axis
+        ## Commands for this encoder, delivered by the command bus
+        self.inbox = command_bus.Inbox()
+        bus.subscribe(command_bus.TOPIC_ENCODER, axis, self.inbox)
+        
+        # shares.Queue objects that carry captured samples to Task_User
+        self.time_queue = time_queue
+        self.position_queue = position_queue
+        self.delta_queue = delta_queue
+        ## An optional encoder_sampler.EncoderSampler that samples the encoder from a timer interrupt
+        self.sampler = sampler
+        ## An optional axis_group.AxisGroup that updates the encoder together with the others
+        self.group = group
         ## A flag indicating if debugging print messages display
         self.dbg = dbg
         
@@ -41,122 +49,68 @@ class Task_Encoder():
         ## we don't halt the program in event that none is entered
         self.ser = pyb.USB_VCP()
         
-        ## The state to run on the next iteration of the finite state machine
-        self.state = S0_init
-        ## The number of runs of the state machine
-        # self.runs = 0
-        
-        ## The utime.ticks_us() value associated with the next run of the FSM
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
+        ## The finite state machine; commands from the bus are dispatched through its table
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, command_bus.NUM_COMMANDS, S0_init,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        # display commands are answered while idle or gathering alike
+        self.fsm.on((S0_init, S1_gatherEncoderData), command_bus.ENC_ZERO, self.zeroEncoder)
+        self.fsm.on((S0_init, S1_gatherEncoderData), command_bus.ENC_SHOW_POSITION, self.showPosition)
+        self.fsm.on((S0_init, S1_gatherEncoderData), command_bus.ENC_SHOW_VELOCITY, self.showVelocity)
+        self.fsm.on(S0_init, command_bus.ENC_CAPTURE_START, self.startCapture)
+        self.fsm.on(S1_gatherEncoderData, command_bus.ENC_CAPTURE_STOP, self.stopCapture)
         
+        ## The number of runs of the state machine
         self.runs = 0
         
-    # this is called from main
+    # this is called by the scheduler once per period
     def run(self):
         ''' @brief Runs one iteration of the FSM
         '''
         
-        action = self.encoder_share.read()
-        current_time = utime.ticks_us()
-        
-        if (utime.ticks_diff(current_time, self.next_time) >= 0):
-            if self.state == S0_init:
-                
-                # zero encoder A
-                if (action == 1):
-                    self.transition_to(S1_zeroEncoder)
-                    if (self.encoder.get_encoder_ID() == "ENCODER A"):
-                        self.encoder.zero()
-                        print("{0} position zeroed".format(self.encoder.get_encoder_ID()))
-                        
-                        # clearing the encoder_share
-                        self.encoder_share.write(None)
-                        print()
-                        
-                # zero encoder B
-                elif (action == 6):
-                    self.transition_to(S1_zeroEncoder)
-                    if (self.encoder.get_encoder_ID() == "ENCODER B"):
-                        self.encoder.zero()
-                        print("{0} position zeroed".format(self.encoder.get_encoder_ID()))
-                        self.encoder_share.write(None)
-                        print()
-                        
-                # get position encoder A        
-                elif (action == 2):
-                    self.transition_to(S2_displayEncoderPosition)
-                    if (self.encoder.get_encoder_ID() == "ENCODER A"):
-                        self.encoder.read()
-                        print("{0} position: {1}".format(self.encoder.get_encoder_ID(), self.encoder.read()))
-                        self.encoder_share.write(None)
-                        print()
-                        
-                # get position encoder B        
-                elif (action == 7):
-                    self.transition_to(S2_displayEncoderPosition)
-                    if (self.encoder.get_encoder_ID() == "ENCODER B"):
-                        self.ticksToRadians(self.encoder.read())
-                        print("{0} position: {1}".format(self.encoder.get_encoder_ID(), self.encoder.read()))
-                        self.encoder_share.write(None)
-                        print()
-                
-                #get delta encoder A
-                # does not work properly, if memory serves.  I think the term project "get_delta" methods worked better
-                elif (action == 3):
-                    self.transition_to(S3_displayEncoderDelta)
-                    if (self.encoder.get_encoder_ID() == "ENCODER A"):
-                        self.encoder.get_delta()
-                        print("{0} (delta) speed: {1}".format(self.encoder.get_encoder_ID(), self.encoder.get_delta()))
-                        self.encoder_share.write(None)
-                        print()
-                
-                # get delta encoder B
-                # does not work properly, if memory serves.  I think the term project "get_delta" methods worked better
-                elif (action == 8):
-                    self.transition_to(S3_displayEncoderDelta)
-                    if (self.encoder.get_encoder_ID() == "ENCODER B"):
-                        self.encoder.get_delta()
-                        print("{0} (delta) speed: {1}".format(self.encoder.get_encoder_ID(), self.encoder.get_delta()))
-                        self.encoder_share.write(None)
-                        print()
-                
-                
-                # SUPER INEFFICIENT! this needs to be completely redone
-                # collect data encoder A
-                elif (action == 4):
-                    if (self.encoder.get_encoder_ID() == "ENCODER A"):
-                        self.output_share.write(self.encoder.read())
-                        self.delta_share.write(self.encoder.get_delta())
-                        self.encoder_share.write('k')
-                # collect data encoder B  
-                elif (action == 12):
-                    if (self.encoder.get_encoder_ID() == "ENCODER B"):
-                        self.output_share.write(self.encoder.read())
-                        self.delta_share.write(self.encoder.get_delta())
-                        self.encoder_share.write('j')
-                    
-                elif (action == 's'):
-                    self.encoder_share.write('s')
-                    
+        # sample the encoder once per period so position and delta stay current,
+        # or collect the samples the interrupt has taken since the last run; an
+        # axis group has already updated all of its encoders
+        if (self.group is None):
+            if (self.sampler is None):
+                self.encoder.update()
             else:
-                self.transition_to(S0_init)
-            self.next_time = utime.ticks_add(self.next_time, self.period)
-            self.runs += 1
+                self.sampler.drain()
+        
+        while (self.inbox.any()):
+            self.fsm.dispatch(self.inbox.get(), self.inbox.value)
+        
+        # stream one sample per run to Task_User until told to stop
+        if (self.fsm.state == S1_gatherEncoderData):
+            self.time_queue.put(self.encoder.get_timestamp())
+            self.position_queue.put(self.encoder.read())
+            self.delta_queue.put(self.encoder.get_delta())
+        
+        self.runs += 1
+    
+    def zeroEncoder(self, value):
+        self.encoder.zero()
+        print("{0} position zeroed".format(self.encoder.get_encoder_ID()))
+        print()
+    
+    def showPosition(self, value):
+        print("{0} position: {1}".format(self.encoder.get_encoder_ID(), self.encoder.read()))
+        print()
+    
+    def showVelocity(self, value):
+        print("{0} speed: {1} counts/s, {2:.3f} rad/s".format(self.encoder.get_encoder_ID(),
+              self.encoder.get_velocity(), fixed.to_float(self.radiansPerSecond())))
+        print()
+    
+    def startCapture(self, value):
+        return S1_gatherEncoderData
+    
+    def stopCapture(self, value):
+        return S0_init
    
     def ticksToRadians(self, ticks):
-       radians = float(ticks) * (2*math.pi / 4000)
-       return float(radians)
+       # Q16.16 fixed point, scaled by the encoder's own counts per revolution
+       return self.encoder.toRadians.apply(ticks)
    
-    def radiansPerSecond(self, dTicks):
-       dRadians = self.ticksToRadians(dTicks) * (1/self.period)
-       return float(dRadians)
-    
-    def transition_to(self, new_state):
-        ''' @brief      Transitions the FSM to a new state
-            @details    Optionally a debugging message can be printed
-                        if the dbg flag is set when the task object is created.
-            @param      new_state The state to transition to.
-        '''
-        if (self.dbg):
-            print('{:}: S{:}->S{:}'.format(self.taskID ,self.state,new_state))
-        self.state = new_state
\ No newline at end of file
+    def radiansPerSecond(self):
+       # the encoder timestamps every update, so its estimate already uses the real dt
+       return self.encoder.get_rad_per_s()
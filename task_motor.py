@@ -5,123 +5,82 @@ Created on Fri Oct 29 09:28:55 2021
 @author: jason
 """
 
-import utime, pyb
+import pyb, command_bus, fsm
 from micropython import const
+from line_input import NumericInput
 
 ## List of possible motor states
 # Definitely not implemented properly
 S0_init = const(0)
 S1_modifyDutyCycle = const(1)
+NUM_STATES = const(2)
 
 class Task_Motor:
     
-    def __init__(self, taskID, period, motor, motor_share, output_share, dbg = False):
+    def __init__(self, taskID, period, motor, bus, axis, console_share, dbg = False):
         self.taskID = taskID
         self.period = period
         self.motor = motor
-        self.motor_share = motor_share
-        self.output_share = output_share
+        ## The axis bit this task answers to on the command bus
+        self.axis = axis
+        ## Commands for this motor, delivered by the command bus
+        self.inbox = command_bus.Inbox()
+        bus.subscribe(command_bus.TOPIC_MOTOR, axis, self.inbox)
+        ## A shares.Share naming the task that owns the console, or None when Task_User has it
+        self.console_share = console_share
         self.dbg = dbg
         
         self.ser = pyb.USB_VCP()
-        self.state = S0_init
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
         
-    def run(self):
-
-        action = self.motor_share.read()
-        # debugging only
+        # duty cycle entry, clamped to the valid range when Enter is pressed
+        self.dutyInput = NumericInput(self.ser, -100, 100)
         
-        current_time = utime.ticks_us()
-        # self.duty = self.motor.getDuty()
+        ## The finite state machine; commands from the bus are dispatched through its table.
+        ## Commands are only dispatched while idle, so they wait in the inbox during an entry
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, command_bus.NUM_COMMANDS, S0_init,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        self.fsm.on(S0_init, command_bus.MOT_DUTY_ENTRY, self.startDutyEntry)
+        self.fsm.on(S0_init, command_bus.MOT_SET_DUTY, self.setDuty)
+        self.fsm.on_entry(S1_modifyDutyCycle, self.enterDutyEntry)
+        self.fsm.on_exit(S1_modifyDutyCycle, self.exitDutyEntry)
         
-        if (utime.ticks_diff(current_time, self.next_time) >= 0):
-            if (self.state == S0_init):
-                
-                if (action == 9):
-                    print("action == 9")
-                    self.transition_to(S1_modifyDutyCycle)
-                    print(self.motor.getMotorID())
-                    # if (self.motor.getMotorID() == "MOTOR A"):
-                    duty = self.collectBufferedInput("MOTOR A")
-                    self.modifyMotorOperation("MOTOR A", duty)
-                
-                elif (action == 10):
-                    self.transition_to(S1_modifyDutyCycle)
-                    if (self.motor.getMotorID() == "MOTOR B"):
-                        duty = self.collectBufferedInput("MOTOR B")
-                        self.modifyMotorOperation("MOTOR B", duty)
-                
-                # Both motors max fwd    
-                elif (action == 12):
-                    self.transition_to(S1_modifyDutyCycle)
-                    if (self.motor.getMotorID() == "MOTOR A"):
-                        self.modifyMotorOperation("MOTOR A", 100)
-                        self.motor_share.write(12)
-                        self.transition_to(S0_init)
-                                           
-                    elif (self.motor.getMotorID() == "MOTOR B"):
-                        self.modifyMotorOperation("MOTOR B", 100)
-                        self.motor_share.write(None)
-                        self.transition_to(S0_init)
-                
-                # Both motors max reverse        
-                elif (action == 13):
-                    self.transition_to(S1_modifyDutyCycle)
-                    
-                    if (self.motor.getMotorID() == "MOTOR A"):
-                        self.modifyMotorOperation("MOTOR A", -100)
-                        self.motor_share.write(13)
-                        self.transition_to(S0_init)
-                        
-                    elif (self.motor.getMotorID() == "MOTOR B"):
-                        self.modifyMotorOperation("MOTOR B", -100)
-                        self.motor_share.write(None)
-                        self.transition_to(S0_init)
-                        
-            else:
-                self.transition_to(S0_init)
-            self.next_time = utime.ticks_add(self.next_time, self.period)
-    
-    def collectBufferedInput(self, motorID):
-        print('Enter a duty cycle for {0}: '.format(motorID), end = '')
+    def run(self):
+        ''' @brief      Runs one iteration of the FSM
+            @return     True while a duty cycle is being typed or commands are
+                        still waiting, so that an event-driven scheduler keeps
+                        running the task.
+        '''
         
-        userInput = str(self.ser.read(2))
-        if (len(userInput) > 4):
-            t = userInput[2:4]
-        else:
-            t = userInput[2:3]
-        temp = list([])
+        while (self.fsm.state == S0_init and self.inbox.any()):
+            self.fsm.dispatch(self.inbox.get(), self.inbox.value)
+                    
+        if (self.fsm.state == S1_modifyDutyCycle):
+            if (self.dutyInput.poll()):
+                duty = self.dutyInput.value
+                # an empty entry leaves the duty cycle unchanged
+                if (duty is None):
+                    duty = self.motor.getDuty() * self.motor.getDirection()
+                self.modifyMotorOperation(self.motor.getMotorID(), duty)
+                self.fsm.transition_to(S0_init)
         
-        # hitting the 'enter' key sends \r character to the VCP
-        while (t != '\\r'):
-            
-            # append the information in the VCP to "duty" only if it is a digit
-            if (t.isdigit() or t == '-'):
-                # print('t is a digit')
-                print ('{0}'.format(t), end = '')
-                temp.append(t)
-            
-            userInput = str(self.ser.read(2))
-            if (len(userInput) > 4):
-                t = userInput[2:4]
-            else:
-                t = userInput[2:3]
-            
-            # NOTE: everytime we read values from the VCP, it then EMPTIES the VCP
-            # We need to store the value of the VCP in a temp variable if we wish to use it later
-        duty = ''.join(map(str, temp))
-        # print('duty is: |{0}|'.format(duty))
-        if (duty == ''):
-            duty = self.motor.getDuty() * self.motor.getDirection()
-        # handling the case of duty > 100
-        elif (int(duty) > 100):
-            duty = 100
-            
-        # handling the case of duty < 0
-        elif (int(duty) < -100):
-            duty = -100
-        return duty
+        return self.fsm.state == S1_modifyDutyCycle or self.inbox.any()
+    
+    def startDutyEntry(self, value):
+        # the entry is collected a few keystrokes at a time on later runs
+        # so that the other tasks keep running while the user types
+        return S1_modifyDutyCycle
+    
+    def setDuty(self, value):
+        # a duty cycle given with the command, e.g. full forward or reverse
+        self.modifyMotorOperation(self.motor.getMotorID(), value)
+    
+    def enterDutyEntry(self):
+        self.console_share.write(self.taskID)
+        self.dutyInput.start('Enter a duty cycle for {0}: '.format(self.motor.getMotorID()))
+    
+    def exitDutyEntry(self):
+        # hand the console back to Task_User
+        self.console_share.write(None)
     
     def modifyMotorOperation(self, motorID, duty):
         t = int(duty)
@@ -149,17 +108,3 @@ class Task_Motor:
                 print("{0} is running in reverse at {1}%\n".format(motorID, d))
             else:
                 print("{0} is stationary\n".format(motorID))
-        
-        self.motor_share.write(None)
-        self.transition_to(S0_init)
-                    
-    def transition_to(self, new_state):
-        ''' @brief      Transitions the FSM to a new state
-            @details    Optionally a debugging message can be printed
-                        if the dbg flag is set when the task object is created.
-            @param      new_state The state to transition to.
-        '''
-        if (self.dbg):
-            print('{:}: S{:}->S{:}'.format(self.taskID ,self.state,new_state))
-        self.state = new_state
-    
\ No newline at end of file
@@ -5,92 +5,76 @@ Created on Fri Nov  5 21:46:00 2021
 @author: jason
 """
 
-import utime, pyb
+import pyb, command_bus, fsm
 from micropython import const
 
 S0_init = const(0)
-S1_modifyMotorOperation = const(1)
-S2_clearFaultCondition = const(2)
+NUM_STATES = const(1)
 
 class Task_motorDriver():
     
-    def __init__(self, taskID, motorDriver, motor, motor_share, period, dbg):
+    def __init__(self, taskID, motorDriver, motor, bus, axis, period, dbg):
         self.taskID = taskID
         self.motorDriver = motorDriver
         # self.listOfMotors = listOfMotors
         self.motor = motor
         
-        self.motor_share = motor_share
+        ## The axis bit this task answers to on the command bus
+        self.axis = axis
+        ## Commands for this driver, delivered by the command bus
+        self.inbox = command_bus.Inbox()
+        bus.subscribe(command_bus.TOPIC_DRIVER, axis, self.inbox)
         self.period = period
         self.dbg = dbg
         
         self.ser = pyb.USB_VCP()
         
-        self.state = S0_init
+        ## The finite state machine; commands from the bus are dispatched through its table
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, command_bus.NUM_COMMANDS, S0_init,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        self.fsm.on(S0_init, command_bus.DRV_CLEAR_FAULT, self.clearFault)
+        self.fsm.on(S0_init, command_bus.DRV_TOGGLE_ENABLE, self.toggleEnable)
         
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
+        ## The number of driver faults already reported
+        self.seenFaults = motorDriver.faultCount
         
     def run(self):
         
-        action = self.motor_share.read()
-        current_time = utime.ticks_us()
+        # the fault interrupt has already disabled the bridge; report it here,
+        # where printing is allowed
+        if (self.motorDriver.faultCount != self.seenFaults):
+            print('  *** FAULT DETECTED! SUSPENDING L6206 HARDWARE OPERATION ***')
+            self.motorDriver.print_faults(self.seenFaults)
+            print()
+            self.seenFaults = self.motorDriver.faultCount
         
-        if (utime.ticks_diff(current_time, self.next_time) >= 0):
-            if (self.state == S0_init):
-                
-                #clearing the fault condition
-                if (action == 0):
-                    faultDetected = self.motorDriver.clearFaultCondition()
-                    if (faultDetected):
-                        print('        *** FAULT CONDITION CLEARED, RESUME NORMAL OPERATION ***')
-                    else:
-                        print('                  *** NO FAULT CONDITION DETECTED ***')
-                    print()
-                    
-                    self.motorDriver.enable()
-                    self.motor_share.write(None)
-                    self.transition_to(S0_init)                
-                
-                elif (action == 11):
-                    self.transition_to(S1_modifyMotorOperation)
-                    self.motor.toggleRunState()
-                    runState = self.motor.getRunState()
-
-                    # for index in range(len(self.listOfMotors)):
-                    #     m = self.listOfMotors[index]
-                    #     m.toggleRunState()
-                    #     runState = m.getRunState()
-                        
-                        #enable motors
-                    if (runState == True):
-                        print('{0} is enabled'.format(self.motor.getMotorID()))
-                        self.motorDriver.enable()
-                        print("Enabling the motor")
-                        # if (index == len(self.listOfMotors) - 1):
-                        #     print()
-                        self.motor_share.write(None)
-                        self.transition_to(S0_init)
-                    
-                    #disable motors
-                    else:
-                        print('{0} is disabled'.format(self.motor.getMotorID()))
-                        self.motorDriver.disable()
-                        # if (index == len(self.listOfMotors) - 1):
-                        #     print()
-                        self.motor_share.write(None)
-                        self.transition_to(S0_init)
-                                
+        while (self.inbox.any()):
+            self.fsm.dispatch(self.inbox.get(), self.inbox.value)
+    
+    def clearFault(self, value):
+        faultDetected = self.motorDriver.clearFaultCondition()
+        # a fault that is still present is latched again once the line has settled
+        self.motorDriver.enable()
+        if (faultDetected):
+            print('        *** FAULT CONDITION CLEARED, RESUME NORMAL OPERATION ***')
         else:
-            self.transition_to(S0_init)
-            self.next_time = utime.ticks_add(self.next_time, self.period)
-            # print('time modified')
+            print('                  *** NO FAULT CONDITION DETECTED ***')
+        print()
+    
+    def toggleEnable(self, value):
+        self.motor.toggleRunState()
+        runState = self.motor.getRunState()
         
-    def transition_to(self, new_state):
-        ''' @brief      Transitions the FSM to a new state
-            @details    Optionally a debugging message can be printed
-                        if the dbg flag is set when the task object is created.
-            @param      new_state The state to transition to.
-        '''
-        if (self.dbg):
-            print('{:}: S{:}->S{:}'.format(self.taskID ,self.state,new_state))
-        self.state = new_state   
\ No newline at end of file
+        #enable motors
+        if (runState == True):
+            if (self.motorDriver.enable()):
+                print('{0} is enabled'.format(self.motor.getMotorID()))
+                print("Enabling the motor")
+            else:
+                self.motor.toggleRunState()
+                print('{0} cannot be enabled until the fault is cleared [c]'.format(self.motor.getMotorID()))
+        
+        #disable motors
+        else:
+            print('{0} is disabled'.format(self.motor.getMotorID()))
+            self.motorDriver.disable()
@@ -0,0 +1,134 @@
+'''@file                       task_sysid.py
+   @brief                      System identification task: drives a motor with a test signal and records it.
+   @details                    On SID_START the task plays a precomputed excitation table (see
+                               excitation.py) into a motor_driver.Motor, one duty per encoder sample,
+                               and records the sample time, the duty applied and the encoder position
+                               into buffers allocated when the task is constructed. The motor's slew
+                               limit is lifted for the run so the recorded duty is the commanded one.
+                               When the table ends, or on SID_STOP, the motor is stopped and the
+                               recording is printed as a table that host/sysid.py fits a motor model to.
+                               The motor should not be under position control while the run lasts.
+'''
+
+import utime, command_bus, fsm
+from array import array
+from micropython import const
+
+## List of possible states
+S0_idle = const(0)
+S1_excite = const(1)
+NUM_STATES = const(2)
+
+class Task_SysID():
+    '''@brief                       Plays an excitation table into a motor and records the response.
+       @details                     Register it at the encoder period with waits_on=[task.inbox]; it
+                                    keeps itself scheduled while a run is in progress.
+    '''
+
+    def __init__(self, taskID, period, encoder, motor, bus, axis, table, dbg=False):
+        '''@brief                   Constructs a system identification task.
+           @param taskID            The name of the task
+           @param period            The period, in microseconds, between runs of the
+                                    task; normally the encoder period.
+           @param encoder           The encoder.Encoder measuring the response.
+           @param motor             The motor_driver.Motor to drive.
+           @param bus               The command_bus.CommandBus to take commands from.
+           @param axis              The axis bit this task answers to on the bus.
+           @param table             An array of duties in percent, e.g. from excitation.concat().
+           @param dbg               A boolean flag used to enable or disable debug
+                                    messages printed over the VCP
+        '''
+        ## The name of the task
+        self.taskID = taskID
+        ## The period (in us) of the task
+        self.period = period
+        self.encoder = encoder
+        self.motor = motor
+        self.table = table
+        ## A flag indicating if debugging print messages display
+        self.dbg = dbg
+
+        ## Commands for this task, delivered by the command bus
+        self.inbox = command_bus.Inbox()
+        bus.subscribe(command_bus.TOPIC_SYSID, axis, self.inbox)
+
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, command_bus.NUM_COMMANDS, S0_idle,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        self.fsm.on(S0_idle, command_bus.SID_START, self.start)
+        self.fsm.on(S1_excite, command_bus.SID_STOP, self.stop)
+        self.fsm.on_entry(S1_excite, self.beginRun)
+        self.fsm.on_exit(S1_excite, self.endRun)
+
+        n = len(table)
+        ## Microseconds from the first sample
+        self.times = array('l', [0] * n)
+        ## The duty applied over the interval that follows each sample
+        self.duties = array('b', [0] * n)
+        ## Encoder positions in counts
+        self.positions = array('l', [0] * n)
+        ## The number of samples recorded
+        self.numSamples = 0
+
+        self._startTime = 0
+        self._lastTime = 0
+        self._slew = 0
+
+    def run(self):
+        '''@brief                   Runs one iteration of the task
+           @return                  True while a run is in progress, so the scheduler keeps
+                                    running the task.
+        '''
+        while (self.inbox.any()):
+            self.fsm.dispatch(self.inbox.get(), self.inbox.value)
+
+        if (self.fsm.state == S1_excite):
+            # record each encoder sample once, however the two tasks happen to be phased
+            timestamp = self.encoder.get_timestamp()
+            if (timestamp != self._lastTime):
+                self._lastTime = timestamp
+                i = self.numSamples
+                if (i == 0):
+                    self._startTime = timestamp
+                self.times[i] = utime.ticks_diff(timestamp, self._startTime)
+                self.duties[i] = self.motor.applied
+                self.positions[i] = self.encoder.read()
+                i += 1
+                self.numSamples = i
+                if (i >= len(self.table)):
+                    self.fsm.transition_to(S0_idle)
+                else:
+                    self.motor.set_duty(self.table[i])
+
+        return self.fsm.state == S1_excite
+
+    def start(self, value):
+        return S1_excite
+
+    def stop(self, value):
+        return S0_idle
+
+    def beginRun(self):
+        # the first duty is applied with the next encoder sample, which is recorded
+        # as the first sample of the run
+        self.numSamples = 0
+        self._lastTime = self.encoder.get_timestamp()
+        self._slew = self.motor.slew
+        self.motor.set_slew(0)
+        self.motor.set_duty(self.table[0])
+        print('{:}: identifying {:} over {:.1f} s'.format(self.taskID, self.motor.getMotorID(),
+              len(self.table) * self.period / 1000000))
+
+    def endRun(self):
+        self.motor.set_duty(0)
+        self.motor.set_slew(self._slew)
+        self.printRun()
+
+    def printRun(self):
+        '''@brief                   Prints the recording in the format host/sysid.py reads.
+        '''
+        print('***System identification of {:}: {:} samples every {:} us'.format(
+              self.motor.getMotorID(), self.numSamples, self.period))
+        print('Time [us]       Duty [%]      Position [counts]')
+        for i in range(self.numSamples):
+            print('{0} ,          {1} ,          {2}'.format(self.times[i], self.duties[i], self.positions[i]))
+        print('***End of system identification\n')
@@ -10,43 +10,134 @@ Created on Fri Oct 15 14:07:04 2021
    @details                    Implements a finite state machine
 '''
 
-import utime, pyb, gc
+import pyb, struct, command_bus, fsm, timebase
+from array import array
 from micropython import const
 
-## List of possible encoder states
+## List of possible user interface states
 S0_init = const(0)
 S1_waitForInput = const(1)
+S2_gatherData = const(2)
+NUM_STATES = const(3)
+
+## List of user interface events; every key of the menu maps to one of these
+EV_INVALID = const(0)
+EV_ZERO = const(1)
+EV_POSITION = const(2)
+EV_VELOCITY = const(3)
+EV_DUTY_ENTRY = const(4)
+EV_MAX_FWD = const(5)
+EV_MAX_REV = const(6)
+EV_CLEAR_FAULT = const(7)
+EV_CAPTURE = const(8)
+EV_STOP = const(9)
+EV_TOGGLE_ENABLE = const(10)
+EV_REPORT = const(11)
+EV_RESET_STATS = const(12)
+EV_MENU = const(13)
+EV_ROTATE = const(14)
+EV_RELEASE = const(15)
+EV_IDENTIFY = const(16)
+EV_AUTOTUNE = const(17)
+NUM_EVENTS = const(18)
+
+## The menu: the keys, the event they raise and the value passed with it
+KEYS = (
+    ('z', EV_ZERO, command_bus.AXIS_A),
+    ('Z', EV_ZERO, command_bus.AXIS_B),
+    ('p', EV_POSITION, command_bus.AXIS_A),
+    ('P', EV_POSITION, command_bus.AXIS_B),
+    ('d', EV_VELOCITY, command_bus.AXIS_A),
+    ('D', EV_VELOCITY, command_bus.AXIS_B),
+    ('m', EV_DUTY_ENTRY, command_bus.AXIS_A),
+    ('M', EV_DUTY_ENTRY, command_bus.AXIS_B),
+    ('xX', EV_MAX_FWD, 100),
+    ('yY', EV_MAX_REV, -100),
+    ('cC', EV_CLEAR_FAULT, 0),
+    ('g', EV_CAPTURE, command_bus.AXIS_A),
+    ('G', EV_CAPTURE, command_bus.AXIS_B),
+    ('sS', EV_STOP, 0),
+    ('eE', EV_TOGGLE_ENABLE, 0),
+    ('t', EV_REPORT, 0),
+    ('T', EV_RESET_STATS, 0),
+    ('hH', EV_MENU, 0),
+    ('r', EV_ROTATE, command_bus.AXIS_A),
+    ('R', EV_ROTATE, command_bus.AXIS_B),
+    ('l', EV_RELEASE, command_bus.AXIS_A),
+    ('L', EV_RELEASE, command_bus.AXIS_B),
+    ('i', EV_IDENTIFY, command_bus.AXIS_A),
+    ('I', EV_IDENTIFY, command_bus.AXIS_B),
+    ('a', EV_AUTOTUNE, command_bus.AXIS_A),
+    ('A', EV_AUTOTUNE, command_bus.AXIS_B),
+)
+
+## The length of the move started by [r/R], in degrees
+ROTATE_DEGREES = const(360)
+## The relay duty of an autotune experiment started by [a/A], in percent
+AUTOTUNE_RELAY = const(30)
+## The most samples the capture buffers hold; at 10 bytes a sample this bounds their RAM
+MAX_CAPTURE_SAMPLES = const(3001)
+## Stored deltas are clamped to the range of the 16-bit delta buffer
+DELTA_LIMIT = const(32767)
+
+def _zeros(typecode, n):
+    # built from a bytes object, so no temporary list of n ints is allocated
+    return array(typecode, bytes(n * struct.calcsize(typecode)))
 
 class Task_User():
     '''@brief                       User interface task for cooperative multitasking example.
        @details                     Implements a finite state machine
     '''
     
-    def __init__(self, taskID, period, encoder_share, output_share, delta_share, motor_share, dbg=False):
+    def __init__(self, taskID, period, bus, time_queue, position_queue, delta_queue, console_share, dbg=False, captureTime=30, telemetry=None, scheduler=None, gcManager=None, samplePeriod=None, maxSamples=MAX_CAPTURE_SAMPLES):
         '''@brief                   Constructs an LED task.
            @details                 The LED task is implemented as a finite state
                                     machine.
            @param name              The name of the task
            @param period            The period, in microseconds, between runs of 
                                     the task.
-           @param encoder_share     A shares.Share object used to hold instructions
-                                    for the encoder.
-           @param dbg               A boolean flag used to enable or disable debug
-                                    messages printed over the VCP
+           @param bus               The command_bus.CommandBus the other tasks subscribe to.
+           @param time_queue        A shares.Queue of sample timestamps from Task_Encoder.
+           @param position_queue    A shares.Queue of sampled positions from Task_Encoder.
+           @param delta_queue       A shares.Queue of sampled deltas from Task_Encoder.
+           @param console_share     A shares.Share that is not None while another task
+                                    is reading from the console.
+           @param dbg               A boolean flag used to enable or disable the
+                                    trace of state transitions
+           @param captureTime       The length, in seconds, of a data collection run.
+                                    Together with samplePeriod it sizes the capture buffers.
+           @param telemetry         An optional telemetry.TelemetryWriter. When given,
+                                    samples are streamed as binary frames while the
+                                    capture runs instead of printed when it ends.
+           @param scheduler         The scheduler.Scheduler running the tasks, used
+                                    by the timing report commands. Capture times are
+                                    measured with its timebase.Timebase.
+           @param gcManager         An optional gc_manager.GCManager. It is asked for a
+                                    collection after a data collection run, and its heap
+                                    report is shown with the timing report.
+           @param samplePeriod      The period, in microseconds, at which captured samples
+                                    arrive in the queues: the period of the encoder tasks,
+                                    which queue one sample per run whether or not the
+                                    encoders are sampled from an interrupt. Defaults to
+                                    this task's period.
+           @param maxSamples        The most samples the capture buffers hold. A run with
+                                    more samples than this keeps every n-th one, so it still
+                                    spans the whole capture time.
         '''
         ## The name of the task
         self.taskID = taskID
         ## The period (in us) of the task
         self.period = period
-        ## A shares.Share object representing encoder
-        self.encoder_share = encoder_share
+        ## The command bus the encoder, motor and driver tasks listen on
+        self.bus = bus
         
-        ## A shares.Share object representing the encoder output
-        self.output_share = output_share
+        # captured samples arrive in these queues, one entry per encoder run
+        self.time_queue = time_queue
+        self.position_queue = position_queue
+        self.delta_queue = delta_queue
         
-        self.delta_share = delta_share
-        
-        self.motor_share = motor_share
+        ## Names the task that owns the console, or None when this task does
+        self.console_share = console_share
         
         ## A flag indicating if debugging print messages display
         self.dbg = dbg
@@ -57,114 +148,175 @@ class Task_User():
         ## we don't halt the program in event that none is entered
         self.ser = pyb.USB_VCP()
         
-        ## The state to run on the next iteration of the finite state machine
-        self.state = S0_init
         ## The number of runs of the state machine
         # self.runs = 0
         
-        ## The utime.ticks_us() value associated with the next run of the FSM
-        self.next_time = utime.ticks_add(utime.ticks_us(), self.period)
+        # a keystroke is looked up in these tables instead of compared against every
+        # menu entry; keys that are not in the menu raise EV_INVALID
+        self._keyEvent = bytearray(128)
+        self._keyValue = array('b', [0] * 128)
+        for keys, event, value in KEYS:
+            for key in keys:
+                self._keyEvent[ord(key)] = event
+                self._keyValue[ord(key)] = value
         
-        # the list where the times are stored
-        self.times = []
-        self.offsetTime = 0
+        ## The finite state machine; keystrokes are dispatched through its table
+        self.fsm = fsm.StateMachine(taskID, NUM_STATES, NUM_EVENTS, S0_init,
+                                    fsm.TRACE_SIZE if dbg else 0)
+        ready = (S1_waitForInput, S2_gatherData)
+        self.fsm.on(ready, EV_INVALID, self.invalidKey)
+        self.fsm.on(ready, EV_ZERO, self.zeroEncoder)
+        self.fsm.on(ready, EV_POSITION, self.showPosition)
+        self.fsm.on(ready, EV_VELOCITY, self.showVelocity)
+        self.fsm.on(ready, EV_DUTY_ENTRY, self.startDutyEntry)
+        self.fsm.on(ready, EV_MAX_FWD, self.setDuty)
+        self.fsm.on(ready, EV_MAX_REV, self.setDuty)
+        self.fsm.on(ready, EV_CLEAR_FAULT, self.clearFault)
+        self.fsm.on(S1_waitForInput, EV_CAPTURE, self.startCapture)
+        self.fsm.on(S2_gatherData, EV_CAPTURE, self.captureInProgress)
+        self.fsm.on(ready, EV_STOP, self.stopCapture)
+        self.fsm.on(ready, EV_TOGGLE_ENABLE, self.toggleEnable)
+        self.fsm.on(ready, EV_REPORT, self.showReport)
+        self.fsm.on(ready, EV_RESET_STATS, self.resetStats)
+        self.fsm.on(ready, EV_MENU, self.showMenu)
+        self.fsm.on(ready, EV_ROTATE, self.rotate)
+        self.fsm.on(ready, EV_RELEASE, self.release)
+        self.fsm.on(S1_waitForInput, EV_IDENTIFY, self.identify)
+        self.fsm.on(S1_waitForInput, EV_AUTOTUNE, self.autotune)
+        self.fsm.on_entry(S1_waitForInput, self.displayMenuOnce)
+        self.fsm.on_exit(S2_gatherData, self.haltDataGathering)
+        ## True until the menu has been shown once
+        self.firstMenu = True
         
-        # the list where the positions are stored
-        self.positions = []
-        # the list where the deltas are stored
-        self.deltas = []
+        ## The length of a data collection run, in microseconds
+        self.captureTime = int(captureTime * 1000000)
+        if (samplePeriod is None):
+            samplePeriod = period
+        # the samples one run produces at one sample per samplePeriod; if they do
+        # not fit in maxSamples, only every decimation-th one is stored
+        runSamples = self.captureTime // samplePeriod + 1
+        ## The number of samples received for every sample stored
+        self.decimation = (runSamples + maxSamples - 1) // maxSamples
+        ## The number of samples the capture buffers hold
+        self.captureSize = (runSamples + self.decimation - 1) // self.decimation
         
-        # SHOULD NOT NEED THE GARBAGE COLLECTOR!!!!!!!!!!!
-        gc.enable()
+        # capture buffers are allocated once so that gathering data never
+        # touches the heap; times are microseconds since the start of the run
+        self.times = _zeros('l', self.captureSize)
+        ## Extends sample timestamps so runs longer than utime.ticks_diff() can measure keep their time axis
+        self.clock = scheduler.clock if scheduler is not None else timebase.Timebase()
+        self.offsetTime = 0
+        
+        # the array where the positions are stored
+        self.positions = _zeros('l', self.captureSize)
+        # the array where the deltas are stored; each is the motion since the
+        # previous stored sample
+        self.deltas = _zeros('h', self.captureSize)
+        ## The number of samples in the capture buffers
+        self.numSamples = 0
+        ## The number of samples received in the present run
+        self.numReceived = 0
+        # the motion of the samples received since the last one stored
+        self._deltaSum = 0
+        ## Streams captured samples as binary frames, if not None
+        self.telemetry = telemetry
+        ## The scheduler whose timing statistics the [t/T] commands show
+        self.scheduler = scheduler
+        ## Collects garbage in the scheduler's idle time, if not None
+        self.gcManager = gcManager
         
     def run(self):
         '''@brief                   Runs one iteration of the FSM
         '''
-        gc.collect()
-        current_time = utime.ticks_us()
-        if (utime.ticks_diff(current_time, self.next_time) >= 0):
-            if self.state == S0_init:
-                
-                # displaying the menu and then advancing to state 1 of the
-                # task_user FSM
-                self.displayMenu()
-                self.transition_to(S1_waitForInput)       
-                
-        # we have to change the value in the VCM, otherwise the program will run in an inifinite loop
-        # this is why we are reading letters and writing/sharing numbers
-            elif self.state == S1_waitForInput:
-                if (self.ser.any()):
-                    char_in = self.ser.read(1).decode()
-                    if (char_in == 'z'):
-                        # passing the character to the task_encoder
-                        self.encoder_share.write(1)
-                            
-                    elif (char_in == 'Z'):
-                        self.encoder_share.write(6)
-                        
-                    elif(char_in == 'p'):
-                        self.encoder_share.write(2)
-                        
-                    elif (char_in == 'P'):
-                        self.encoder_share.write(7)
-                        
-                    elif (char_in == 'd'):
-                        self.encoder_share.write(3)
-                        
-                    elif (char_in == 'D'):
-                        self.encoder_share.write(8)
-                        
-                    elif (char_in == 'm'):
-                        self.motor_share.write(9)
-                        print("you pressed 'm'")
-                    
-                    elif (char_in == 'M'):
-                        self.motor_share.write(10)
-                        
-                    elif (char_in == 'x' or char_in == 'X'):
-                        self.motor_share.write(12)
-                        
-                    elif (char_in == 'y' or char_in == 'Y'):
-                        self.motor_share.write(13)
-                        
-                    elif (char_in == 'c' or char_in == 'C'):
-                        self.motor_share.write(0)
-                    
-                    elif (char_in == 'g'):
-                        print ('Beginning encoder 1 data collection...')
-                        self.start_time = current_time    
-                        self.encoder_share.write(4)    
-                            
-                    elif (char_in == 'G'):
-                        print ('Beginning encoder 2 data collection...')
-                        self.start_time = current_time    
-                        self.encoder_share.write(12)    
-                            
-                    elif (char_in == 's' or char_in == 'S'):
-                        self.haltDataGathering()
-                    
-                    elif (char_in == 'e' or char_in == 'E'):
-                        self.motor_share.write(11)
-                        
-                    elif (char_in == 'h' or char_in == 'H'):
-                        self.displayMenu()
-                    
-                    # input validation done here
-                    else:
-                        print('Command \'{:}\' is invalid.'.format(char_in))
-                
-                #gathering data
-                if (self.encoder_share.read() == 'k'):
-                    self.gatherData(current_time, 4)
-                  
-                elif (self.encoder_share.read() == 'j'):
-                    self.gatherData(current_time, 12)
-                    
+        if (self.fsm.state == S0_init):
+            self.fsm.transition_to(S1_waitForInput)
+            return
+        
+        # a motor task owns the console while a duty cycle is being typed
+        if (self.console_share.read() is None and self.ser.any()):
+            key = self.ser.read(1)[0]
+            if (key < 128):
+                event = self._keyEvent[key]
             else:
-                raise ValueError('Invalid State')
-            
-            self.next_time = utime.ticks_add(self.next_time, self.period)
-            # self.runs += 1
+                event = EV_INVALID
+            self.fsm.dispatch(event, self._keyValue[key] if event != EV_INVALID else key)
+        
+        #gathering data
+        while (self.fsm.state == S2_gatherData and self.time_queue.num_in() > 0):
+            self.gatherData(self.time_queue.get(), self.position_queue.get(), self.delta_queue.get())
+        
+        # self.runs += 1
+    
+    def invalidKey(self, key):
+        # input validation done here
+        print('Command \'{:}\' is invalid.'.format(chr(key)))
+    
+    def zeroEncoder(self, axis):
+        # passing the command to the encoder task
+        self.encoderCommand(command_bus.ENC_ZERO, axis)
+    
+    def showPosition(self, axis):
+        self.encoderCommand(command_bus.ENC_SHOW_POSITION, axis)
+    
+    def showVelocity(self, axis):
+        self.encoderCommand(command_bus.ENC_SHOW_VELOCITY, axis)
+    
+    def setDuty(self, duty):
+        self.bus.publish(command_bus.TOPIC_MOTOR, command_bus.MOT_SET_DUTY, command_bus.AXIS_ALL, duty)
+    
+    def rotate(self, axis):
+        # the controller plans a smooth move instead of stepping the duty cycle
+        if (not self.bus.publish(command_bus.TOPIC_CONTROLLER, command_bus.CTL_MOVE, axis, ROTATE_DEGREES)):
+            print('No controller on that axis\n')
+    
+    def release(self, axis):
+        self.bus.publish(command_bus.TOPIC_CONTROLLER, command_bus.CTL_RELEASE, axis)
+    
+    def identify(self, axis):
+        # the identification task prints its own table when the run ends
+        if (not self.bus.publish(command_bus.TOPIC_SYSID, command_bus.SID_START, axis)):
+            print('No identification task on that axis\n')
+    
+    def autotune(self, axis):
+        # the controller takes over with the new gains once the experiment ends
+        if (not self.bus.publish(command_bus.TOPIC_CONTROLLER, command_bus.CTL_AUTOTUNE, axis, AUTOTUNE_RELAY)):
+            print('No controller on that axis\n')
+    
+    def clearFault(self, value):
+        self.bus.publish(command_bus.TOPIC_DRIVER, command_bus.DRV_CLEAR_FAULT)
+    
+    def toggleEnable(self, value):
+        self.bus.publish(command_bus.TOPIC_DRIVER, command_bus.DRV_TOGGLE_ENABLE)
+    
+    def showReport(self, value):
+        if (self.scheduler is not None):
+            self.scheduler.report()
+        else:
+            print('No scheduler to report on')
+        if (self.gcManager is not None):
+            self.gcManager.report()
+        if (self.scheduler is not None):
+            # the transitions of every task running with dbg on
+            for entry in self.scheduler.tasks:
+                machine = getattr(entry.task, 'fsm', None)
+                if (machine is not None and machine.traceSize > 0):
+                    machine.print_trace()
+    
+    def resetStats(self, value):
+        if (self.scheduler is not None):
+            self.scheduler.reset_stats()
+            print('Task timing statistics cleared\n')
+        if (self.gcManager is not None):
+            self.gcManager.reset_stats()
+    
+    def showMenu(self, value):
+        self.displayMenu()
+    
+    def displayMenuOnce(self):
+        # the menu is printed when the interface first becomes ready, not after every capture
+        if (self.firstMenu):
+            self.firstMenu = False
+            self.displayMenu()
     
     def displayMenu(self):
         
@@ -181,94 +333,125 @@ class Task_User():
         print ('| [M]     Modify duty cycle for motor 2                             |')
         print ('| [x/X]   Shortcut: Set both motors to max FWD                      |')
         print ('| [y/Y]   Shortcut: Set both motors to max REV                      |')
+        print ('| [r]     Rotate motor 1 one revolution under position control      |')
+        print ('| [R]     Rotate motor 2 one revolution under position control      |')
+        print ('| [l/L]   Release motor 1 / motor 2 from position control           |')
+        print ('| [i/I]   Identify the model of motor 1 / motor 2                   |')
+        print ('| [a/A]   Autotune the position control gains of motor 1 / motor 2  |')
         print ('| [g]     Collect encoder 1 data for 30 seconds and display output  |')
         print ('| [G]     Collect encoder 2 data for 30 seconds and display output  |')
         print ('| [s/S]   End data collection prematurely                           |')
         print ('| [e/E]   Enable / Disable motors                                   |')
         print( "+-------------------------------------------------------------------+")
         print ('| [c/C]   Clear fault condition                                     |')
+        print ('| [t]     Display task timing report and debug traces               |')
+        print ('| [T]     Reset task timing statistics                              |')
         print ('| [h/H]   Print this menu to the console                            |')        
         print ('| Ctrl+c  Terminate the program                                     |')
         print ("+-------------------------------------------------------------------+\n")
     
-    ## this function cleans numeric output prior to printing it to the summary
-    ## Rounds decimals to the two places and appends trailing zeros as necessary
-    def formatNumeric(self, value, numPlaces):
-        value = str(value)
-        charArray = [char for char in value]
-        
-        decimalIndex = -1
-        decimal = []
-        
-        for index in range(len(charArray)):
-            if (charArray[index] == '.'):
-                decimalIndex = index
-            if (decimalIndex >= 0):
-                decimal.append(charArray[index])
-        
-        whole = value[0:decimalIndex]
-        dec = ''
-                
-        if (len(decimal) == 1):
-            decimal.append('0')
-            decimal.append('0')
-        elif (len(decimal) == 2):
-            decimal.append('0')
-        elif (len(decimal) > 3):
-            hun = decimal[2]
-            thou = decimal[3]
-            
-            if (int(thou) >= 5):
-                hun = int(hun) + 1
-            dec = ''.join(decimal[0:3])
-        
-        value = whole + dec
-        
-        return value
+    def encoderCommand(self, cmd, axis):
+        '''@brief                   Sends a command to the encoder task of one axis.
+        '''
+        if (not self.bus.publish(command_bus.TOPIC_ENCODER, cmd, axis)):
+            print('No encoder on that axis\n')
     
-    def gatherData(self, current_time, code):
-        # print('adding an entry')
-        gc.collect()
-        self.times.append((current_time - self.start_time)/1000000)
-        self.positions.append(self.output_share.read())
-        self.deltas.append(self.delta_share.read())
-        self.output_share.write(None)
-        self.delta_share.write(None)
-        # print("time diff: {0}".format((utime.ticks_diff(current_time, self.start_time)/1000000)))
-        if ((utime.ticks_diff(current_time, self.start_time)/1000000) < 30.00):
-            self.encoder_share.write(code)
+    def startDutyEntry(self, axis):
+        '''@brief                   Hands the console to the motor task of one axis.
+           @details                 The console is claimed here, before the motor task
+                                    runs, so no keystroke meant for the entry is read
+                                    as a command in between.
+        '''
+        if (self.bus.publish(command_bus.TOPIC_MOTOR, command_bus.MOT_DUTY_ENTRY, axis)):
+            self.console_share.write(self.taskID)
         else:
-            # print('Time is up')
-            # self.encoder_share.write('s')
-            self.haltDataGathering()
+            print('No motor on that axis\n')
     
-    def haltDataGathering(self):
-        gc.collect()
-        print('************************** Data Output ****************************')
-        print('-------------------------------------------------------------------')
-        print('Time [s]        Position [rad]        Delta [rad/s]')
-        
-        #cycling through the output list to display it on the screen
-        
-        for i in range(0, len(self.times)):
-            print("{0} ,          {1} ,                   {2}".format(self.formatNumeric(self.times[i], 2), self.positions[i], self.deltas[i]))
-                            
-        print('***End of data collection\n')
-        self.encoder_share.write(None) # clear the encoder share
-        self.output_share.write(None) # clear the output share
-        
-        # clearing the arrays
-        self.times = [] 
-        self.positions = [] 
-        self.deltas = [] 
-        gc.collect()
+    def startCapture(self, axis):
+        '''@brief                   Starts a data collection run.
+           @details                 Rewinds the write index of the capture buffers
+                                    and asks the encoder task of the axis to stream samples.
+           @param axis              The command_bus axis to collect from.
+           @return                  S2_gatherData if an encoder task serves the axis.
+        '''
+        self.time_queue.clear()
+        self.position_queue.clear()
+        self.delta_queue.clear()
+        self.numSamples = 0
+        self.numReceived = 0
+        self._deltaSum = 0
+        # the run starts at the timestamp of its first sample
+        self.start_time = None
+        if (self.bus.publish(command_bus.TOPIC_ENCODER, command_bus.ENC_CAPTURE_START, axis)):
+            print('Beginning encoder {0} data collection...'.format(1 if axis == command_bus.AXIS_A else 2))
+            return S2_gatherData
+        print('No encoder on that axis\n')
+    
+    def captureInProgress(self, axis):
+        print('Data collection already in progress\n')
+    
+    def stopCapture(self, value):
+        # leaving the gathering state prints or ends the run
+        if (self.fsm.state == S2_gatherData):
+            return S1_waitForInput
+        print('No data collection in progress\n')
+    
+    def gatherData(self, timestamp, position, delta):
+        '''@brief                   Stores one sample in the capture buffers.
+           @details                 Every sample is streamed to telemetry, if there is any,
+                                    but only every decimation-th one is stored. Ends the
+                                    run when the capture time has elapsed or the buffers
+                                    are full.
+           @param timestamp         The utime.ticks_us() value of the sample.
+           @param position          The encoder position, in counts.
+           @param delta             The encoder delta, in counts.
+        '''
+        if (self.start_time is None):
+            self.start_time = self.clock.mark(timestamp)
+        elapsed = self.clock.elapsed(timestamp, self.start_time)
+        if (self.telemetry is not None):
+            self.telemetry.add(elapsed, position, delta)
+        self._deltaSum += delta
+        received = self.numReceived
+        self.numReceived = received + 1
+        if (received % self.decimation == 0):
+            i = self.numSamples
+            self.times[i] = elapsed
+            self.positions[i] = position
+            delta = self._deltaSum
+            if (delta > DELTA_LIMIT):
+                delta = DELTA_LIMIT
+            elif (delta < -DELTA_LIMIT):
+                delta = -DELTA_LIMIT
+            self.deltas[i] = delta
+            self._deltaSum = 0
+            self.numSamples = i + 1
+        if (elapsed >= self.captureTime or self.numSamples >= self.captureSize):
+            self.fsm.transition_to(S1_waitForInput)
     
-    def transition_to(self, new_state):
-        '''@brief                   Transitions the FSM to a new state
-           @details                 Optionally a debugging message can be printed
-                                    if the dbg flag is set when the task object is created.
-           @param                   new_state The state to transition to.
+    def haltDataGathering(self):
+        '''@brief                   Ends a data collection run; the exit hook of S2_gatherData.
         '''
-        if (self.dbg):
-            print('{:}: S{:}->S{:}'.format(self.taskID ,self.state,new_state))
-        self.state = new_state
\ No newline at end of file
+        if (self.telemetry is not None):
+            # the samples have already been streamed while the capture ran
+            self.telemetry.end()
+            print('***End of data collection, {0} samples streamed\n'.format(self.numReceived))
+        else:
+            print('************************** Data Output ****************************')
+            print('-------------------------------------------------------------------')
+            print('Time [us]       Position [counts]     Delta [counts]')
+            
+            #cycling through the output list to display it on the screen
+            
+            for i in range(0, self.numSamples):
+                print("{0} ,          {1} ,                   {2}".format(self.times[i], self.positions[i], self.deltas[i]))
+                                
+            print('***End of data collection\n')
+        # stop every encoder that is still streaming
+        self.bus.publish(command_bus.TOPIC_ENCODER, command_bus.ENC_CAPTURE_STOP)
+        
+        # emptying the arrays; the storage is kept for the next run
+        self.numSamples = 0
+        # printing the run left a lot of garbage; collect it in the next idle time
+        if (self.gcManager is not None):
+            self.gcManager.request()
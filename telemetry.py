@@ -0,0 +1,138 @@
+''' @file                       telemetry.py
+    @brief                      Binary framed telemetry stream for captured encoder data.
+    @details                    Samples are packed with struct into frames and written to the USB_VCP while
+                                a capture is running, instead of being printed one line at a time at the end.
+                                Every frame is laid out as
+
+                                    sync (A5 5A) | type u8 | seq u16 | n u8 | n samples | crc u16
+
+                                with all fields little-endian. A sample is time u64 (microseconds since the
+                                start of the capture, which does not wrap on long runs), position i32 and
+                                delta i32, both in encoder counts.
+                                The CRC is CRC-16/CCITT-FALSE over type..samples. FRAME_END closes a capture
+                                and carries no samples. Because console text shares the link, the host
+                                decoder (host/telemetry_decode.py) searches for the sync bytes and uses the
+                                CRC to reject anything that is not a frame.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import struct
+from array import array
+from micropython import const
+
+## Frame type: a batch of samples
+FRAME_DATA = const(1)
+## Frame type: end of capture
+FRAME_END = const(2)
+
+## The two sync bytes that start every frame
+SYNC0 = const(0xA5)
+SYNC1 = const(0x5A)
+
+## Bytes before the samples: sync, type, seq, n
+HEADER_SIZE = const(6)
+## Bytes per sample: time, position, delta
+SAMPLE_SIZE = const(16)
+## Bytes after the samples: crc
+CRC_SIZE = const(2)
+
+_SAMPLE_FORMAT = '<Qii'
+
+def _make_crc_table():
+    table = array('H', [0] * 256)
+    for i in range(256):
+        crc = i << 8
+        for _ in range(8):
+            if (crc & 0x8000):
+                crc = ((crc << 1) ^ 0x1021) & 0xFFFF
+            else:
+                crc = (crc << 1) & 0xFFFF
+        table[i] = crc
+    return table
+
+_CRC_TABLE = _make_crc_table()
+
+def crc16(buf, start, end):
+    '''   @brief                  CRC-16/CCITT-FALSE of buf[start:end] without slicing.
+       @param buf                 A bytes-like object.
+       @param start               Index of the first byte.
+       @param end                 Index one past the last byte.
+       @return                    The 16-bit CRC.
+    '''
+    crc = 0xFFFF
+    table = _CRC_TABLE
+    for i in range(start, end):
+        crc = ((crc << 8) & 0xFFFF) ^ table[((crc >> 8) ^ buf[i]) & 0xFF]
+    return crc
+
+class TelemetryWriter:
+    '''     @brief                  Packs samples into frames and writes them to a serial port.
+        @details                The frame buffer is allocated once; add() packs in place with
+                                struct.pack_into and writes a frame each time it fills.
+    '''
+
+    def __init__(self, ser, samplesPerFrame = 8):
+        '''     @brief              Constructs a writer for one serial port.
+            @param ser          A pyb.USB_VCP or any object with write().
+            @param samplesPerFrame The number of samples sent together in one frame.
+        '''
+        if (samplesPerFrame < 1 or samplesPerFrame > 255):
+            raise ValueError('samplesPerFrame must be between 1 and 255')
+        self.ser = ser
+        self.samplesPerFrame = samplesPerFrame
+        self._frame = bytearray(HEADER_SIZE + samplesPerFrame * SAMPLE_SIZE + CRC_SIZE)
+        self._frame[0] = SYNC0
+        self._frame[1] = SYNC1
+        self._view = memoryview(self._frame)
+        self._count = 0
+        ## Sequence number of the next frame
+        self.seq = 0
+        ## The number of frames written
+        self.frames = 0
+
+    def add(self, time, position, delta):
+        '''     @brief              Adds one sample, writing a frame when it is full.
+            @param time         Microseconds since the start of the capture.
+            @param position     Encoder position in counts.
+            @param delta        Encoder delta in counts.
+        '''
+        struct.pack_into(_SAMPLE_FORMAT, self._frame, HEADER_SIZE + self._count * SAMPLE_SIZE,
+                         time, position, delta)
+        self._count += 1
+        if (self._count >= self.samplesPerFrame):
+            self._send(FRAME_DATA)
+
+    def flush(self):
+        '''     @brief              Writes any samples waiting in a partially filled frame.
+        '''
+        if (self._count > 0):
+            self._send(FRAME_DATA)
+
+    def end(self):
+        '''     @brief              Flushes and marks the end of the capture.
+        '''
+        self.flush()
+        self._send(FRAME_END)
+
+    def _send(self, frameType):
+        n = self._count
+        frame = self._frame
+        frame[2] = frameType
+        frame[3] = self.seq & 0xFF
+        frame[4] = (self.seq >> 8) & 0xFF
+        frame[5] = n
+        end = HEADER_SIZE + n * SAMPLE_SIZE
+        crc = crc16(frame, 2, end)
+        frame[end] = crc & 0xFF
+        frame[end + 1] = crc >> 8
+        end += CRC_SIZE
+        if (end == len(frame)):
+            self.ser.write(frame)
+        else:
+            self.ser.write(self._view[:end])
+        self.seq = (self.seq + 1) & 0xFFFF
+        self.frames += 1
+        self._count = 0
@@ -0,0 +1,107 @@
+''' @file                       timebase.py
+    @brief                      Wrap-free microsecond time built on utime.ticks_us().
+    @details                    utime.ticks_us() wraps every TICKS_PERIOD microseconds, about 17.9 minutes on
+                                the Pyboard, and utime.ticks_diff() is only correct for intervals shorter
+                                than half of that. A Timebase counts the wraps so that any ticks value read
+                                since the last update() can be extended to a monotonic 64-bit microsecond
+                                count. The scheduler calls update() on every pass, which is far more often
+                                than the counter wraps; update() is a few integer operations and allocates nothing.
+                                Extended times grow past the small-int range after the first wrap and are
+                                then heap integers, so code that runs on every sample should keep a
+                                mark() and use elapsed(), which stays a small int for the first 17.9
+                                minutes after the mark.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import utime
+from micropython import const
+
+## The largest value utime.ticks_us() returns
+TICKS_MAX = const(0x3FFFFFFF)
+## The period, in microseconds, at which utime.ticks_us() wraps
+TICKS_PERIOD = TICKS_MAX + 1
+_TICKS_HALF = const(0x20000000)
+
+class Timebase:
+    '''     @brief                  Extends utime.ticks_us() values to a count that never wraps.
+    '''
+
+    def __init__(self):
+        '''     @brief              Starts counting wraps from the present time.
+        '''
+        ## The number of times utime.ticks_us() has wrapped since construction
+        self.wraps = 0
+        ## The ticks value passed to the most recent update()
+        self.last = utime.ticks_us()
+        ## The extended time at construction, the zero of uptime()
+        self.origin = self.last
+
+    def update(self, ticks = None):
+        '''     @brief              Counts a wrap if the counter has passed zero since the last update.
+            @details            Must be called at least once every TICKS_PERIOD / 2 microseconds.
+            @param ticks        A utime.ticks_us() value, or None to read one.
+        '''
+        if (ticks is None):
+            ticks = utime.ticks_us()
+        # a value older than the last one, e.g. a queued timestamp, is ignored
+        if (utime.ticks_diff(ticks, self.last) > 0):
+            if (ticks < self.last):
+                self.wraps += 1
+            self.last = ticks
+
+    def wraps_at(self, ticks):
+        '''     @brief              The wrap count a ticks value belongs to.
+            @details            ticks may have been read shortly before or after the last update().
+            @param ticks        A utime.ticks_us() value within TICKS_PERIOD / 2 of the last update.
+            @return             The number of wraps before ticks was read.
+        '''
+        if (ticks < self.last):
+            if (self.last - ticks > _TICKS_HALF):
+                # read after a wrap that update() has not seen yet
+                return self.wraps + 1
+        elif (ticks - self.last > _TICKS_HALF):
+            # read before the wrap that the last update() counted
+            return self.wraps - 1
+        return self.wraps
+
+    def extend(self, ticks = None):
+        '''     @brief              Extends a ticks value to microseconds since the counter started.
+            @param ticks        A utime.ticks_us() value within TICKS_PERIOD / 2 of the last
+                                update(), or None for the present time.
+            @return             The wrap-free time in microseconds.
+        '''
+        if (ticks is None):
+            ticks = utime.ticks_us()
+        return self.wraps_at(ticks) * TICKS_PERIOD + ticks
+
+    def uptime(self):
+        '''     @brief              Microseconds since the Timebase was constructed.
+        '''
+        return self.extend() - self.origin
+
+    def mark(self, ticks):
+        '''     @brief              Records a start time for elapsed().
+            @param ticks        A utime.ticks_us() value.
+            @return             A (wraps, ticks) pair.
+        '''
+        return (self.wraps_at(ticks), ticks)
+
+    def elapsed(self, ticks, mark):
+        '''     @brief              Microseconds from a mark to a ticks value, however long ago the mark was.
+            @details            Unlike utime.ticks_diff(), the result keeps counting past TICKS_PERIOD / 2.
+                                Nothing is allocated until it reaches TICKS_PERIOD.
+            @param ticks        A utime.ticks_us() value within TICKS_PERIOD / 2 of the last update().
+            @param mark         A pair returned by mark().
+            @return             The elapsed time in microseconds.
+        '''
+        wraps, start = mark
+        wraps = self.wraps_at(ticks) - wraps
+        delta = ticks - start
+        if (wraps == 0):
+            return delta
+        if (wraps == 1 and delta < 0):
+            return delta + TICKS_MAX + 1
+        return wraps * TICKS_PERIOD + delta
@@ -0,0 +1,140 @@
+''' @file                       trajectory.py
+    @brief                      Trapezoidal and S-curve motion profiles precomputed into setpoint tables.
+    @details                    A move of a given distance is planned once, with floats, from limits on
+                                velocity, acceleration and (for an S-curve) jerk, and sampled at the
+                                controller period into an array of integer position offsets. The
+                                controller then reads one entry per run, so following the profile costs an
+                                array index and an add with no float math or allocation per tick. The
+                                profile is symmetric: the deceleration mirrors the acceleration, and if the
+                                distance is too short to reach the velocity or acceleration limit the peak
+                                is lowered so the move still ends at rest exactly on the target.
+                                Distances are in encoder counts, velocities in counts/s, accelerations
+                                in counts/s^2 and jerks in counts/s^3.
+    @author                     Jason Davis
+    @author                     Conor Fraser
+    @author                     Adam Westfall
+
+    @date                       January 24, 2023
+'''
+import math
+from array import array
+from micropython import const
+
+## The most samples a profile may hold; at 4 bytes each this bounds its RAM use
+MAX_SAMPLES = const(4096)
+
+class Profile:
+    '''     @brief                  A precomputed move, one position offset per controller period.
+    '''
+
+    def __init__(self, distance, period, vmax, amax, jerk = None, maxSamples = MAX_SAMPLES):
+        '''     @brief              Plans a move and fills its setpoint table.
+            @param distance     The signed length of the move in counts.
+            @param period       The time between samples in microseconds, normally the
+                                controller period.
+            @param vmax         The velocity limit in counts/s.
+            @param amax         The acceleration limit in counts/s^2.
+            @param jerk         The jerk limit in counts/s^3 for an S-curve, or None for a
+                                trapezoidal profile.
+            @param maxSamples   The most samples the table may hold.
+        '''
+        if (vmax <= 0 or amax <= 0 or (jerk is not None and jerk <= 0)):
+            raise ValueError('Profile limits must be positive')
+        if (period <= 0):
+            raise ValueError('Profile period must be positive')
+
+        ## The signed length of the move in counts
+        self.distance = int(distance)
+        ## The time between samples in microseconds
+        self.period = period
+
+        D = abs(self.distance)
+        v, a, tj, tc = self._plan(D, vmax, amax, jerk)
+        ta = 2 * tj + tc
+        da = v * ta / 2
+        tv = (D - 2 * da) / v if v > 0 else 0.0
+        if (tv < 0):
+            tv = 0.0
+        T = 2 * ta + tv
+
+        ## The peak velocity reached, in counts/s
+        self.peakVelocity = v
+        ## The duration of the move in seconds
+        self.duration = T
+
+        dt = period / 1000000
+        n = int(math.ceil(T / dt)) + 1 if D > 0 else 1
+        if (n > maxSamples):
+            raise ValueError('A {:.2f} s move needs {:} samples, more than {:}'.format(T, n, maxSamples))
+
+        sign = -1 if self.distance < 0 else 1
+        ## Position offsets from the start of the move, in counts; the last entry is distance
+        self.positions = array('l', [0] * n)
+        for k in range(n):
+            t = k * dt
+            if (t >= T):
+                p = D
+            elif (t <= ta):
+                p = self._accel(t, v, a, tj, tc, da)
+            elif (t <= ta + tv):
+                p = da + v * (t - ta)
+            else:
+                p = D - self._accel(T - t, v, a, tj, tc, da)
+            self.positions[k] = sign * int(round(p))
+        self.positions[n - 1] = self.distance
+
+    def __len__(self):
+        return len(self.positions)
+
+    def _plan(self, D, vmax, amax, jerk):
+        # returns the peak velocity and acceleration, the time spent at full jerk
+        # and the time spent at constant acceleration in each acceleration phase
+        if (D == 0):
+            return 0.0, 0.0, 0.0, 0.0
+        if (jerk is None):
+            # trapezoid: lower the peak velocity if the move is too short to reach it
+            v = min(vmax, math.sqrt(D * amax))
+            return v, amax, 0.0, v / amax
+
+        v = vmax
+        a = amax
+        if (v * jerk < a * a):
+            # the velocity limit is reached before the acceleration limit
+            a = math.sqrt(v * jerk)
+        if (v * (v / a + a / jerk) > D):
+            # too short to reach the velocity limit; solve v * ta(v) = D for v
+            a = amax
+            v = a * (-a / jerk + math.sqrt(a * a / (jerk * jerk) + 4 * D / a)) / 2
+            if (v * jerk < a * a):
+                v = (D * math.sqrt(jerk) / 2) ** (2 / 3)
+                a = math.sqrt(v * jerk)
+        tj = a / jerk
+        tc = v / a - tj
+        if (tc < 0):
+            tc = 0.0
+        return v, a, tj, tc
+
+    def _accel(self, t, v, a, tj, tc, da):
+        # position t seconds into the acceleration phase
+        if (t < tj):
+            return a / tj * t * t * t / 6
+        if (t <= tj + tc):
+            v1 = a * tj / 2
+            p1 = a * tj * tj / 6
+            s = t - tj
+            return p1 + v1 * s + a * s * s / 2
+        # the final jerk phase, measured back from the end of the phase
+        s = 2 * tj + tc - t
+        return da - v * s + a / tj * s * s * s / 6
+
+def trapezoid(distance, period, vmax, amax):
+    '''     @brief                  Plans a trapezoidal (acceleration-limited) move.
+        @return                 A Profile.
+    '''
+    return Profile(distance, period, vmax, amax)
+
+def scurve(distance, period, vmax, amax, jerk):
+    '''     @brief                  Plans an S-curve (jerk-limited) move.
+        @return                 A Profile.
+    '''
+    return Profile(distance, period, vmax, amax, jerk)